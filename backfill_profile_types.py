@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Миграция: заполняет структурированные поля типа личности в сохраненных профилях.
+
+Для профилей без personality_type/type_counts поля вычисляются по ответам опроса
+(derive_personality_fields). Если ответов A/B/C/D нет, тип один раз определяется
+по тексту профиля. Все профили обрабатываются одним проходом и сохраняются одной
+записью файла. Профили в Supabase обновляет SQL-миграция
+supabase/migrations/20261019000000_backfill_profile_type.sql.
+
+Запуск:
+    python backfill_profile_types.py [--dry-run]
+"""
+
+import sys
+import asyncio
+import logging
+from typing import Dict, Any
+
+import profile_storage
+from questions import derive_personality_fields
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - [BACKFILL] - %(levelname)s - %(message)s")
+logger = logging.getLogger("backfill_profile_types")
+
+def needs_backfill(profile: Dict[str, Any]) -> bool:
+    """
+    Проверяет, не хватает ли в профиле структурированных полей типа личности.
+    """
+    return not profile.get("personality_type") or not profile.get("type_counts")
+
+async def backfill_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Вычисляет недостающие поля типа личности для одного профиля.
+
+    Args:
+        profile: Данные профиля
+
+    Returns:
+        Dict[str, Any]: Поля для обновления профиля
+    """
+    fields = derive_personality_fields(profile.get("answers", {}))
+    if sum(fields["type_counts"].values()) == 0 and profile.get("profile_text"):
+        # Ответов опроса нет - единственный источник типа это текст профиля
+        from communication_handler import get_personality_type_from_profile
+        fields["personality_type"] = await get_personality_type_from_profile(profile["profile_text"])
+        fields["secondary_type"] = None
+    # Явно сохраненный тип не перезаписываем
+    if profile.get("personality_type"):
+        fields["personality_type"] = profile["personality_type"]
+        fields["secondary_type"] = profile.get("secondary_type")
+    return fields
+
+async def main(dry_run: bool = False) -> int:
+    """
+    Обновляет все профили локального хранилища.
+
+    Args:
+        dry_run: Только показать, какие профили будут обновлены
+
+    Returns:
+        int: Количество обновленных профилей
+    """
+    await profile_storage.load_profiles_from_file()
+    profiles = profile_storage.user_profiles
+
+    updated = 0
+    for user_id, profile in profiles.items():
+        if not isinstance(profile, dict) or not needs_backfill(profile):
+            continue
+        fields = await backfill_profile(profile)
+        logger.info(f"Профиль {user_id}: {fields['personality_type']} {fields['type_counts']}")
+        if not dry_run:
+            profile.update(fields)
+        updated += 1
+
+    if updated and not dry_run:
+        if not await profile_storage.save_profiles_to_file():
+            logger.error("Не удалось сохранить обновленные профили")
+            return 0
+    logger.info(f"Обработано профилей: {len(profiles)}, требуют обновления: {updated}" + (" (dry run)" if dry_run else ""))
+    return updated
+
+if __name__ == "__main__":
+    asyncio.run(main(dry_run="--dry-run" in sys.argv))
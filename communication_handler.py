@@ -1,11 +1,15 @@
 import logging
 import os
 from typing import Dict, Any, Optional, Tuple
+from types import MappingProxyType
 import json
-from openai import AsyncOpenAI
-import httpx
-from aiogram import Router, F
-from aiogram.types import Message
+from aiogram import Router
+
+from services.openai_client import get_openai_client
+from services.openai_limiter import call_openai
+from services.context_builder import build_messages
+from services.response_cache import response_cache
+from services.keyword_matcher import KeywordAutomaton
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -18,19 +22,6 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY не найден в переменных окружения. Функция адаптивного общения будет недоступна.")
 
-# Инициализация клиента OpenAI с API-ключом из переменных окружения (если доступен)
-http_client = httpx.AsyncClient()
-client = None
-if OPENAI_API_KEY:
-    try:
-        client = AsyncOpenAI(
-            api_key=OPENAI_API_KEY,
-            http_client=http_client
-        )
-        logger.info("OpenAI API клиент успешно инициализирован")
-    except Exception as e:
-        logger.error(f"Ошибка при инициализации OpenAI API: {e}")
-
 # Чтение правил общения из файла rules2.0
 try:
     with open('rules2.0', 'r', encoding='utf-8') as f:
@@ -90,11 +81,124 @@ DEFAULT_RESPONSES = {
     ]
 }
 
+# Инструкции для режимов общения (добавляются к базовому промпту типа личности)
+PROMPT_MODES = {
+    # Базовый режим без дополнительных инструкций
+    "default": "",
+    # Текстовый диалог: правила из rules2.0
+    "chat": """Я психолог-консультант, следующий принципам поэтично-лирического стиля общения.
+
+Правила общения:
+1. Поэтично-лирический стиль с лёгким футуристическим юмором и яркими метафорами.
+2. Полная честность без лести и преувеличений.
+3. В темах науки, бизнеса или нейро-биохакинга – чёткая, лаконичная, научно-обоснованная проза.
+4. Разговорный и интерактивный тон (ментор и со-творец, не лектор).
+
+Структура ответа:
+- Начинай с короткого, тёплого обращения.
+- Используй неформальное обращение на "ты".
+- Разделяй блоки символом ⸻ для создания визуальной паузы.
+- Задавай личные вопросы, углубляющие мотивы и смыслы.
+- После раскрытия темы предлагай три варианта "куда дальше".
+- Используй короткие абзацы (1-3 предложения).
+- Подчеркивай творческую автономию и свободу выбора собеседника.
+
+Баланс в ответе:
+- 60% конкретные идеи и рекомендации
+- 30% поэтичные метафоры и образы
+- 10% глубокие вопросы для размышления
+
+ВАЖНО: На каждый запрос генерируй УНИКАЛЬНЫЙ ответ, а не используй шаблоны.
+ВАЖНО: Всегда отвечай на конкретный вопрос пользователя.""",
+    # Голосовые сообщения: Interactive Personalisation Loop
+    "voice": """Я психолог-консультант, следующий принципам Interactive Personalisation Loop:
+
+1. Детектирую и определяю суть запроса пользователя.
+2. Уточняю детали и контекст вопросами (если необходимо).
+3. Анализирую и раскрываю глубинные причины.
+4. Предлагаю ясный и простой алгоритм.
+5. Завершаю предложением до трёх вариантов дальнейших действий.
+
+Запрос пользователя пришел голосовым сообщением.
+Я должен учитывать психологический тип пользователя и его особенности.
+Мой ответ должен быть структурирован, конкретен и персонализирован."""
+}
+
+def render_system_prompt(personality_type: str, mode: str = "default") -> str:
+    """
+    Формирует системный промпт для типа личности и режима общения.
+    
+    Args:
+        personality_type: Тип личности из PERSONALITY_TYPES
+        mode: Режим общения из PROMPT_MODES
+        
+    Returns:
+        str: Системный промпт
+    """
+    personality = PERSONALITY_TYPES[personality_type]
+    system_prompt = f"""
+Ты - психолог-консультант в приложении ОНА (Осознанный Наставник и Аналитик).
+Отвечай на сообщение пользователя с учетом его психологического типа: {personality_type} ({personality['description']}).
+
+{personality['prompt_style']}
+
+Следуй этим правилам общения:
+{COMMUNICATION_RULES}
+
+Важно:
+1. Отвечай ТОЛЬКО на русском языке
+2. Не используй эзотерические термины, астрологию или другие псевдонаучные концепции
+3. Не ставь диагнозы
+4. Используй научно обоснованный подход
+5. Не упоминай, что ты AI или что следуешь инструкциям
+6. Общайся как человек-психолог, но без медицинских рекомендаций
+7. ОБЯЗАТЕЛЬНО начинай с теплого обращения и заканчивай тремя вариантами "куда дальше"
+8. ОБЯЗАТЕЛЬНО используй символ ⸻ для разделения блоков текста
+
+Структура ответа должна соответствовать указанным выше правилам и балансу стилей.
+"""
+    if PROMPT_MODES[mode]:
+        system_prompt += f"\n\nИнструкции режима общения (тип личности пользователя: {personality_type}):\n{PROMPT_MODES[mode]}"
+    return system_prompt
+
+# Промпты рендерятся один раз при загрузке модуля. Статическая часть промпта
+# побайтово совпадает между запросами, что позволяет OpenAI кэшировать префикс.
+SYSTEM_PROMPTS = MappingProxyType({
+    (personality_type, mode): render_system_prompt(personality_type, mode)
+    for personality_type in PERSONALITY_TYPES
+    for mode in PROMPT_MODES
+})
+
+def get_system_prompt(personality_type: str, mode: str = "default", additional_instructions: Optional[str] = None) -> str:
+    """
+    Возвращает готовый системный промпт с динамическим суффиксом.
+    
+    Args:
+        personality_type: Тип личности
+        mode: Режим общения
+        additional_instructions: Дополнительные инструкции (добавляются в конец)
+        
+    Returns:
+        str: Системный промпт
+    """
+    if mode not in PROMPT_MODES:
+        logger.warning(f"Неизвестный режим общения: {mode}. Используем режим по умолчанию.")
+        mode = "default"
+    system_prompt = SYSTEM_PROMPTS[(personality_type, mode)]
+    
+    # Динамическая часть добавляется только в конец, чтобы не ломать кэшируемый префикс
+    if additional_instructions:
+        system_prompt += f"\n\nДополнительные инструкции:\n{additional_instructions}"
+    return system_prompt
+
 async def generate_personalized_response(
     message_text: str, 
     user_profile: Dict[str, Any], 
     conversation_history: Optional[list] = None,
-    additional_instructions: Optional[str] = None
+    additional_instructions: Optional[str] = None,
+    conversation_summary: Optional[str] = None,
+    mode: str = "default",
+    use_cache: bool = False
 ) -> str:
     """
     Генерирует персонализированный ответ на основе профиля пользователя.
@@ -104,6 +208,9 @@ async def generate_personalized_response(
         user_profile: Профиль пользователя (содержит тип личности)
         conversation_history: История переписки (опционально)
         additional_instructions: Дополнительные инструкции для генерации ответа (опционально)
+        conversation_summary: Резюме ранней части диалога (опционально)
+        mode: Режим общения из PROMPT_MODES (default, chat, voice)
+        use_cache: Использовать семантический кэш ответов (только для сообщений без контекста)
         
     Returns:
         str: Персонализированный ответ
@@ -111,6 +218,7 @@ async def generate_personalized_response(
     # Определяем тип личности пользователя
     personality_type = user_profile.get("personality_type", "Интеллектуальный")
     
+    client = get_openai_client("communication")
     # ВРЕМЕННО: всегда использовать API и не полагаться на DEFAULT_RESPONSES
     # Это поможет выявить проблемы с API
     if not client:
@@ -123,55 +231,36 @@ async def generate_personalized_response(
         logger.warning(f"Неизвестный тип личности: {personality_type}. Используем Интеллектуальный тип по умолчанию.")
         personality_type = "Интеллектуальный"
     
+    # Кэшировать можно только ответы, не зависящие от истории диалога и доп. инструкций
+    cacheable = use_cache and not conversation_history and not conversation_summary and not additional_instructions
+    if cacheable:
+        cached_response = response_cache.lookup(personality_type, mode, message_text)
+        if cached_response:
+            return cached_response
+    
     try:
-        # Готовим промт для генерации ответа с использованием правил из rules2.0
-        system_prompt = f"""
-Ты - психолог-консультант в приложении ОНА (Осознанный Наставник и Аналитик).
-Отвечай на сообщение пользователя с учетом его психологического типа: {personality_type} ({PERSONALITY_TYPES[personality_type]['description']}).
-
-{PERSONALITY_TYPES[personality_type]['prompt_style']}
-
-Следуй этим правилам общения:
-{COMMUNICATION_RULES}
-
-Важно:
-1. Отвечай ТОЛЬКО на русском языке
-2. Не используй эзотерические термины, астрологию или другие псевдонаучные концепции
-3. Не ставь диагнозы
-4. Используй научно обоснованный подход
-5. Не упоминай, что ты AI или что следуешь инструкциям
-6. Общайся как человек-психолог, но без медицинских рекомендаций
-7. ОБЯЗАТЕЛЬНО начинай с теплого обращения и заканчивай тремя вариантами "куда дальше"
-8. ОБЯЗАТЕЛЬНО используй символ ⸻ для разделения блоков текста
-
-Структура ответа должна соответствовать указанным выше правилам и балансу стилей.
-"""
+        # Берем заранее подготовленный промт (правила из rules2.0 + режим общения)
+        system_prompt = get_system_prompt(personality_type, mode, additional_instructions)
 
-        # Добавляем дополнительные инструкции, если они есть
-        if additional_instructions:
-            system_prompt += f"\n\nДополнительные инструкции:\n{additional_instructions}"
-
-        # Формируем историю переписки
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-        
-        # Добавляем историю переписки, если она есть
-        if conversation_history:
-            for entry in conversation_history[-5:]:  # берем последние 5 сообщений
-                messages.append(entry)
-        
-        # Добавляем текущее сообщение пользователя
-        messages.append({"role": "user", "content": message_text})
-        
         # Определяем модель для использования (предпочтительно GPT-3.5-turbo как наиболее доступную)
         models = ["gpt-3.5-turbo", "gpt-3.5-turbo-0125"]
         model = models[0]  # По умолчанию используем базовую модель gpt-3.5-turbo
         
+        # Формируем сообщения: история упаковывается в бюджет токенов, старые реплики - через резюме
+        messages = build_messages(
+            system_prompt,
+            message_text,
+            history=conversation_history,
+            summary=conversation_summary,
+            model=model
+        )
+        
         logger.info(f"Отправка запроса к OpenAI API с моделью {model}")
         
         # Генерируем ответ
-        response = await client.chat.completions.create(
+        response = await call_openai(
+            client.chat.completions.create,
+            caller="communication",
             model=model,
             temperature=0.7,
             messages=messages
@@ -180,6 +269,16 @@ async def generate_personalized_response(
         # Получаем сгенерированный ответ
         generated_response = response.choices[0].message.content
         
+        if cacheable and generated_response:
+            usage = getattr(response, "usage", None)
+            response_cache.store(
+                personality_type,
+                mode,
+                message_text,
+                generated_response,
+                tokens=getattr(usage, "total_tokens", 0) or 0
+            )
+        
         # Логируем успешную генерацию ответа
         logger.info(f"Успешно сгенерирован персонализированный ответ с моделью {model}")
         
@@ -205,75 +304,35 @@ async def generate_personalized_response(
 - Перезапустить бота командой /restart?
 - Задать другой вопрос?"""
 
+# Ключевые слова типов личности в тексте профиля
+PROFILE_TYPE_KEYWORDS = {
+    "Интеллектуальный": ["аналитическ", "логич", "систематиз", "структур", "анализ"],
+    "Эмоциональный": ["эмпати", "чувств", "гармони", "отношен", "эмоц"],
+    "Практический": ["результат", "эффектив", "организ", "конкрет", "практич"],
+    "Творческий": ["креатив", "творчес", "инновац", "нестандарт", "воображ"]
+}
+
+# Явное название типа в профиле весит больше любого количества ключевых слов
+PROFILE_TYPE_NAME_WEIGHT = 1000.0
+
+# Автомат для определения типа личности строится один раз при импорте
+_profile_type_matcher = KeywordAutomaton()
+for _p_type in PROFILE_TYPE_KEYWORDS:
+    _profile_type_matcher.add(_p_type, _p_type, PROFILE_TYPE_NAME_WEIGHT)
+_profile_type_matcher.add_many(PROFILE_TYPE_KEYWORDS)
+_profile_type_matcher.build()
+
 async def get_personality_type_from_profile(profile_text: str) -> str:
     """
     Извлекает тип личности из текста профиля.
     
+    Явное название типа имеет приоритет, иначе побеждает тип с наибольшим
+    количеством ключевых слов. Поиск выполняется за один проход по тексту.
+    
     Args:
         profile_text: Текст профиля пользователя
         
     Returns:
         str: Тип личности или "Интеллектуальный" по умолчанию
     """
-    personality_types = ["Интеллектуальный", "Эмоциональный", "Практический", "Творческий"]
-    
-    # Проверяем, содержит ли профиль явное указание на тип личности
-    for p_type in personality_types:
-        if p_type in profile_text:
-            return p_type
-    
-    # Если явного указания нет, проверяем по ключевым словам
-    keywords = {
-        "Интеллектуальный": ["аналитическ", "логич", "систематиз", "структур", "анализ"],
-        "Эмоциональный": ["эмпати", "чувств", "гармони", "отношен", "эмоц"],
-        "Практический": ["результат", "эффектив", "организ", "конкрет", "практич"],
-        "Творческий": ["креатив", "творчес", "инновац", "нестандарт", "воображ"]
-    }
-    
-    scores = {p_type: 0 for p_type in personality_types}
-    
-    for p_type, words in keywords.items():
-        for word in words:
-            if word.lower() in profile_text.lower():
-                scores[p_type] += 1
-    
-    # Определяем тип с наибольшим количеством совпадений
-    max_score = 0
-    max_type = "Интеллектуальный"  # По умолчанию
-    
-    for p_type, score in scores.items():
-        if score > max_score:
-            max_score = score
-            max_type = p_type
-    
-    return max_type
-
-# Базовый обработчик текстовых сообщений
-@communication_router.message(F.text)
-async def handle_text_message(message: Message):
-    """
-    Обрабатывает текстовые сообщения, которые не были обработаны другими роутерами.
-    """
-    logger.info(f"Получено сообщение от пользователя {message.from_user.id}: {message.text}")
-    
-    try:
-        # Получаем или создаем базовый профиль пользователя
-        from profile_storage import load_user_profile
-        user_id = message.from_user.id
-        user_profile = await load_user_profile(user_id) or {"personality_type": "Интеллектуальный"}
-        
-        # Генерируем ответ
-        response = await generate_personalized_response(
-            message_text=message.text,
-            user_profile=user_profile
-        )
-        
-        # Отправляем ответ пользователю
-        await message.answer(response)
-        logger.info(f"Отправлен персонализированный ответ пользователю {user_id}")
-    except Exception as e:
-        logger.error(f"Ошибка при обработке текстового сообщения: {e}")
-        # Отправляем сообщение об ошибке
-        await message.answer(
-            "Извините, произошла ошибка при обработке вашего сообщения. Пожалуйста, попробуйте еще раз или используйте команду /restart."
-        ) 
\ No newline at end of file
+    return _profile_type_matcher.best(profile_text or "", default="Интеллектуальный")
@@ -6,19 +6,12 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-# Импортируем состояния для опроса
-from button_states import SurveyStates
-
-# Пытаемся импортировать модуль communication_handler
-try:
-    from communication_handler import generate_personalized_response, get_personality_type_from_profile, communication_handler_router
-except ImportError:
-    # Если не удалось импортировать, создаем заглушку
-    logging.warning("Не удалось импортировать communication_handler_router, используется заглушка")
-    from aiogram import Router
-    communication_handler_router = Router(name="communication_handler")
-
+from communication_handler import generate_personalized_response, get_personality_type_from_profile
+from questions import derive_personality_fields
 from services.profile_analysis import analyze_profile
+from services.context_builder import compact_history
+from services.keyword_matcher import KeywordAutomaton
+from services.response_cache import SEMANTIC_CACHE_ENABLED
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -35,6 +28,11 @@ PROFILE_QUERY_KEYWORDS = [
     "исходя из опроса", "исходя из профиля", "что я за человек"
 ]
 
+# Автомат для поиска ключевых фраз строится один раз при импорте
+_profile_query_matcher = KeywordAutomaton()
+_profile_query_matcher.add_many({"profile": PROFILE_QUERY_KEYWORDS})
+_profile_query_matcher.build()
+
 def is_profile_query(text: str) -> bool:
     """
     Проверяет, является ли сообщение запросом о профиле.
@@ -45,164 +43,129 @@ def is_profile_query(text: str) -> bool:
     Returns:
         bool: True, если это запрос о профиле, иначе False
     """
-    text_lower = text.lower()
-    for keyword in PROFILE_QUERY_KEYWORDS:
-        if keyword in text_lower:
-            return True
-    return False
+    return bool(_profile_query_matcher.find_all(text))
 
-@conversation_router.message(F.text)
-async def handle_text_message(message: Message, state: FSMContext):
+async def handle_chat_message(message: Message, state: FSMContext, user_data: Dict[str, Any]):
     """
-    Обрабатывает обычные текстовые сообщения от пользователя.
+    Отвечает на обычное текстовое сообщение пользователя с профилем.
+    Вызывается из message_router, который уже прочитал данные состояния.
     
     Args:
         message: Сообщение от пользователя
         state: Состояние FSM
+        user_data: Данные состояния пользователя
     """
-    # Получаем текущее состояние пользователя
-    current_state = await state.get_state()
+    # Показываем индикатор "печатает..."
+    await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
     
-    # Если пользователь находится в процессе прохождения опроса, 
-    # не обрабатываем сообщение здесь, это будет сделано в survey_handler
-    if current_state == SurveyStates.answering_questions:
-        return
+    # Тип личности хранится в профиле с момента его создания (см. complete_survey
+    # и backfill_profile_types.py)
+    personality_type = user_data.get("personality_type", None)
+    profile_text = user_data.get("profile_text", "")
     
-    # Игнорируем команды и специальные кнопки
-    if message.text.startswith("/") or message.text in [
-        "📝 Опрос", "👤 Профиль", "🧘 Медитации", 
-        "⏰ Напоминания", "💬 Помощь", "🔄 Рестарт", 
-        "❌ Отменить", "❌ Отменить опрос"
-    ]:
-        return
+    # Для профиля без сохраненного типа вычисляем его по ответам опроса один раз.
+    # Тип по умолчанию (ответов A/B/C/D нет) не сохраняется как вычисленный
+    if not personality_type and user_data.get("answers"):
+        personality_fields = derive_personality_fields(user_data["answers"])
+        if sum(personality_fields["type_counts"].values()):
+            personality_type = personality_fields["personality_type"]
+            await state.update_data(**personality_fields)
     
-    # Показываем индикатор "печатает..."
-    await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
+    # Профиль без ответов опроса (например, только в состоянии FSM): тип по тексту профиля
+    if not personality_type and profile_text:
+        personality_type = await get_personality_type_from_profile(profile_text)
     
-    # Получаем данные пользователя из состояния
-    user_data = await state.get_data()
+    # Создаем словарь с профилем пользователя
+    user_profile = {
+        "personality_type": personality_type or "Интеллектуальный",
+        "profile_text": profile_text
+    }
     
-    # Проверяем, есть ли у пользователя профиль
-    if user_data.get("profile_completed", False):
-        # Получаем тип личности
-        personality_type = user_data.get("personality_type", None)
-        profile_text = user_data.get("profile_text", "")
+    # Получаем историю переписки (если есть)
+    conversation_history = user_data.get("conversation_history", [])
+    conversation_summary = user_data.get("conversation_summary", "")
+    
+    try:
+        # Проверяем, является ли сообщение запросом о профиле
+        if is_profile_query(message.text):
+            # Если это запрос о профиле, используем специализированный анализ
+            response = await analyze_profile(user_profile, message.text)
+            logger.info(f"Выполнен анализ профиля для пользователя {message.from_user.id}")
+        else:
+            # Иначе генерируем персонализированный ответ с учетом новых правил
+            response = await generate_personalized_response(
+                message.text, 
+                user_profile, 
+                conversation_history,
+                conversation_summary=conversation_summary,
+                mode="chat",
+                use_cache=SEMANTIC_CACHE_ENABLED
+            )
         
-        # Если тип личности не указан явно, определяем его из текста профиля
-        if not personality_type and profile_text:
-            personality_type = await get_personality_type_from_profile(profile_text)
-            # Сохраняем тип личности в состоянии
-            await state.update_data(personality_type=personality_type)
+        # Резюмируем сообщение пользователя (<30 слов) для сохранения контекста
+        user_message_summary = message.text[:150] + "..." if len(message.text) > 150 else message.text
         
-        # Создаем словарь с профилем пользователя
-        user_profile = {
-            "personality_type": personality_type or "Интеллектуальный",
-            "profile_text": profile_text
-        }
+        # Обновляем историю переписки
+        conversation_history.append({"role": "user", "content": user_message_summary})
+        conversation_history.append({"role": "assistant", "content": response})
         
-        # Получаем историю переписки (если есть)
-        conversation_history = user_data.get("conversation_history", [])
+        # Отправляем ответ
+        await message.answer(response)
         
-        try:
-            # Формируем инструкцию для генерации ответа на основе правил из rules2.0
-            interactive_prompt = f"""
-            Я психолог-консультант, следующий принципам поэтично-лирического стиля общения.
-            
-            Правила общения:
-            1. Поэтично-лирический стиль с лёгким футуристическим юмором и яркими метафорами.
-            2. Полная честность без лести и преувеличений.
-            3. В темах науки, бизнеса или нейро-биохакинга – чёткая, лаконичная, научно-обоснованная проза.
-            4. Разговорный и интерактивный тон (ментор и со-творец, не лектор).
-            
-            Структура ответа:
-            - Начинай с короткого, тёплого обращения.
-            - Используй неформальное обращение на "ты".
-            - Разделяй блоки символом ⸻ для создания визуальной паузы.
-            - Задавай личные вопросы, углубляющие мотивы и смыслы.
-            - После раскрытия темы предлагай три варианта "куда дальше".
-            - Используй короткие абзацы (1-3 предложения).
-            - Подчеркивай творческую автономию и свободу выбора собеседника.
-            
-            Баланс в ответе:
-            - 60% конкретные идеи и рекомендации
-            - 30% поэтичные метафоры и образы
-            - 10% глубокие вопросы для размышления
-            
-            ВАЖНО: На каждый запрос генерируй УНИКАЛЬНЫЙ ответ, а не используй шаблоны.
-            ВАЖНО: Всегда отвечай на конкретный вопрос пользователя.
-            
-            Запрос пользователя: {message.text}
-            Тип личности пользователя: {personality_type}
-            """
-            
-            # Проверяем, является ли сообщение запросом о профиле
-            if is_profile_query(message.text):
-                # Если это запрос о профиле, используем специализированный анализ
-                response = await analyze_profile(user_profile, message.text)
-                logger.info(f"Выполнен анализ профиля для пользователя {message.from_user.id}")
-            else:
-                # Иначе генерируем персонализированный ответ с учетом новых правил
-                response = await generate_personalized_response(
-                    message.text, 
-                    user_profile, 
-                    conversation_history,
-                    additional_instructions=interactive_prompt
-                )
-            
-            # Резюмируем сообщение пользователя (<30 слов) для сохранения контекста
-            user_message_summary = message.text[:150] + "..." if len(message.text) > 150 else message.text
-            
-            # Обновляем историю переписки
-            conversation_history.append({"role": "user", "content": user_message_summary})
-            conversation_history.append({"role": "assistant", "content": response})
-            
-            # Обрезаем историю переписки, чтобы она не была слишком длинной
-            if len(conversation_history) > 20:
-                conversation_history = conversation_history[-20:]
-            
-            # Обновляем состояние
-            await state.update_data(conversation_history=conversation_history)
-            
-            # Отправляем ответ
-            await message.answer(response)
-            
-            logger.info(f"Отправлен персонализированный ответ пользователю {message.from_user.id} (тип: {personality_type})")
-            
-        except Exception as e:
-            logger.error(f"Ошибка при генерации персонализированного ответа: {e}")
-            # Проверяем, связана ли ошибка с отсутствием API ключа
-            if "OPENAI_API_KEY" in str(e) or "authentication" in str(e).lower() or "api key" in str(e).lower():
-                await message.answer(
-                    "Здравствуй, искатель знаний!\n\n"
-                    "К сожалению, сейчас я не могу сгенерировать персонализированный ответ из-за проблем с API ключом.\n\n"
-                    "⸻\n\n"
-                    "Для администратора: Пожалуйста, проверьте настройки OPENAI_API_KEY в файле .env\n\n"
-                    "Что ты хочешь сделать дальше?\n"
-                    "- Задать другой вопрос?\n"
-                    "- Перезапустить бота командой /restart?\n"
-                    "- Обратиться к администратору?"
-                )
-            else:
-                # Отправляем общий ответ в случае ошибки
-                await message.answer(
-                    "Здравствуй, исследователь глубин!\n\n"
-                    "Произошла ошибка при обработке твоего сообщения. Пожалуйста, повтори попытку позже или попробуй перезапустить бота.\n\n"
-                    "⸻\n\n"
-                    "Что ты хочешь сделать дальше?\n"
-                    "- Повторить вопрос?\n"
-                    "- Перезапустить бота командой /restart?\n"
-                    "- Спросить что-то другое?"
-                )
-    else:
-        # Если профиля нет, предлагаем пройти опрос
-        builder = InlineKeyboardBuilder()
-        builder.button(text="✅ Начать опрос", callback_data="start_survey")
+        # Ограничиваем историю переписки, сворачивая старые сообщения в резюме
+        conversation_history, conversation_summary = await compact_history(
+            conversation_history, conversation_summary
+        )
         
-        await message.answer(
-            "Чтобы получить более персонализированные ответы, рекомендую пройти опрос и создать ваш психологический профиль. "
-            "Это позволит мне лучше понять ваши особенности и адаптировать свои ответы под ваш стиль мышления.",
-            reply_markup=builder.as_markup()
+        # Обновляем состояние
+        await state.update_data(
+            conversation_history=conversation_history,
+            conversation_summary=conversation_summary
         )
+        
+        logger.info(f"Отправлен персонализированный ответ пользователю {message.from_user.id} (тип: {personality_type})")
+        
+    except Exception as e:
+        logger.error(f"Ошибка при генерации персонализированного ответа: {e}")
+        # Проверяем, связана ли ошибка с отсутствием API ключа
+        if "OPENAI_API_KEY" in str(e) or "authentication" in str(e).lower() or "api key" in str(e).lower():
+            await message.answer(
+                "Здравствуй, искатель знаний!\n\n"
+                "К сожалению, сейчас я не могу сгенерировать персонализированный ответ из-за проблем с API ключом.\n\n"
+                "⸻\n\n"
+                "Для администратора: Пожалуйста, проверьте настройки OPENAI_API_KEY в файле .env\n\n"
+                "Что ты хочешь сделать дальше?\n"
+                "- Задать другой вопрос?\n"
+                "- Перезапустить бота командой /restart?\n"
+                "- Обратиться к администратору?"
+            )
+        else:
+            # Отправляем общий ответ в случае ошибки
+            await message.answer(
+                "Здравствуй, исследователь глубин!\n\n"
+                "Произошла ошибка при обработке твоего сообщения. Пожалуйста, повтори попытку позже или попробуй перезапустить бота.\n\n"
+                "⸻\n\n"
+                "Что ты хочешь сделать дальше?\n"
+                "- Повторить вопрос?\n"
+                "- Перезапустить бота командой /restart?\n"
+                "- Спросить что-то другое?"
+            )
+
+async def offer_survey(message: Message):
+    """
+    Предлагает пройти опрос пользователю, у которого еще нет профиля.
+    
+    Args:
+        message: Сообщение от пользователя
+    """
+    builder = InlineKeyboardBuilder()
+    builder.button(text="✅ Начать опрос", callback_data="start_survey")
+    
+    await message.answer(
+        "Чтобы получить более персонализированные ответы, рекомендую пройти опрос и создать ваш психологический профиль. "
+        "Это позволит мне лучше понять ваши особенности и адаптировать свои ответы под ваш стиль мышления.",
+        reply_markup=builder.as_markup()
+    )
 
 @conversation_router.callback_query(F.data == "start_survey")
 async def start_survey_from_callback(callback: CallbackQuery, state: FSMContext):
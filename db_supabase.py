@@ -148,6 +148,9 @@ class SupabaseDB:
         """
         Save a reminder to Supabase.
         
+        A user has one reminder per reminder_type, so saving the same type
+        again updates the existing row.
+        
         Args:
             user_id: Telegram user ID
             reminder_data: Reminder data
@@ -159,7 +162,9 @@ class SupabaseDB:
             # Add user_id to the reminder data
             reminder_data["user_id"] = user_id
             
-            response = supabase.table("reminders").insert(reminder_data).execute()
+            response = supabase.table("reminders").upsert(
+                reminder_data, on_conflict="user_id,reminder_type"
+            ).execute()
             logger.info(f"Saved reminder for user {user_id}")
             return True
             
@@ -192,6 +197,65 @@ class SupabaseDB:
             logger.error(f"Error retrieving reminders for user {user_id}: {e}")
             return []
     
+    @staticmethod
+    async def list_reminders_page(reminder_type: str, after_user_id: int = 0, limit: int = 1000) -> list:
+        """
+        Get a page of reminders of one type ordered by user ID (keyset pagination).
+        
+        Args:
+            reminder_type: Reminder type (one row per user)
+            after_user_id: Return reminders of users with a greater ID
+            limit: Page size
+            
+        Returns:
+            list: Reminders of the page (empty when there are no more)
+        """
+        try:
+            response = (
+                supabase.table("reminders")
+                .select("user_id, reminder_type, reminder_time, reminder_days, is_active, timezone")
+                .eq("reminder_type", reminder_type)
+                .gt("user_id", after_user_id)
+                .order("user_id")
+                .limit(limit)
+                .execute()
+            )
+            return response.data or []
+            
+        except Exception as e:
+            logger.error(f"Error listing reminders after user {after_user_id}: {e}")
+            raise
+
+    @staticmethod
+    async def claim_due_reminders(now: str, reminder_type: str, default_timezone: str, limit: int = 500) -> list:
+        """
+        Claim reminders due at the given minute via the due_reminders RPC.
+
+        Claimed rows are marked with last_sent_at inside the database, so
+        concurrent bot replicas never receive the same reminder.
+
+        Args:
+            now: Minute to check (ISO timestamp with time zone)
+            reminder_type: Reminder type
+            default_timezone: Timezone for reminders without one
+            limit: Maximum number of reminders to claim
+
+        Returns:
+            list: Telegram user IDs of the claimed reminders
+        """
+        try:
+            response = supabase.rpc("due_reminders", {
+                "p_now": now,
+                "p_reminder_type": reminder_type,
+                "p_default_timezone": default_timezone,
+                "p_limit": limit
+            }).execute()
+            return [row["user_id"] for row in response.data or []]
+
+        except Exception as e:
+            logger.error(f"Error claiming reminders due at {now}: {e}")
+            raise
+
     @staticmethod
     async def delete_reminder(reminder_id: str) -> bool:
         """
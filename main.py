@@ -127,18 +127,9 @@ load_dotenv()
 # Проверка наличия railway_helper и его инициализация
 try:
     from railway_helper import ensure_modules_available, print_railway_info
-    # Проверяем и обеспечиваем наличие необходимых модулей
     print_railway_info("Инициализация Railway Helper", "INFO")
-    ensure_modules_available([
-        "survey_handler",
-        "meditation_handler",
-        "conversation_handler",
-        "reminder_handler",
-        "voice_handler",
-        "railway_logging",
-        "communication_handler"
-    ])
 except ImportError:
+    ensure_modules_available = None
     print("БОТ: Railway Helper не найден, продолжаем без дополнительных проверок")
 
 # Импортируем настройку логирования для Railway
@@ -176,7 +167,6 @@ except ImportError:
 railway_print("=== ONA TELEGRAM BOT STARTING ===", "INFO")
 railway_print(f"Python version: {sys.version}", "INFO")
 railway_print(f"Current working directory: {os.getcwd()}", "INFO")
-railway_print(f"Files in directory: {[f for f in os.listdir('.') if f.endswith('.py')]}", "INFO")
 
 # Загружаем API токен из .env файла
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -187,56 +177,89 @@ if not BOT_TOKEN:
 else:
     railway_print("BOT_TOKEN найден успешно", "INFO")
 
-# Проверка наличия psutil
-try:
-    import psutil
-    PSUTIL_AVAILABLE = True
-    logger.info("Библиотека psutil успешно импортирована")
-except ImportError:
-    PSUTIL_AVAILABLE = False
-    logger.warning("Библиотека psutil не установлена, некоторые функции будут недоступны")
+# Планировщик заданий (из reminder_handler, задается в load_routers)
+scheduler = None
 
-# Импортируем роутеры
-try:
-    railway_print("Импорт основных модулей бота...", "INFO")
-    from survey_handler import survey_router, get_main_keyboard
-    from voice_handler import voice_router
-    from conversation_handler import conversation_router
-    from meditation_handler import meditation_router
-    from reminder_handler import reminder_router, scheduler
-    from communication_handler import communication_router
-    railway_print("Все модули успешно импортированы", "INFO")
-except ImportError as e:
-    logger.error(f"Ошибка импорта модулей: {e}")
-    railway_print(f"Ошибка импорта модулей: {e}", "ERROR")
-    railway_print("Попытка аварийной загрузки базовых модулей...", "WARNING")
-    
-    # Попытка аварийной загрузки базовых модулей
-    # Создаем пустые роутеры
-    from aiogram import Router
-    from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
-    
-    survey_router = Router(name="survey")
-    voice_router = Router(name="voice")
-    conversation_router = Router(name="conversation")
-    meditation_router = Router(name="meditation")
-    reminder_router = Router(name="reminder")
-    communication_router = Router(name="communication")
-    
-    # Создаем базовую клавиатуру
-    def get_main_keyboard():
-        return ReplyKeyboardMarkup(
-            keyboard=[
-                [KeyboardButton(text="📝 Опрос"), KeyboardButton(text="💬 Помощь")]
-            ],
-            resize_keyboard=True
-        )
-    
-    # Создаем пустой планировщик
-    from apscheduler.schedulers.asyncio import AsyncIOScheduler
-    scheduler = AsyncIOScheduler()
-    
-    railway_print("Аварийная загрузка базовых модулей выполнена", "WARNING")
+def load_routers():
+    """
+    Импортирует роутеры обработчиков вместе с их зависимостями.
+
+    Вызывается при сборке диспетчера, а не при импорте main: супервизор
+    рабочих процессов обработчики не загружает, а каждый процесс бота
+    загружает их один раз.
+
+    Returns:
+        tuple: Роутеры в порядке подключения и функция клавиатуры главного меню
+    """
+    global scheduler
+
+    # Проверяем и обеспечиваем наличие необходимых модулей
+    if ensure_modules_available is not None:
+        ensure_modules_available([
+            "survey_handler",
+            "meditation_handler",
+            "conversation_handler",
+            "reminder_handler",
+            "voice_handler",
+            "railway_logging",
+            "communication_handler"
+        ])
+
+    try:
+        railway_print("Импорт основных модулей бота...", "INFO")
+        from survey_handler import survey_router, get_main_keyboard
+        from voice_handler import voice_router
+        from conversation_handler import conversation_router
+        from meditation_handler import meditation_router
+        from reminder_handler import reminder_router, scheduler as reminder_scheduler
+        from communication_handler import communication_router
+        from message_router import message_router
+        scheduler = reminder_scheduler
+        railway_print("Все модули успешно импортированы", "INFO")
+    except ImportError as e:
+        logger.error(f"Ошибка импорта модулей: {e}")
+        railway_print(f"Ошибка импорта модулей: {e}", "ERROR")
+        railway_print("Попытка аварийной загрузки базовых модулей...", "WARNING")
+        
+        # Попытка аварийной загрузки базовых модулей
+        # Создаем пустые роутеры
+        from aiogram import Router
+        from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+        
+        survey_router = Router(name="survey")
+        voice_router = Router(name="voice")
+        conversation_router = Router(name="conversation")
+        meditation_router = Router(name="meditation")
+        reminder_router = Router(name="reminder")
+        communication_router = Router(name="communication")
+        message_router = Router(name="message_router")
+        
+        # Создаем базовую клавиатуру
+        def get_main_keyboard():
+            return ReplyKeyboardMarkup(
+                keyboard=[
+                    [KeyboardButton(text="📝 Опрос"), KeyboardButton(text="💬 Помощь")]
+                ],
+                resize_keyboard=True
+            )
+        
+        # Создаем пустой планировщик
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        scheduler = AsyncIOScheduler()
+        
+        railway_print("Аварийная загрузка базовых модулей выполнена", "WARNING")
+
+    routers = [
+        survey_router,
+        meditation_router,
+        conversation_router,
+        reminder_router,
+        voice_router,
+        communication_router,
+        # Маршрутизатор свободного текста подключается последним
+        message_router
+    ]
+    return routers, get_main_keyboard
 
 # Создаем экземпляр бота и диспетчер
 bot = Bot(
@@ -275,11 +298,61 @@ async def shutdown(dp, bot):
         logger.error(f"Ошибка при сохранении профилей: {e}")
         railway_print(f"Ошибка при сохранении профилей: {e}", "ERROR")
     
+    # Дожидаемся обработки уже принятых голосовых сообщений
+    try:
+        from services.voice_queue import voice_pool
+        await voice_pool.shutdown()
+    except Exception as e:
+        logger.error(f"Ошибка при остановке пула голосовых сообщений: {e}")
+
+    # Останавливаем процессы локального распознавания речи
+    try:
+        from services.stt_backends import shutdown_stt_backends
+        await shutdown_stt_backends()
+    except Exception as e:
+        logger.error(f"Ошибка при остановке движков распознавания речи: {e}")
+
+    # Закрываем кэш расшифровок голосовых сообщений
+    try:
+        from services.transcript_cache import transcript_cache
+        transcript_cache.close()
+    except Exception as e:
+        logger.error(f"Ошибка при закрытии кэша расшифровок: {e}")
+
+    # Закрываем общий пул соединений OpenAI
+    try:
+        from services.openai_client import shutdown_openai_pool
+        await shutdown_openai_pool()
+    except Exception as e:
+        logger.error(f"Ошибка при закрытии пула соединений OpenAI: {e}")
+    
+    # Освобождаем аренды лидера, чтобы другой экземпляр сразу перенял обязанности
+    try:
+        from services.coordination import stop_coordination
+        await stop_coordination()
+    except Exception as e:
+        logger.error(f"Ошибка при остановке выборов лидера: {e}")
+    
+    # Дожидаемся начатых рассылок напоминаний
+    try:
+        from services.reminder_dispatcher import reminder_dispatcher
+        await reminder_dispatcher.shutdown()
+        from services.reminder_store import close_reminder_store
+        close_reminder_store()
+    except Exception as e:
+        logger.error(f"Ошибка при остановке диспетчера напоминаний: {e}")
+    
     # Останавливаем планировщик заданий
     if scheduler and scheduler.running:
         scheduler.shutdown()
         logger.info("Планировщик заданий остановлен")
     
+    # Закрываем хранилище состояний FSM
+    try:
+        await dp.storage.close()
+    except Exception as e:
+        logger.error(f"Ошибка при закрытии хранилища состояний: {e}")
+    
     # Закрываем сессию бота
     if hasattr(bot, "session") and bot.session:
         await bot.session.close()
@@ -303,197 +376,287 @@ def signal_handler(signal_name):
     railway_print(f"Получен сигнал {signal_name}", "INFO")
     shutdown_event.set()
 
-async def main():
-    """
-    Основная функция запуска бота.
+def build_dispatcher(storage) -> Dispatcher:
     """
-    try:
-        # Получаем блокировку для предотвращения запуска нескольких экземпляров
-        if not acquire_lock():
-            logger.error("Бот уже запущен. Завершение работы.")
-            railway_print("Бот уже запущен. Завершение работы.", "ERROR")
-            return
-        
-        # Настраиваем обработчики сигналов для корректного завершения работы
-        signal.signal(signal.SIGINT, lambda s, f: asyncio.create_task(signal_handler("SIGINT")))
-        signal.signal(signal.SIGTERM, lambda s, f: asyncio.create_task(signal_handler("SIGTERM")))
+    Создает диспетчер со всеми роутерами и основными командами бота.
+    
+    Args:
+        storage: Хранилище состояний FSM
         
-        # Создаем хранилище состояний FSM в памяти
-        storage = MemoryStorage()
+    Returns:
+        Dispatcher: Настроенный диспетчер
+    """
+    dp = Dispatcher(storage=storage)
+
+    # Обновления одного чата обрабатываются по очереди (после определения чата и FSM)
+    from services.middlewares import chat_lock_middleware
+    dp.update.outer_middleware(chat_lock_middleware)
+
+    # Регистрируем обработчики команд бота
+    routers, get_main_keyboard = load_routers()
+    for router in routers:
+        dp.include_router(router)
+    
+    # Определение основных обработчиков команд
+    # Обработчик команды /start
+    async def cmd_start(message: Message):
+        """
+        Обработчик команды /start
+        """
+        # Приветственное сообщение
+        greeting_text = (
+            f"👋 Привет, {message.from_user.first_name}!\n\n"
+            "Я <b>ОНА</b> - твой Осознанный Наставник и Аналитик.\n\n"
+            "Я помогу тебе:\n"
+            "• 🧠 Определить твои сильные стороны и таланты\n"
+            "• 💡 Дать персонализированные советы\n"
+            "• 🌱 Поддержать в развитии и росте\n\n"
+            "Чтобы создать твой <b>психологический профиль</b>, нужно пройти опрос из 34 вопросов. "
+            "Это займет около 10-15 минут.\n\n"
+            "Готов начать?"
+        )
         
-        # Создаем объекты бота и диспетчера
-        bot = Bot(token=BOT_TOKEN)
-        dp = Dispatcher(storage=storage)
+        # Используем единую клавиатуру из survey_handler
+        keyboard = get_main_keyboard()
         
-        # Регистрируем обработчики команд бота
-        dp.include_router(survey_router)
-        dp.include_router(meditation_router)
-        dp.include_router(conversation_router)
-        dp.include_router(reminder_router)
-        dp.include_router(voice_router)
-        dp.include_router(communication_router)
+        # Отправляем приветственное сообщение
+        await message.answer(
+            greeting_text,
+            parse_mode="HTML",
+            reply_markup=keyboard
+        )
+    
+    # Обработчик команды /help
+    async def cmd_help(message: Message):
+        """
+        Обработчик команды /help
+        """
+        help_text = (
+            "🔍 <b>Основные команды и возможности:</b>\n\n"
+            "• /start - Начать работу с ботом\n"
+            "• /survey или 📝 Опрос - Пройти опрос для создания профиля\n"
+            "• /profile или 👤 Профиль - Посмотреть свой психологический профиль\n"
+            "• /meditate или 🧘 Медитации - Получить аудио-медитацию\n"
+            "• /reminders или ⏰ Напоминания - Настроить напоминания о практиках\n"
+            "• /advice или 💡 Советы - Получить персонализированный совет на основе типа личности\n"
+            "• /restart или 🔄 Рестарт - Перезапустить бота\n"
+            "• /cancel или ❌ Отменить - Отменить текущее действие\n"
+            "• /api_key - Инструкции по настройке API ключа OpenAI\n\n"
+            "🗣 <b>Как пользоваться ботом:</b>\n\n"
+            "1. Пройдите опрос из 34 вопросов\n"
+            "2. Получите свой психологический профиль\n"
+            "3. Узнайте ваш тип личности (Интеллектуальный, Эмоциональный, Практический или Творческий)\n"
+            "4. Получайте персонализированные советы, соответствующие вашему типу личности\n"
+            "5. Общайтесь со мной текстом или голосовыми сообщениями\n"
+            "6. Я буду отвечать с учетом ваших психологических особенностей\n\n"
+            "💡 <b>Если возникнут вопросы или проблемы:</b>\n"
+            "• Напишите \"Помощь\" или используйте команду /help\n"
+        )
         
-        # Определение обработчиков команд внутри функции main
-        # Обработчик команды /start
-        async def cmd_start(message: Message):
-            """
-            Обработчик команды /start
-            """
-            # Приветственное сообщение
-            greeting_text = (
-                f"👋 Привет, {message.from_user.first_name}!\n\n"
-                "Я <b>ОНА</b> - твой Осознанный Наставник и Аналитик.\n\n"
-                "Я помогу тебе:\n"
-                "• 🧠 Определить твои сильные стороны и таланты\n"
-                "• 💡 Дать персонализированные советы\n"
-                "• 🌱 Поддержать в развитии и росте\n\n"
-                "Чтобы создать твой <b>психологический профиль</b>, нужно пройти опрос из 34 вопросов. "
-                "Это займет около 10-15 минут.\n\n"
-                "Готов начать?"
-            )
+        await message.answer(
+            help_text,
+            parse_mode="HTML",
+            reply_markup=get_main_keyboard()
+        )
+    
+    # Обработчик команды /api_key
+    async def cmd_api_key(message: Message):
+        """
+        Обработчик команды /api_key - отображает инструкции по настройке API ключа OpenAI
+        """
+        try:
+            with open('api_key_instructions.md', 'r', encoding='utf-8') as f:
+                instructions = f.read()
             
-            # Используем единую клавиатуру из survey_handler
-            keyboard = get_main_keyboard()
+            instructions_text = (
+                "🔑 <b>Инструкции по настройке API ключа OpenAI</b>\n\n"
+                "Если бот отвечает шаблонными сообщениями и не генерирует уникальные ответы, "
+                "необходимо настроить API ключ OpenAI.\n\n"
+                "Краткая инструкция:\n"
+                "1. Получите API ключ на сайте OpenAI Platform\n"
+                "2. Откройте файл .env в корневой директории\n"
+                "3. Установите ключ в параметр OPENAI_API_KEY\n"
+                "4. Перезапустите бота\n\n"
+                "Полные инструкции отправлены отдельным файлом."
+            )
             
-            # Отправляем приветственное сообщение
+            # Отправляем краткую информацию
             await message.answer(
-                greeting_text,
-                parse_mode="HTML",
-                reply_markup=keyboard
-            )
-        
-        # Обработчик команды /help
-        async def cmd_help(message: Message):
-            """
-            Обработчик команды /help
-            """
-            help_text = (
-                "🔍 <b>Основные команды и возможности:</b>\n\n"
-                "• /start - Начать работу с ботом\n"
-                "• /survey или 📝 Опрос - Пройти опрос для создания профиля\n"
-                "• /profile или 👤 Профиль - Посмотреть свой психологический профиль\n"
-                "• /meditate или 🧘 Медитации - Получить аудио-медитацию\n"
-                "• /reminders или ⏰ Напоминания - Настроить напоминания о практиках\n"
-                "• /advice или 💡 Советы - Получить персонализированный совет на основе типа личности\n"
-                "• /restart или 🔄 Рестарт - Перезапустить бота\n"
-                "• /cancel или ❌ Отменить - Отменить текущее действие\n"
-                "• /api_key - Инструкции по настройке API ключа OpenAI\n\n"
-                "🗣 <b>Как пользоваться ботом:</b>\n\n"
-                "1. Пройдите опрос из 34 вопросов\n"
-                "2. Получите свой психологический профиль\n"
-                "3. Узнайте ваш тип личности (Интеллектуальный, Эмоциональный, Практический или Творческий)\n"
-                "4. Получайте персонализированные советы, соответствующие вашему типу личности\n"
-                "5. Общайтесь со мной текстом или голосовыми сообщениями\n"
-                "6. Я буду отвечать с учетом ваших психологических особенностей\n\n"
-                "💡 <b>Если возникнут вопросы или проблемы:</b>\n"
-                "• Напишите \"Помощь\" или используйте команду /help\n"
+                instructions_text,
+                parse_mode="HTML"
             )
             
-            await message.answer(
-                help_text,
-                parse_mode="HTML",
-                reply_markup=get_main_keyboard()
+            # Отправляем файл с полными инструкциями
+            await message.answer_document(
+                document=BufferedInputFile(
+                    instructions.encode('utf-8'),
+                    filename="api_key_setup_instructions.md"
+                ),
+                caption="Подробные инструкции по настройке API ключа OpenAI"
             )
-        
-        # Обработчик команды /api_key
-        async def cmd_api_key(message: Message):
-            """
-            Обработчик команды /api_key - отображает инструкции по настройке API ключа OpenAI
-            """
-            try:
-                with open('api_key_instructions.md', 'r', encoding='utf-8') as f:
-                    instructions = f.read()
-                
-                instructions_text = (
-                    "🔑 <b>Инструкции по настройке API ключа OpenAI</b>\n\n"
-                    "Если бот отвечает шаблонными сообщениями и не генерирует уникальные ответы, "
-                    "необходимо настроить API ключ OpenAI.\n\n"
-                    "Краткая инструкция:\n"
-                    "1. Получите API ключ на сайте OpenAI Platform\n"
-                    "2. Откройте файл .env в корневой директории\n"
-                    "3. Установите ключ в параметр OPENAI_API_KEY\n"
-                    "4. Перезапустите бота\n\n"
-                    "Полные инструкции отправлены отдельным файлом."
-                )
-                
-                # Отправляем краткую информацию
-                await message.answer(
-                    instructions_text,
-                    parse_mode="HTML"
-                )
-                
-                # Отправляем файл с полными инструкциями
-                await message.answer_document(
-                    document=BufferedInputFile(
-                        instructions.encode('utf-8'),
-                        filename="api_key_setup_instructions.md"
-                    ),
-                    caption="Подробные инструкции по настройке API ключа OpenAI"
-                )
-                
-                logger.info(f"Отправлены инструкции по настройке API ключа пользователю {message.from_user.id}")
-                
-            except Exception as e:
-                logger.error(f"Ошибка при отправке инструкций по API ключу: {e}")
-                await message.answer(
-                    "К сожалению, не удалось отправить инструкции. Пожалуйста, обратитесь к администратору бота."
-                )
-        
-        # Обработчик команды /restart
-        async def cmd_restart(message: Message):
-            """
-            Обработчик команды /restart
-            """
-            # Отправляем сообщение о перезапуске
+            
+            logger.info(f"Отправлены инструкции по настройке API ключа пользователю {message.from_user.id}")
+            
+        except Exception as e:
+            logger.error(f"Ошибка при отправке инструкций по API ключу: {e}")
             await message.answer(
-                "🔄 <b>Бот перезапущен!</b>\n\n"
-                "Начинаем заново. Если вы хотите сбросить свой профиль, "
-                "воспользуйтесь кнопкой 📝 Опрос и подтвердите перезапуск.",
-                parse_mode="HTML",
-                reply_markup=get_main_keyboard()
+                "К сожалению, не удалось отправить инструкции. Пожалуйста, обратитесь к администратору бота."
             )
+    
+    # Обработчик команды /restart
+    async def cmd_restart(message: Message):
+        """
+        Обработчик команды /restart
+        """
+        # Отправляем сообщение о перезапуске
+        await message.answer(
+            "🔄 <b>Бот перезапущен!</b>\n\n"
+            "Начинаем заново. Если вы хотите сбросить свой профиль, "
+            "воспользуйтесь кнопкой 📝 Опрос и подтвердите перезапуск.",
+            parse_mode="HTML",
+            reply_markup=get_main_keyboard()
+        )
+    
+    # Регистрируем основные обработчики команд
+    dp.message.register(cmd_start, Command("start"))
+    dp.message.register(cmd_help, Command("help"))
+    dp.message.register(cmd_help, F.text == "💬 Помощь")
+    dp.message.register(cmd_api_key, Command("api_key"))
+    dp.message.register(cmd_restart, Command("restart"))
+    dp.message.register(cmd_restart, F.text == "🔄 Рестарт")
+    
+    return dp
+
+async def start_background_tasks(bot, run_reminders: bool = True):
+    """
+    Запускает фоновые задачи бота: пул OpenAI, планировщик, загрузку профилей и напоминаний.
+    
+    Args:
+        bot: Bot
+        run_reminders: Запускать ли рассылку напоминаний в этом процессе
+    """
+    # Инициализируем общий пул соединений OpenAI
+    try:
+        from services.openai_client import startup_openai_pool
+        await startup_openai_pool()
+    except Exception as e:
+        logger.warning(f"Не удалось инициализировать пул соединений OpenAI: {e}")
+    
+    # Запускаем запланированные задачи
+    asyncio.create_task(start_scheduler())
+    
+    # Запускаем асинхронные задачи из других модулей
+    setup_tasks = []
+    
+    # Добавляем задачи из модуля опросов
+    try:
+        from survey_handler import setup_async_tasks as survey_setup_tasks
+        setup_tasks.extend(survey_setup_tasks())
+    except (ImportError, AttributeError) as e:
+        logger.warning(f"Не удалось настроить асинхронные задачи из модуля survey_handler: {e}")
+    
+    # Добавляем задачи из модуля напоминаний
+    if run_reminders:
+        try:
+            from reminder_handler import setup_async_tasks as reminder_setup_tasks
+            setup_tasks.extend(reminder_setup_tasks(bot))
+        except (ImportError, AttributeError) as e:
+            logger.warning(f"Не удалось настроить асинхронные задачи из модуля reminder_handler: {e}")
+    
+    # Запускаем все подготовленные задачи
+    for task in setup_tasks:
+        asyncio.create_task(task)
+
+def worker_process(index: int, count: int, update_queue, health_queue):
+    """
+    Точка входа рабочего процесса в режиме WORKER_PROCESSES.
+    
+    Args:
+        index: Номер процесса
+        count: Количество рабочих процессов
+        update_queue: Очередь обновлений процесса
+        health_queue: Очередь отчетов о состоянии
+    """
+    # Ctrl+C получает вся группа процессов; рабочие процессы останавливает супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(run_worker(index, count, update_queue, health_queue))
+
+async def run_worker(index: int, count: int, update_queue, health_queue):
+    """
+    Обрабатывает обновления своей доли пользователей до сигнала остановки.
+    """
+    from services.sharding import consume_updates, shard_for
+    from services.coordination import create_fsm_storage
+    import profile_storage
+    
+    # Процесс сохраняет в общий файл только профили своих пользователей
+    profile_storage.owns_profile = lambda user_id: shard_for(user_id, count) == index
+    
+    bot = Bot(token=BOT_TOKEN)
+    dp = build_dispatcher(create_fsm_storage())
+    try:
+        # Напоминания рассылает только процесс 0: у каждого процесса свой лимит
+        # отправки BROADCAST_RATE, а у бота в Telegram он один на все процессы
+        await start_background_tasks(bot, run_reminders=index == 0)
+        railway_print(f"Рабочий процесс {index} из {count} запущен (pid {os.getpid()})", "INFO")
+        await consume_updates(update_queue, lambda update: dp.feed_raw_update(bot, update), index, health_queue)
+    finally:
+        await shutdown(dp, bot)
+
+async def main():
+    """
+    Основная функция запуска бота.
+    """
+    dp = bot = None
+    try:
+        from services.coordination import INSTANCE_MODE, INSTANCE_ID, create_fsm_storage
+        from services.sharding import WORKER_PROCESSES
         
-        # Регистрируем основные обработчики команд
-        dp.message.register(cmd_start, Command("start"))
-        dp.message.register(cmd_help, Command("help"))
-        dp.message.register(cmd_help, F.text == "💬 Помощь")
-        dp.message.register(cmd_api_key, Command("api_key"))
-        dp.message.register(cmd_restart, Command("restart"))
-        dp.message.register(cmd_restart, F.text == "🔄 Рестарт")
+        # Получаем блокировку для предотвращения запуска нескольких экземпляров.
+        # В режиме multi экземпляров несколько, обязанности делятся через выборы лидера.
+        if INSTANCE_MODE == "multi":
+            railway_print(f"Режим нескольких экземпляров, ID экземпляра: {INSTANCE_ID}", "INFO")
+        elif not acquire_lock():
+            logger.error("Бот уже запущен. Завершение работы.")
+            railway_print("Бот уже запущен. Завершение работы.", "ERROR")
+            return
         
-        # Запускаем запланированные задачи
-        asyncio.create_task(start_scheduler())
+        # Настраиваем обработчики сигналов для корректного завершения работы
+        signal.signal(signal.SIGINT, lambda s, f: asyncio.create_task(signal_handler("SIGINT")))
+        signal.signal(signal.SIGTERM, lambda s, f: asyncio.create_task(signal_handler("SIGTERM")))
         
-        # Запускаем асинхронные задачи из других модулей
-        setup_tasks = []
+        # Создаем бота
+        bot = Bot(token=BOT_TOKEN)
         
-        # Добавляем задачи из модуля опросов
-        try:
-            from survey_handler import setup_async_tasks as survey_setup_tasks
-            setup_tasks.extend(survey_setup_tasks())
-        except (ImportError, AttributeError) as e:
-            logger.warning(f"Не удалось настроить асинхронные задачи из модуля survey_handler: {e}")
+        # Режим нескольких процессов: этот процесс только раздает обновления рабочим
+        if WORKER_PROCESSES > 1:
+            from services.sharding import run_supervisor
+            railway_print(f"Запускаем {WORKER_PROCESSES} рабочих процессов", "INFO")
+            await run_supervisor(bot, shutdown_event, worker_process, mode=os.getenv("BOT_MODE", "polling").lower())
+            return
         
-        # Добавляем задачи из модуля напоминаний
-        try:
-            from reminder_handler import setup_async_tasks as reminder_setup_tasks
-            setup_tasks.extend(reminder_setup_tasks())
-        except (ImportError, AttributeError) as e:
-            logger.warning(f"Не удалось настроить асинхронные задачи из модуля reminder_handler: {e}")
+        # Создаем хранилище состояний FSM (Redis при заданном REDIS_URL, иначе в памяти) и диспетчер
+        dp = build_dispatcher(create_fsm_storage())
         
-        # Запускаем все подготовленные задачи
-        for task in setup_tasks:
-            asyncio.create_task(task)
+        await start_background_tasks(bot)
         
-        # Запускаем бота в режиме long polling
-        railway_print("Начинаем поллинг обновлений Telegram", "INFO")
-        await dp.start_polling(bot)
+        # Получаем обновления через webhook или long polling (BOT_MODE)
+        if os.getenv("BOT_MODE", "polling").lower() == "webhook":
+            from services.webhook import run_webhook
+            railway_print("Запускаем сервер webhook для обновлений Telegram", "INFO")
+            await run_webhook(dp, bot, shutdown_event)
+        else:
+            railway_print("Начинаем поллинг обновлений Telegram", "INFO")
+            await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
         railway_print(f"Ошибка при запуске бота: {e}", "ERROR")
     finally:
-        # Корректно завершаем работу
-        await shutdown(dp, bot)
+        # Корректно завершаем работу (супервизор рабочих процессов только закрывает сессию бота)
+        if dp is not None:
+            await shutdown(dp, bot)
+        elif bot is not None:
+            await bot.session.close()
         # Освобождаем блокировку
         release_lock()
 
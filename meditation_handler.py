@@ -10,6 +10,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import FSInputFile
 
 from button_states import MeditationStates
+from services.middlewares import ThrottlingMiddleware
 
 # Импортируем generate_audio из services.tts с обработкой ошибок
 try:
@@ -49,6 +50,12 @@ logger = logging.getLogger(__name__)
 # Создаем роутер для обработки медитаций
 meditation_router = Router()
 
+# Синтез медитации дорогой: ограничиваем частоту нажатий кнопок meditate_*
+MEDITATION_TTS_CALLBACKS = frozenset({"meditate_relax", "meditate_focus", "meditate_sleep"})
+meditation_router.callback_query.middleware(
+    ThrottlingMiddleware("tts", applies=lambda callback, data: callback.data in MEDITATION_TTS_CALLBACKS)
+)
+
 # Тексты медитаций
 MEDITATION_TEXTS = {
     "relax": """Начните с того, что сядьте удобно и закройте глаза. 
@@ -0,0 +1,113 @@
+"""
+Единая точка маршрутизации свободных текстовых сообщений.
+
+Кнопки меню, команды и ответы на опрос обрабатываются своими роутерами раньше;
+сюда попадает все остальное. Сообщение классифицируется за один проход по
+заранее подготовленным множествам и состоянию FSM, после чего вызывается ровно
+один обработчик. Данные состояния читаются один раз и передаются дальше.
+"""
+
+import time
+import logging
+from typing import Dict, Any, Optional
+
+from aiogram import Router, F
+from aiogram.types import Message
+from aiogram.fsm.context import FSMContext
+
+from button_states import SurveyStates
+from conversation_handler import handle_chat_message, offer_survey
+from services.middlewares import ThrottlingMiddleware
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Роутер подключается последним: он принимает все текстовые сообщения
+message_router = Router(name="message_router")
+
+# Маршруты текстовых сообщений
+ROUTE_COMMAND = "command"
+ROUTE_MENU = "menu"
+ROUTE_SURVEY = "survey"
+ROUTE_CHAT = "chat"
+
+# Кнопки клавиатур бота; если они дошли сюда, их обработчик уже отработал или недоступен
+MENU_BUTTONS = frozenset({
+    "📝 Опрос", "👤 Профиль", "🧘 Медитации", "⏰ Напоминания",
+    "💬 Помощь", "🔄 Рестарт", "💡 Советы",
+    "❌ Отменить", "❌ Отменить опрос", "✅ Да, готов(а)"
+})
+
+# Состояния FSM, в которых текст - это ответ на опрос
+SURVEY_STATES = frozenset({SurveyStates.answering_questions.state})
+
+# Статистика маршрутизации: {маршрут: {"count": int, "total_time": float}}
+route_stats: Dict[str, Dict[str, float]] = {}
+
+def classify_text_message(text: str, raw_state: Optional[str]) -> str:
+    """
+    Определяет маршрут текстового сообщения.
+
+    Args:
+        text: Текст сообщения
+        raw_state: Текущее состояние FSM (строка) или None
+
+    Returns:
+        str: Один из маршрутов ROUTE_*
+    """
+    if raw_state in SURVEY_STATES:
+        return ROUTE_SURVEY
+    if text.startswith("/"):
+        return ROUTE_COMMAND
+    if text in MENU_BUTTONS:
+        return ROUTE_MENU
+    return ROUTE_CHAT
+
+def _record_route(route: str, started_at: float):
+    stats = route_stats.setdefault(route, {"count": 0, "total_time": 0.0})
+    stats["count"] += 1
+    stats["total_time"] += time.perf_counter() - started_at
+
+def get_route_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Возвращает статистику маршрутизации со средним временем обработки.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Количество сообщений и среднее время по маршрутам
+    """
+    return {
+        route: {**stats, "avg_time": stats["total_time"] / stats["count"] if stats["count"] else 0.0}
+        for route, stats in route_stats.items()
+    }
+
+def _is_chat_message(message: Message, data: Dict[str, Any]) -> bool:
+    return classify_text_message(message.text, data.get("raw_state")) == ROUTE_CHAT
+
+# Ответ LLM дорогой: ограничиваем частоту свободных сообщений (кнопки и опрос не ограничиваются)
+message_router.message.middleware(ThrottlingMiddleware("llm", applies=_is_chat_message))
+
+@message_router.message(F.text)
+async def route_text_message(message: Message, state: FSMContext, raw_state: Optional[str] = None):
+    """
+    Классифицирует текстовое сообщение и передает его единственному обработчику.
+
+    Args:
+        message: Сообщение от пользователя
+        state: Состояние FSM
+        raw_state: Текущее состояние FSM (передается aiogram без обращения к хранилищу)
+    """
+    started_at = time.perf_counter()
+    route = classify_text_message(message.text, raw_state)
+
+    try:
+        if route == ROUTE_CHAT:
+            user_data = await state.get_data()
+            if user_data.get("profile_completed", False):
+                await handle_chat_message(message, state, user_data)
+            else:
+                await offer_survey(message)
+        else:
+            # Команды, кнопки и ответы на опрос обрабатывают специализированные роутеры
+            logger.debug(f"Сообщение пользователя {message.from_user.id} не требует ответа (маршрут {route})")
+    finally:
+        _record_route(route, started_at)
@@ -2,10 +2,11 @@ import logging
 import os
 import json
 from typing import Dict, Any, Optional
-from openai import AsyncOpenAI
-import httpx
 import asyncio
 
+from services.openai_client import get_openai_client
+from services.openai_limiter import call_openai
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
@@ -14,18 +15,6 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY не найден в переменных окружения. Функция генерации профиля будет работать в демо-режиме.")
 
-# Инициализация клиента OpenAI с API-ключом из переменных окружения (если доступен)
-http_client = httpx.AsyncClient()
-client = None
-if OPENAI_API_KEY:
-    try:
-        client = AsyncOpenAI(
-            api_key=OPENAI_API_KEY,
-            http_client=http_client
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при инициализации OpenAI API: {e}")
-
 # Демо-профили для случая отсутствия API-ключа OpenAI
 DEMO_PROFILES = {
     "Интеллектуальный": """Привет, {name}!
@@ -211,6 +200,7 @@ async def generate_profile(answers: Dict[str, str]) -> Dict[str, str]:
             personal_info += f"• Часовой пояс: {timezone}\n"
             
         # Проверяем наличие API-ключа OpenAI
+        client = get_openai_client("profile_generator")
         if not client:
             logger.warning("OpenAI API недоступен. Используем демо-профиль.")
             demo_profile = DEMO_PROFILES.get(primary_type, DEMO_PROFILES["Интеллектуальный"])
@@ -233,7 +223,9 @@ async def generate_profile(answers: Dict[str, str]) -> Dict[str, str]:
         compact_prompt = prompt + "\n\nВажно: Создай два раздела:\n1. КРАТКИЙ ПРОФИЛЬ - короткое резюме основных модулей силы (до 15 строк максимум).\n2. ПОЛНЫЙ ПРОФИЛЬ - подробный и развернутый профиль согласно всей структуре профайлинга 2.0 с ядром личности, вспомогательными модулями, общим кодом и P.S."
         
         # Генерируем профиль с помощью OpenAI
-        response = await client.chat.completions.create(
+        response = await call_openai(
+            client.chat.completions.create,
+            caller="profile_generator",
             model="gpt-4",
             temperature=0.7,
             messages=[
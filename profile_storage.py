@@ -1,7 +1,7 @@
 import logging
 import json
 import os
-from typing import Dict, Any, List, Optional, Union, Tuple
+from typing import Dict, Any, List, Optional, Union, Tuple, Callable
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -23,24 +23,43 @@ except ImportError:
         import sys
         sys.stdout.flush()
 
-# Импортируем интерфейс для работы с Supabase
+# Файловая блокировка доступна только в Unix-подобных системах
 try:
-    from db_supabase import (
-        init_supabase, 
-        get_supabase_client, 
-        init_supabase_tables,
-        save_user_profile_to_supabase,
-        load_user_profile_from_supabase,
-        delete_user_profile_from_supabase,
-        list_all_profiles_from_supabase
-    )
-    SUPABASE_AVAILABLE = True
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Модуль Supabase (вместе с клиентом supabase) импортируется в init_storage,
+# при запуске бота; до этого профили читаются из локального файла
+SUPABASE_AVAILABLE = False
+
+def _import_supabase() -> bool:
+    """
+    Импортирует интерфейс для работы с Supabase.
+
+    Returns:
+        bool: True, если модуль Supabase доступен
+    """
+    global init_supabase, get_supabase_client, init_supabase_tables
+    global save_user_profile_to_supabase, load_user_profile_from_supabase
+    global delete_user_profile_from_supabase, list_all_profiles_from_supabase
+    try:
+        from db_supabase import (
+            init_supabase, 
+            get_supabase_client, 
+            init_supabase_tables,
+            save_user_profile_to_supabase,
+            load_user_profile_from_supabase,
+            delete_user_profile_from_supabase,
+            list_all_profiles_from_supabase
+        )
+    except ImportError as e:
+        logger.warning(f"Не удалось импортировать модуль Supabase: {e}")
+        railway_print(f"Не удалось импортировать модуль Supabase: {e}", "WARNING")
+        return False
     logger.info("Модуль Supabase успешно импортирован")
     railway_print("Модуль Supabase успешно импортирован", "INFO")
-except ImportError as e:
-    SUPABASE_AVAILABLE = False
-    logger.warning(f"Не удалось импортировать модуль Supabase: {e}")
-    railway_print(f"Не удалось импортировать модуль Supabase: {e}", "WARNING")
+    return True
 
 # Определяем путь к файлу локального сохранения профилей
 LOCAL_PROFILES_FILE = "user_profiles.json"
@@ -48,6 +67,33 @@ LOCAL_PROFILES_FILE = "user_profiles.json"
 # Словарь для хранения профилей пользователей в памяти
 user_profiles = {}
 
+# В режиме нескольких процессов (WORKER_PROCESSES): проверяет, принадлежит ли
+# профиль пользователя этому процессу. Остальные профили в общем файле
+# сохраняют другие процессы.
+owns_profile: Optional[Callable[[int], bool]] = None
+
+def _owned(user_id) -> bool:
+    try:
+        return owns_profile(int(user_id))
+    except (TypeError, ValueError):
+        return False
+
+def _merge_owned_profiles() -> Dict[str, Any]:
+    """
+    Собирает содержимое общего файла: профили других процессов из файла
+    и профили этого процесса из памяти.
+    """
+    merged = {}
+    if os.path.exists(LOCAL_PROFILES_FILE):
+        try:
+            with open(LOCAL_PROFILES_FILE, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            merged = {uid: profile for uid, profile in stored.items() if not _owned(uid)}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Не удалось прочитать файл профилей для объединения: {e}")
+    merged.update({str(uid): profile for uid, profile in user_profiles.items() if _owned(uid)})
+    return merged
+
 # Функция для инициализации хранилища данных
 async def init_storage():
     """
@@ -55,6 +101,7 @@ async def init_storage():
     """
     global SUPABASE_AVAILABLE
     
+    SUPABASE_AVAILABLE = _import_supabase()
     if SUPABASE_AVAILABLE:
         try:
             # Инициализируем Supabase
@@ -84,11 +131,20 @@ async def save_profiles_to_file():
     """
     Сохраняет профили пользователей в локальный файл.
     """
+    lock_file = None
     try:
+        profiles = user_profiles
+        if owns_profile is not None:
+            # Файл общий для рабочих процессов: объединяем под файловой блокировкой
+            lock_file = open(f"{LOCAL_PROFILES_FILE}.lock", 'w')
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            profiles = _merge_owned_profiles()
+        
         # Сначала пишем во временный файл
         temp_file = f"{LOCAL_PROFILES_FILE}.temp"
         with open(temp_file, 'w', encoding='utf-8') as f:
-            json.dump(user_profiles, f, ensure_ascii=False, indent=4)
+            json.dump(profiles, f, ensure_ascii=False, indent=4)
         
         # Создаем резервную копию существующего файла, если он существует
         if os.path.exists(LOCAL_PROFILES_FILE):
@@ -110,6 +166,9 @@ async def save_profiles_to_file():
         logger.error(f"Ошибка при сохранении профилей в локальный файл: {e}")
         railway_print(f"Ошибка при сохранении профилей в локальный файл: {e}", "ERROR")
         return False
+    finally:
+        if lock_file is not None:
+            lock_file.close()
 
 # Функция для загрузки профилей из локального файла
 async def load_profiles_from_file():
@@ -729,6 +729,40 @@ def get_personality_type_from_answers(answers: Dict[str, Any]) -> Tuple[Dict[str
     
     return type_counts, personality_types[primary_type], secondary_result
 
+# Типы личности, используемые в общении, по буквам ответов опроса
+PERSONALITY_TYPE_BY_ANSWER = {
+    "A": "Интеллектуальный",
+    "B": "Эмоциональный",
+    "C": "Практический",
+    "D": "Творческий"
+}
+
+# Названия типов из get_personality_type_from_answers -> буква ответа
+_ANSWER_BY_TYPE_NAME = {
+    "Аналитический тип": "A",
+    "Эмпатический тип": "B",
+    "Практический тип": "C",
+    "Творческий тип": "D"
+}
+
+def derive_personality_fields(answers: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Вычисляет структурированные поля типа личности для записи профиля.
+    Вызывается один раз при создании профиля (и при миграции старых профилей).
+    
+    Args:
+        answers: Словарь с ответами пользователя
+    
+    Returns:
+        Dict[str, Any]: personality_type, secondary_type и type_counts
+    """
+    type_counts, primary_type, secondary_type = get_personality_type_from_answers(answers or {})
+    return {
+        "personality_type": PERSONALITY_TYPE_BY_ANSWER[_ANSWER_BY_TYPE_NAME[primary_type]],
+        "secondary_type": PERSONALITY_TYPE_BY_ANSWER[_ANSWER_BY_TYPE_NAME[secondary_type]] if secondary_type else None,
+        "type_counts": type_counts
+    }
+
 def generate_profile_prompt(answers: Dict[str, str]) -> str:
     """
     Генерирует промт для создания психологического профиля по структуре 2.0.
@@ -234,23 +234,9 @@ scheduler = None
         
         for module_name in modules:
             try:
-                # Особая обработка для survey_handler из-за проблемы с asyncio
-                if module_name == "survey_handler":
-                    # Добавляем аттрибут для временного импорта, чтобы избежать создания asyncio task
-                    sys.modules['temp_import_mode'] = True
-                    
-                    # Импортируем модуль, но не выполняем инициализацию asyncio
-                    importlib.import_module(module_name)
-                    
-                    # Удаляем временный аттрибут
-                    if 'temp_import_mode' in sys.modules:
-                        del sys.modules['temp_import_mode']
-                    
-                    logger.info(f"Модуль {module_name} успешно проверен (без asyncio init)")
-                else:
-                    # Стандартный импорт для других модулей
-                    importlib.import_module(module_name)
-                    logger.info(f"Модуль {module_name} успешно проверен")
+                # Модули не запускают задач при импорте: инициализация - в setup_async_tasks
+                importlib.import_module(module_name)
+                logger.info(f"Модуль {module_name} успешно проверен")
             except Exception as e:
                 logger.error(f"Ошибка при проверке модуля {module_name}: {e}")
                 # Если модуль не найден, пытаемся его зарегистрировать как пустой объект
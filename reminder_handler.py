@@ -1,7 +1,7 @@
 import logging
 import os
 import asyncio
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.filters import Command
@@ -13,6 +13,12 @@ from survey_handler import get_main_keyboard
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
+from services.reminder_dispatcher import reminder_dispatcher, reminder_index, REMINDER_MODE
+from services.reminder_store import save_reminder, load_reminder, load_reminders, claim_due_reminders
+from services.broadcast import reminder_sender
+from services.timezones import DEFAULT_TIMEZONE, resolve_timezone
+from services.coordination import register_duty, is_leader
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
@@ -22,8 +28,14 @@ reminder_router = Router()
 # Инициализация планировщика задач
 scheduler = AsyncIOScheduler()
 
+# ID единственной задачи планировщика: ежеминутный диспетчер напоминаний
+DISPATCHER_JOB_ID = "reminder_dispatcher"
+
 # Словарь для хранения пользователей с включенными напоминаниями
-# {user_id: {"time": "HH:MM", "days": ["mon", "tue", ...], "active": True}}
+# {user_id: {"time": "HH:MM", "days": ["mon", "tue", ...], "active": True, "timezone": "Europe/Moscow"}}
+# Время и дни указаны в часовом поясе пользователя.
+# В режиме pull источник настроек - хранилище, здесь только копии, прочитанные
+# при последнем обращении пользователя к меню напоминаний.
 reminder_users = {}
 
 # Функция для создания клавиатуры напоминаний
@@ -91,27 +103,146 @@ def get_days_selection_keyboard(selected_days=None) -> InlineKeyboardMarkup:
     
     return builder.as_markup()
 
+# Текст напоминания о практике
+REMINDER_TEXT = (
+    "🧘 <b>Напоминание о практике</b>\n\n"
+    "Привет! Не забудьте уделить время себе сегодня. "
+    "Медитация или другая психологическая практика поможет вам "
+    "чувствовать себя лучше и поддерживать ментальное здоровье."
+)
+
 # Функция для отправки напоминания
 async def send_reminder(bot: Bot, user_id: int):
     """
     Отправляет напоминание пользователю.
+    Ошибки Telegram обрабатывает рассылка (повторы, RetryAfter, блокировка бота).
     
     Args:
         bot: Бот, который отправляет сообщение
         user_id: ID пользователя в Telegram
     """
-    try:
-        await bot.send_message(
-            chat_id=user_id,
-            text="🧘 <b>Напоминание о практике</b>\n\n"
-                 "Привет! Не забудьте уделить время себе сегодня. "
-                 "Медитация или другая психологическая практика поможет вам "
-                 "чувствовать себя лучше и поддерживать ментальное здоровье.",
-            parse_mode="HTML"
+    await bot.send_message(chat_id=user_id, text=REMINDER_TEXT, parse_mode="HTML")
+
+async def send_reminders(bot: Bot, user_ids: List[int]):
+    """
+    Отправляет напоминания всем пользователям слота расписания
+    с соблюдением лимитов Telegram.
+    
+    Args:
+        bot: Бот, который отправляет сообщения
+        user_ids: ID пользователей
+    """
+    await reminder_sender.send_all(user_ids, lambda user_id: send_reminder(bot, user_id))
+
+def schedule_user_reminder(user_id: int):
+    """
+    Обновляет расписание пользователя в индексе диспетчера по reminder_users.
+    
+    Args:
+        user_id: ID пользователя в Telegram
+    """
+    if REMINDER_MODE == "pull":
+        # Расписание хранится только в базе
+        return
+    reminder = reminder_users.get(user_id)
+    if reminder and reminder.get("active", False):
+        reminder_index.set_user(user_id, reminder["time"], reminder["days"], reminder.get("timezone"))
+    else:
+        reminder_index.remove_user(user_id)
+
+async def get_user_reminder(user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Возвращает настройки напоминаний пользователя.
+    В режиме pull настройки читаются из хранилища при каждом обращении: их могли
+    изменить другие экземпляры бота, а следующее сохранение записало бы
+    устаревшие время, дни или флаг включения поверх новых.
+    
+    Args:
+        user_id: ID пользователя в Telegram
+        
+    Returns:
+        Optional[Dict[str, Any]]: Настройки или None, если их нет
+    """
+    if REMINDER_MODE == "pull":
+        reminder = await load_reminder(user_id)
+        if reminder is None:
+            reminder_users.pop(user_id, None)
+        else:
+            reminder_users[user_id] = reminder
+    return reminder_users.get(user_id)
+
+async def get_user_timezone(state: FSMContext, current: Optional[str] = None) -> str:
+    """
+    Определяет часовой пояс пользователя по ответу на вопрос опроса "timezone".
+    
+    Args:
+        state: Состояние FSM с ответами опроса
+        current: Уже сохраненный часовой пояс
+        
+    Returns:
+        str: Имя зоны IANA
+    """
+    user_data = await state.get_data()
+    answer = (user_data.get("answers") or {}).get("timezone") or user_data.get("timezone")
+    if answer:
+        return resolve_timezone(answer)
+    return current or DEFAULT_TIMEZONE
+
+async def update_user_reminder(user_id: int, state: Optional[FSMContext] = None):
+    """
+    Применяет изменение настроек напоминаний: обновляет расписание и сохраняет
+    настройки в хранилище, чтобы они пережили перезапуск бота.
+    
+    Args:
+        user_id: ID пользователя в Telegram
+        state: Состояние FSM (по нему обновляется часовой пояс пользователя)
+    """
+    reminder = reminder_users.get(user_id)
+    if reminder is not None and state is not None:
+        reminder["timezone"] = await get_user_timezone(state, reminder.get("timezone"))
+    schedule_user_reminder(user_id)
+    if reminder is not None:
+        await save_reminder(user_id, reminder)
+
+async def reminder_tick():
+    """
+    Срабатывание диспетчера напоминаний. При нескольких экземплярах бота
+    напоминания рассылает только лидер.
+    """
+    if not is_leader(DISPATCHER_JOB_ID):
+        return
+    await reminder_dispatcher.tick()
+
+def start_reminder_dispatcher(bot: Bot):
+    """
+    Регистрирует ежеминутный диспетчер напоминаний и запускает планировщик.
+    Вызывается при старте только в процессе, который рассылает напоминания
+    (setup_async_tasks); обработчики меню лишь обновляют хранилище и индекс.
+    Повторные вызовы ничего не меняют.
+    
+    Args:
+        bot: Бот, который отправляет напоминания
+    """
+    if reminder_dispatcher.deliver is None:
+        reminder_dispatcher.deliver = lambda user_ids: send_reminders(bot, user_ids)
+    if REMINDER_MODE == "pull" and reminder_dispatcher.claim is None:
+        reminder_dispatcher.claim = claim_due_reminders
+    register_duty(DISPATCHER_JOB_ID)
+    
+    if not scheduler.get_job(DISPATCHER_JOB_ID):
+        scheduler.add_job(
+            reminder_tick,
+            CronTrigger(second=0),
+            id=DISPATCHER_JOB_ID,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=30,
+            replace_existing=True
         )
-        logger.info(f"Отправлено напоминание пользователю {user_id}")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке напоминания пользователю {user_id}: {e}")
+    
+    # Если планировщик не запущен, запускаем его
+    if not scheduler.running:
+        scheduler.start()
 
 # Обработчики команд
 @reminder_router.message(Command("reminders"))
@@ -123,7 +254,7 @@ async def cmd_reminders(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
     # Получаем информацию о текущих напоминаниях для пользователя
-    reminder_info = reminder_users.get(user_id, None)
+    reminder_info = await get_user_reminder(user_id)
     
     if reminder_info and reminder_info.get("active", False):
         time = reminder_info.get("time", "20:00")
@@ -160,10 +291,9 @@ async def reminder_on(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
     # Проверяем, есть ли уже настройки напоминаний
-    if user_id not in reminder_users:
+    if await get_user_reminder(user_id) is None:
         # Получаем время по умолчанию из переменных окружения
         default_time = os.getenv("DEFAULT_REMINDER_TIME", "20:00")
-        hour, minute = map(int, default_time.split(":"))
         
         # Создаем настройки напоминаний по умолчанию
         reminder_users[user_id] = {
@@ -175,31 +305,11 @@ async def reminder_on(callback: CallbackQuery, state: FSMContext):
         # Активируем существующие настройки
         reminder_users[user_id]["active"] = True
         default_time = reminder_users[user_id]["time"]
-        hour, minute = map(int, default_time.split(":"))
-    
-    # Создаем уникальный ID для задачи
-    job_id = f"reminder_{user_id}"
     
-    # Удаляем существующую задачу, если она есть
-    if scheduler.get_job(job_id):
-        scheduler.remove_job(job_id)
-    
-    # Дни недели в формате APScheduler
     days = reminder_users[user_id]["days"]
-    day_of_week = ",".join(days)
-    
-    # Добавляем новую задачу в планировщик
-    scheduler.add_job(
-        send_reminder,
-        CronTrigger(hour=hour, minute=minute, day_of_week=day_of_week),
-        id=job_id,
-        args=[callback.bot, user_id],
-        replace_existing=True
-    )
     
-    # Если планировщик не запущен, запускаем его
-    if not scheduler.running:
-        scheduler.start()
+    # Добавляем пользователя в расписание диспетчера
+    await update_user_reminder(user_id, state)
     
     # Формируем текст дней недели для отображения
     day_names = {
@@ -227,14 +337,11 @@ async def reminder_off(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     # Проверяем, есть ли настройки напоминаний
-    if user_id in reminder_users:
+    if await get_user_reminder(user_id) is not None:
         reminder_users[user_id]["active"] = False
     
-    # Удаляем задачу из планировщика
-    job_id = f"reminder_{user_id}"
-    if scheduler.get_job(job_id):
-        scheduler.remove_job(job_id)
-        logger.info(f"Задача напоминания {job_id} удалена из планировщика")
+    # Удаляем пользователя из расписания диспетчера
+    await update_user_reminder(user_id)
     
     await callback.message.edit_text(
         "⏰ <b>Напоминания отключены</b>\n\n"
@@ -272,10 +379,9 @@ async def process_time_selection(callback: CallbackQuery, state: FSMContext):
     """
     user_id = callback.from_user.id
     selected_time = callback.data.split("_")[1]
-    hour, minute = map(int, selected_time.split(":"))
     
     # Обновляем или создаем настройки напоминаний
-    if user_id not in reminder_users:
+    if await get_user_reminder(user_id) is None:
         reminder_users[user_id] = {
             "time": selected_time,
             "days": ["mon", "tue", "wed", "thu", "fri", "sat", "sun"],
@@ -285,26 +391,10 @@ async def process_time_selection(callback: CallbackQuery, state: FSMContext):
         reminder_users[user_id]["time"] = selected_time
         reminder_users[user_id]["active"] = True
     
-    # Если напоминания активны, обновляем задачу в планировщике
-    job_id = f"reminder_{user_id}"
-    if scheduler.get_job(job_id):
-        scheduler.remove_job(job_id)
-    
-    # Дни недели в формате APScheduler
     days = reminder_users[user_id]["days"]
-    day_of_week = ",".join(days)
-    
-    scheduler.add_job(
-        send_reminder,
-        CronTrigger(hour=hour, minute=minute, day_of_week=day_of_week),
-        id=job_id,
-        args=[callback.bot, user_id],
-        replace_existing=True
-    )
     
-    # Если планировщик не запущен, запускаем его
-    if not scheduler.running:
-        scheduler.start()
+    # Обновляем расписание пользователя в диспетчере
+    await update_user_reminder(user_id, state)
     
     # Формируем текст дней недели для отображения
     day_names = {
@@ -331,7 +421,7 @@ async def set_reminder_days(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
     # Получаем текущие выбранные дни или устанавливаем все дни по умолчанию
-    selected_days = reminder_users.get(user_id, {}).get("days", ["mon", "tue", "wed", "thu", "fri", "sat", "sun"])
+    selected_days = (await get_user_reminder(user_id) or {}).get("days", ["mon", "tue", "wed", "thu", "fri", "sat", "sun"])
     
     await callback.message.edit_text(
         "📅 <b>Выберите дни недели для напоминаний</b>\n\n"
@@ -405,7 +495,7 @@ async def save_reminder_days(callback: CallbackQuery, state: FSMContext):
         return
     
     # Обновляем или создаем настройки напоминаний
-    if user_id not in reminder_users:
+    if await get_user_reminder(user_id) is None:
         default_time = os.getenv("DEFAULT_REMINDER_TIME", "20:00")
         reminder_users[user_id] = {
             "time": default_time,
@@ -416,28 +506,10 @@ async def save_reminder_days(callback: CallbackQuery, state: FSMContext):
         reminder_users[user_id]["days"] = selected_days
         reminder_users[user_id]["active"] = True
     
-    # Обновляем задачу в планировщике, если напоминания активны
     time_str = reminder_users[user_id]["time"]
-    hour, minute = map(int, time_str.split(":"))
-    
-    job_id = f"reminder_{user_id}"
-    if scheduler.get_job(job_id):
-        scheduler.remove_job(job_id)
     
-    # Дни недели в формате APScheduler
-    day_of_week = ",".join(selected_days)
-    
-    scheduler.add_job(
-        send_reminder,
-        CronTrigger(hour=hour, minute=minute, day_of_week=day_of_week),
-        id=job_id,
-        args=[callback.bot, user_id],
-        replace_existing=True
-    )
-    
-    # Если планировщик не запущен, запускаем его
-    if not scheduler.running:
-        scheduler.start()
+    # Обновляем расписание пользователя в диспетчере
+    await update_user_reminder(user_id, state)
     
     # Формируем текст дней недели для отображения
     day_names = {
@@ -496,7 +568,7 @@ async def back_to_reminder_menu(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
     # Получаем информацию о текущих напоминаниях для пользователя
-    reminder_info = reminder_users.get(user_id, None)
+    reminder_info = await get_user_reminder(user_id)
     
     if reminder_info and reminder_info.get("active", False):
         time = reminder_info.get("time", "20:00")
@@ -550,10 +622,13 @@ async def to_main_menu(callback: CallbackQuery, state: FSMContext):
     logger.info(f"Пользователь {callback.from_user.id} вернулся в главное меню из напоминаний")
 
 # Функция для инициализации асинхронных задач напоминаний
-def setup_async_tasks():
+def setup_async_tasks(bot: Optional[Bot] = None):
     """
     Инициализирует асинхронные задачи для модуля напоминаний.
     
+    Args:
+        bot: Бот, который отправляет напоминания (диспетчер запускается сразу при старте)
+    
     Returns:
         list: Список асинхронных задач для выполнения
     """
@@ -562,7 +637,10 @@ def setup_async_tasks():
         Инициализирует планировщик напоминаний при старте бота.
         """
         logger.info("Инициализация планировщика напоминаний...")
-        if scheduler and not scheduler.running:
+        if bot is not None:
+            start_reminder_dispatcher(bot)
+            logger.info("Диспетчер напоминаний запущен")
+        elif scheduler and not scheduler.running:
             scheduler.start()
             logger.info("Планировщик напоминаний запущен")
     
@@ -570,12 +648,17 @@ def setup_async_tasks():
         """
         Загружает настройки напоминаний из хранилища.
         """
-        global reminder_users
+        if REMINDER_MODE == "pull":
+            logger.info("Напоминания в режиме pull: расписания забираются из хранилища каждую минуту")
+            return
         try:
-            # Можно реализовать загрузку из файла или базы данных
             logger.info("Загрузка настроек напоминаний из хранилища...")
-            # Здесь может быть код для загрузки настроек
-            logger.info("Настройки напоминаний загружены")
+            loaded = await load_reminders()
+            # Настройки, измененные пользователями во время загрузки, не перезаписываем
+            for user_id, reminder in loaded.items():
+                reminder_users.setdefault(user_id, reminder)
+            reminder_index.rebuild(reminder_users)
+            logger.info(f"Настройки напоминаний загружены: {len(reminder_users)}, активных: {len(reminder_index)}")
         except Exception as e:
             logger.error(f"Ошибка при загрузке настроек напоминаний: {e}")
     
@@ -1,3 +1,25 @@
-from services.recs import generate_response
-from services.stt import process_voice_message
-from services.tts import generate_audio
\ No newline at end of file
+"""
+Сервисы бота.
+
+Функции подмодулей (services.generate_response и др.) импортируются при первом
+обращении: импорт любого services.* не подгружает клиентов OpenAI, ElevenLabs
+и распознавания речи.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "generate_response": "services.recs",
+    "process_voice_message": "services.stt",
+    "generate_audio": "services.tts"
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module 'services' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
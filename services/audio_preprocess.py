@@ -0,0 +1,277 @@
+"""
+Подготовка голосовых сообщений к распознаванию.
+
+Аудио декодируется ffmpeg в PCM (16 кГц, моно), после чего простой энергетический
+детектор речи (VAD, без GPU и внешних моделей):
+- отбрасывает записи без речи - распознавание для них не вызывается;
+- обрезает тишину в начале и в конце записи;
+- делит длинные записи (по Voice.duration) на части по паузам, чтобы части
+  распознавались параллельно.
+
+Если ffmpeg не установлен или декодирование не удалось, аудио передается
+на распознавание без изменений.
+"""
+
+import os
+import sys
+import math
+import shutil
+import asyncio
+import logging
+import operator
+from array import array
+from typing import Dict, Any, List, Optional, Tuple
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Путь к ffmpeg (без него предобработка отключается)
+FFMPEG_PATH = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+FFMPEG_AVAILABLE = bool(FFMPEG_PATH)
+if not FFMPEG_AVAILABLE:
+    logger.info("ffmpeg не найден, голосовые сообщения распознаются без предобработки")
+
+# Параметры детектора речи
+VOICE_VAD_ENABLED = os.getenv("VOICE_VAD_ENABLED", "1") == "1"
+VAD_MIN_RMS = float(os.getenv("VOICE_VAD_MIN_RMS", "300"))
+VAD_NOISE_FACTOR = float(os.getenv("VOICE_VAD_NOISE_FACTOR", "2.5"))
+VAD_MIN_SPEECH_MS = int(os.getenv("VOICE_VAD_MIN_SPEECH_MS", "250"))
+VAD_PADDING_MS = int(os.getenv("VOICE_VAD_PADDING_MS", "200"))
+
+# Длинные записи делятся на части не длиннее VOICE_CHUNK_SECONDS,
+# граница ищется в самом тихом месте последних VOICE_SPLIT_SEARCH_SECONDS части
+VOICE_CHUNK_SECONDS = int(os.getenv("VOICE_CHUNK_SECONDS", "60"))
+VOICE_SPLIT_SEARCH_SECONDS = int(os.getenv("VOICE_SPLIT_SEARCH_SECONDS", "5"))
+
+# Обрезанная запись перекодируется, только если это экономит хотя бы столько секунд
+VOICE_TRIM_MIN_SECONDS = float(os.getenv("VOICE_TRIM_MIN_SECONDS", "1.0"))
+
+# Сколько частей перекодируется одновременно (на весь процесс: каждая часть - процесс ffmpeg)
+VOICE_ENCODE_CONCURRENCY = int(os.getenv("VOICE_ENCODE_CONCURRENCY", "4"))
+
+# Формат PCM для анализа и перекодирования
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+FRAME_BYTES = FRAME_SAMPLES * 2
+OPUS_BITRATE = os.getenv("VOICE_OPUS_BITRATE", "24k")
+
+# Статистика предобработки
+preprocess_stats = {
+    "clips": 0,
+    "passthrough": 0,
+    "rejected_silent": 0,
+    "trimmed": 0,
+    "chunked": 0,
+    "chunks": 0,
+    "seconds_in": 0.0,
+    "seconds_out": 0.0,
+    "errors": 0
+}
+
+async def _run_ffmpeg(args: List[str], data: bytes) -> bytes:
+    """
+    Запускает ffmpeg с передачей данных через stdin/stdout.
+    """
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG_PATH, "-hide_banner", "-loglevel", "error", *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate(data)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg завершился с кодом {process.returncode}: {stderr.decode(errors='replace').strip()}")
+    return stdout
+
+async def decode_to_pcm(audio: bytes) -> bytes:
+    """
+    Декодирует аудио в PCM s16le, 16 кГц, моно.
+    """
+    return await _run_ffmpeg(
+        ["-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+        audio
+    )
+
+# Ограничение одновременных перекодирований (создается лениво, внутри работающего event loop)
+_encode_semaphore: Optional[asyncio.Semaphore] = None
+
+async def encode_opus(pcm: bytes) -> bytes:
+    """
+    Кодирует PCM s16le, 16 кГц, моно в OGG/Opus (формат голосовых сообщений Telegram).
+    Одновременно работает не больше VOICE_ENCODE_CONCURRENCY процессов ffmpeg.
+    """
+    global _encode_semaphore
+    if _encode_semaphore is None:
+        _encode_semaphore = asyncio.Semaphore(max(1, VOICE_ENCODE_CONCURRENCY))
+    async with _encode_semaphore:
+        return await _run_ffmpeg(
+            ["-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", "1", "-i", "pipe:0",
+             "-c:a", "libopus", "-b:a", OPUS_BITRATE, "-f", "ogg", "pipe:1"],
+            pcm
+        )
+
+def frame_energies(pcm: bytes) -> List[float]:
+    """
+    Считает среднеквадратичную энергию (RMS) каждого кадра по FRAME_MS.
+
+    Args:
+        pcm: PCM s16le, 16 кГц, моно
+
+    Returns:
+        List[float]: RMS кадров (неполный последний кадр отбрасывается)
+    """
+    samples = array("h")
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+
+    energies = []
+    for start in range(0, len(samples) - FRAME_SAMPLES + 1, FRAME_SAMPLES):
+        frame = samples[start:start + FRAME_SAMPLES]
+        energies.append(math.sqrt(sum(map(operator.mul, frame, frame)) / FRAME_SAMPLES))
+    return energies
+
+def speech_threshold(energies: List[float]) -> float:
+    """
+    Вычисляет порог энергии речи по уровню шума записи.
+
+    Уровень шума - 10-й процентиль энергии кадров. Порог не поднимается выше
+    трети пиковой энергии, чтобы запись сплошной речи не была принята за шум:
+    лишний вызов распознавания дешевле потерянного сообщения.
+    """
+    if not energies:
+        return VAD_MIN_RMS
+    ordered = sorted(energies)
+    noise_floor = ordered[len(ordered) // 10]
+    return max(VAD_MIN_RMS, min(noise_floor * VAD_NOISE_FACTOR, ordered[-1] / 3))
+
+def find_speech_bounds(energies: List[float]) -> Optional[Tuple[int, int]]:
+    """
+    Находит границы речи в записи.
+
+    Args:
+        energies: RMS кадров
+
+    Returns:
+        Optional[Tuple[int, int]]: Номера первого и следующего за последним кадров
+        речи (с отступом VAD_PADDING_MS) или None, если речи в записи нет
+    """
+    threshold = speech_threshold(energies)
+    speech = [index for index, energy in enumerate(energies) if energy >= threshold]
+    if len(speech) * FRAME_MS < VAD_MIN_SPEECH_MS:
+        return None
+
+    padding = VAD_PADDING_MS // FRAME_MS
+    return max(0, speech[0] - padding), min(len(energies), speech[-1] + 1 + padding)
+
+def split_frames(energies: List[float], start: int, end: int, chunk_frames: int, search_frames: int) -> List[Tuple[int, int]]:
+    """
+    Делит диапазон кадров на части не длиннее chunk_frames.
+
+    Граница каждой части - самый тихий кадр среди последних search_frames кадров
+    части, чтобы не разрезать слово.
+
+    Args:
+        energies: RMS кадров
+        start: Первый кадр диапазона
+        end: Кадр, следующий за последним
+        chunk_frames: Максимальная длина части в кадрах
+        search_frames: Окно поиска границы в кадрах
+
+    Returns:
+        List[Tuple[int, int]]: Диапазоны кадров частей
+    """
+    ranges = []
+    position = start
+    while end - position > chunk_frames:
+        window_start = position + max(1, chunk_frames - search_frames)
+        window_end = position + chunk_frames
+        cut = min(range(window_start, window_end), key=energies.__getitem__)
+        ranges.append((position, cut))
+        position = cut
+    ranges.append((position, end))
+    return ranges
+
+async def preprocess_voice(audio: bytes, duration: Optional[int] = None) -> List[bytes]:
+    """
+    Готовит голосовое сообщение к распознаванию.
+
+    Args:
+        audio: Содержимое OGG-файла
+        duration: Длительность из Voice.duration в секундах (если известна)
+
+    Returns:
+        List[bytes]: Части аудио для распознавания (OGG/Opus); пустой список,
+        если в записи нет речи. Без ffmpeg или при ошибке - [audio]
+    """
+    preprocess_stats["clips"] += 1
+    if not VOICE_VAD_ENABLED or not FFMPEG_AVAILABLE:
+        preprocess_stats["passthrough"] += 1
+        return [audio]
+
+    try:
+        pcm = await decode_to_pcm(audio)
+        energies = await asyncio.to_thread(frame_energies, pcm)
+        seconds_in = len(energies) * FRAME_MS / 1000
+        preprocess_stats["seconds_in"] += seconds_in
+
+        bounds = find_speech_bounds(energies)
+        if bounds is None:
+            preprocess_stats["rejected_silent"] += 1
+            logger.info(f"В голосовом сообщении ({seconds_in:.1f} с) не обнаружено речи")
+            return []
+        start, end = bounds
+
+        # Маршрут по длительности: длинные записи делятся на части для параллельного распознавания
+        if (duration or seconds_in) > VOICE_CHUNK_SECONDS:
+            ranges = split_frames(
+                energies, start, end,
+                VOICE_CHUNK_SECONDS * 1000 // FRAME_MS,
+                VOICE_SPLIT_SEARCH_SECONDS * 1000 // FRAME_MS
+            )
+        else:
+            ranges = [(start, end)]
+
+        trimmed_seconds = (len(energies) - (end - start)) * FRAME_MS / 1000
+        if len(ranges) == 1 and trimmed_seconds < VOICE_TRIM_MIN_SECONDS:
+            # Тишины почти нет - перекодирование не окупится
+            preprocess_stats["passthrough"] += 1
+            preprocess_stats["seconds_out"] += seconds_in
+            return [audio]
+
+        chunks = await asyncio.gather(*(
+            encode_opus(pcm[chunk_start * FRAME_BYTES:chunk_end * FRAME_BYTES])
+            for chunk_start, chunk_end in ranges
+        ))
+
+        seconds_out = (end - start) * FRAME_MS / 1000
+        preprocess_stats["seconds_out"] += seconds_out
+        if trimmed_seconds >= VOICE_TRIM_MIN_SECONDS:
+            preprocess_stats["trimmed"] += 1
+        if len(ranges) > 1:
+            preprocess_stats["chunked"] += 1
+        preprocess_stats["chunks"] += len(ranges)
+        logger.info(
+            f"Голосовое сообщение подготовлено: {seconds_in:.1f} с -> {seconds_out:.1f} с, "
+            f"частей: {len(ranges)}, размер {len(audio)} -> {sum(len(chunk) for chunk in chunks)} байт"
+        )
+        return list(chunks)
+    except Exception as e:
+        preprocess_stats["errors"] += 1
+        logger.warning(f"Ошибка предобработки голосового сообщения, распознаем без нее: {e}")
+        return [audio]
+
+def get_preprocess_metrics() -> Dict[str, Any]:
+    """
+    Возвращает статистику предобработки голосовых сообщений.
+
+    Returns:
+        Dict[str, Any]: Счетчики и доля отброшенного аудио
+    """
+    seconds_in = preprocess_stats["seconds_in"]
+    return {
+        **preprocess_stats,
+        "ffmpeg_available": FFMPEG_AVAILABLE,
+        "saved_ratio": 1 - preprocess_stats["seconds_out"] / seconds_in if seconds_in else 0.0
+    }
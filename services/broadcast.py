@@ -0,0 +1,225 @@
+"""
+Массовая рассылка сообщений с соблюдением лимитов Telegram.
+
+Telegram допускает около 30 сообщений в секунду от бота и около одного
+сообщения в секунду в один чат; при превышении API отвечает 429 (RetryAfter).
+FanOutSender отправляет пачку сообщений:
+- через общий token bucket (BROADCAST_RATE сообщений в секунду);
+- с ограничением частоты для каждого чата;
+- с разбросом моментов отправки внутри окна (jitter), чтобы не создавать всплеск;
+- с паузой всей рассылки на время RetryAfter и повтором сообщения.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Any, Callable, Awaitable, Iterable, Optional
+
+from aiogram.exceptions import (
+    TelegramRetryAfter,
+    TelegramForbiddenError,
+    TelegramBadRequest,
+    TelegramNetworkError
+)
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Параметры рассылки (можно переопределить через переменные окружения)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "28"))
+BROADCAST_BURST = int(os.getenv("BROADCAST_BURST", "28"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1.0"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+# Максимальное окно разброса отправки (рассылка напоминаний укладывается в минуту)
+BROADCAST_SPREAD_SECONDS = float(os.getenv("BROADCAST_SPREAD_SECONDS", "50"))
+
+# Отправка одного сообщения: принимает ID чата
+SendFunc = Callable[[int], Awaitable[Any]]
+
+class TokenBucket:
+    """
+    Token bucket: не больше rate операций в секунду с допустимым всплеском capacity.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """
+        Ждет, пока не появится токен, и забирает его.
+        """
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """
+        Приостанавливает выдачу токенов (ответ RetryAfter от Telegram).
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self._updated_at = max(self._updated_at, self._paused_until)
+
+class ChatRateLimiter:
+    """
+    Минимальный интервал между сообщениями в один чат.
+    """
+
+    def __init__(self, interval: float, max_chats: int = 10000):
+        self.interval = interval
+        self.max_chats = max_chats
+        self._next_allowed: Dict[int, float] = {}
+
+    async def wait(self, chat_id: int):
+        now = time.monotonic()
+        next_allowed = self._next_allowed.get(chat_id, 0.0)
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+            now = time.monotonic()
+        self._next_allowed[chat_id] = now + self.interval
+        if len(self._next_allowed) > self.max_chats:
+            # Убираем чаты, для которых ограничение уже истекло
+            self._next_allowed = {cid: t for cid, t in self._next_allowed.items() if t > now}
+
+class FanOutSender:
+    """
+    Рассылка пачки сообщений с ограничением скорости и повторами.
+    """
+
+    def __init__(
+        self,
+        rate: float = BROADCAST_RATE,
+        burst: int = BROADCAST_BURST,
+        per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        max_retries: int = BROADCAST_MAX_RETRIES,
+        spread_seconds: float = BROADCAST_SPREAD_SECONDS,
+        name: str = "broadcast"
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.chat_limiter = ChatRateLimiter(per_chat_interval)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.spread_seconds = spread_seconds
+        self.name = name
+        self.stats = {
+            "batches": 0, "sent": 0, "failed": 0, "blocked": 0, "retried": 0,
+            "retry_after": 0, "max_batch_seconds": 0.0, "max_lateness": 0.0
+        }
+
+    def spread_window(self, count: int) -> float:
+        """
+        Окно разброса для пачки: не больше spread_seconds и не больше времени,
+        за которое пачка уходит на полной скорости (маленькие пачки не задерживаются).
+        """
+        return min(self.spread_seconds, count / self.bucket.rate)
+
+    async def send_all(self, chat_ids: Iterable[int], send: SendFunc, rng: Optional[random.Random] = None) -> Dict[str, int]:
+        """
+        Отправляет сообщения во все чаты.
+
+        Args:
+            chat_ids: ID чатов
+            send: Функция отправки одного сообщения
+            rng: Генератор случайных чисел для разброса (для тестов)
+
+        Returns:
+            Dict[str, int]: Итоги пачки: sent, failed, blocked
+        """
+        chat_ids = list(chat_ids)
+        result = {"sent": 0, "failed": 0, "blocked": 0}
+        if not chat_ids:
+            return result
+
+        rng = rng or random
+        window = self.spread_window(len(chat_ids))
+        # Момент отправки каждого сообщения - случайная точка окна
+        schedule = sorted((rng.uniform(0, window), chat_id) for chat_id in chat_ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in schedule:
+            queue.put_nowait(item)
+
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+
+        async def worker():
+            while not queue.empty():
+                offset, chat_id = queue.get_nowait()
+                delay = started_at + offset - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                outcome = await self._deliver(chat_id, send)
+                result[outcome] += 1
+                self.stats["max_lateness"] = max(self.stats["max_lateness"], loop.time() - started_at - offset)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(chat_ids)))))
+
+        elapsed = loop.time() - started_at
+        self.stats["batches"] += 1
+        self.stats["max_batch_seconds"] = max(self.stats["max_batch_seconds"], elapsed)
+        for key, value in result.items():
+            self.stats[key] += value
+        logger.info(
+            f"Рассылка [{self.name}]: {len(chat_ids)} сообщений за {elapsed:.1f} с, "
+            f"доставлено {result['sent']}, заблокировали бота {result['blocked']}, ошибок {result['failed']}"
+        )
+        return result
+
+    async def _deliver(self, chat_id: int, send: SendFunc) -> str:
+        for attempt in range(self.max_retries + 1):
+            await self.chat_limiter.wait(chat_id)
+            await self.bucket.acquire()
+            try:
+                await send(chat_id)
+                return "sent"
+            except TelegramRetryAfter as e:
+                # Превышен лимит: останавливаем всю рассылку на указанное время
+                self.stats["retry_after"] += 1
+                self.bucket.pause(e.retry_after)
+                logger.warning(f"Рассылка [{self.name}]: RetryAfter {e.retry_after} с (чат {chat_id})")
+            except TelegramForbiddenError:
+                # Пользователь заблокировал бота - повтор бесполезен
+                return "blocked"
+            except TelegramBadRequest as e:
+                logger.error(f"Рассылка [{self.name}]: сообщение в чат {chat_id} отклонено: {e}")
+                return "failed"
+            except (TelegramNetworkError, asyncio.TimeoutError) as e:
+                logger.warning(f"Рассылка [{self.name}]: сетевая ошибка для чата {chat_id}: {e}")
+                await asyncio.sleep(min(2 ** attempt, 10))
+            except Exception as e:
+                logger.error(f"Рассылка [{self.name}]: ошибка при отправке в чат {chat_id}: {e}")
+                return "failed"
+            if attempt < self.max_retries:
+                self.stats["retried"] += 1
+        logger.error(f"Рассылка [{self.name}]: не удалось отправить сообщение в чат {chat_id} после {self.max_retries} повторов")
+        return "failed"
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику рассылок.
+
+        Returns:
+            Dict[str, Any]: Счетчики доставки, повторов и задержек
+        """
+        return dict(self.stats)
+
+# Рассылка напоминаний
+reminder_sender = FanOutSender(name="reminders")
@@ -0,0 +1,287 @@
+"""
+Сборка контекста диалога для OpenAI с учетом бюджета токенов.
+
+История переписки упаковывается в запрос от новых сообщений к старым, пока
+хватает бюджета. Сообщения, вытесненные из хранимой истории, постепенно
+сворачиваются в краткое резюме, которое передается модели вместо них.
+"""
+
+import os
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from services.openai_client import get_openai_client
+from services.openai_limiter import call_openai
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# tiktoken необязателен: без него используется приближенный подсчет
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+    logger.warning("Библиотека tiktoken не установлена, токены будут считаться приближенно")
+
+# Модель, для которой считаются токены по умолчанию
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+# Полный бюджет запроса (контекст модели за вычетом запаса на ответ)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "12000"))
+# Запас токенов на ответ модели
+COMPLETION_RESERVE_TOKENS = int(os.getenv("COMPLETION_RESERVE_TOKENS", "1500"))
+# Максимум токенов истории в одном запросе
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+# Максимум токенов истории, хранимой в состоянии пользователя
+HISTORY_STORE_TOKENS = int(os.getenv("HISTORY_STORE_TOKENS", "3000"))
+# Максимум записей истории в состоянии пользователя
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", "20"))
+# Максимальный размер резюме старой части диалога
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+
+# Служебные токены на каждое сообщение в формате chat
+MESSAGE_OVERHEAD_TOKENS = 4
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    """
+    Возвращает (кэшированную) кодировку tiktoken для модели.
+
+    tiktoken скачивает файл кодировки при первом обращении; если это
+    не удалось (нет сети), кэшируется None и используется приближенный подсчет.
+    """
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Не удалось загрузить кодировку tiktoken для {model}, токены будут считаться приближенно: {e}")
+        return None
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """
+    Считает количество токенов в тексте.
+
+    Args:
+        text: Текст
+        model: Модель OpenAI, для которой считаются токены
+
+    Returns:
+        int: Количество токенов
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # Приближенная оценка: ~4 байта UTF-8 на токен (для кириллицы ~2 символа)
+    return (len(text.encode("utf-8")) + 3) // 4
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = DEFAULT_MODEL) -> int:
+    """
+    Считает токены списка сообщений в формате chat.
+
+    Args:
+        messages: Сообщения с ключами role и content
+        model: Модель OpenAI
+
+    Returns:
+        int: Количество токенов
+    """
+    return sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = DEFAULT_MODEL, keep_end: bool = False) -> str:
+    """
+    Обрезает текст до заданного числа токенов.
+
+    Args:
+        text: Текст
+        max_tokens: Максимальное число токенов
+        model: Модель OpenAI
+        keep_end: True - сохранить конец текста, False - начало
+
+    Returns:
+        str: Обрезанный текст
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        tokens = tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+        return encoding.decode(tokens)
+    # Без tiktoken обрезаем по символам пропорционально оценке
+    ratio = max_tokens / count_tokens(text, model)
+    length = max(1, int(len(text) * ratio))
+    return text[-length:] if keep_end else text[:length]
+
+def pack_history(
+    history: Optional[List[Dict[str, str]]],
+    budget: int = HISTORY_TOKEN_BUDGET,
+    model: str = DEFAULT_MODEL
+) -> List[Dict[str, str]]:
+    """
+    Отбирает последние сообщения истории, помещающиеся в бюджет токенов.
+
+    Args:
+        history: История переписки (от старых к новым)
+        budget: Бюджет токенов для истории
+        model: Модель OpenAI
+
+    Returns:
+        List[Dict[str, str]]: Сообщения истории в хронологическом порядке
+    """
+    packed = []
+    used = 0
+    for entry in reversed(history or []):
+        cost = count_tokens(entry.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS
+        if used + cost > budget:
+            break
+        packed.append(entry)
+        used += cost
+    packed.reverse()
+    # История не должна начинаться с ответа ассистента без вопроса
+    if packed and packed[0].get("role") == "assistant":
+        packed = packed[1:]
+    return packed
+
+def build_messages(
+    system_prompt: str,
+    message_text: str,
+    history: Optional[List[Dict[str, str]]] = None,
+    summary: Optional[str] = None,
+    model: str = DEFAULT_MODEL
+) -> List[Dict[str, str]]:
+    """
+    Собирает сообщения запроса: системный промпт, резюме, историю и сообщение пользователя.
+
+    Args:
+        system_prompt: Системный промпт
+        message_text: Текущее сообщение пользователя
+        history: История переписки (опционально)
+        summary: Резюме ранней части диалога (опционально)
+        model: Модель OpenAI
+
+    Returns:
+        List[Dict[str, str]]: Сообщения для chat.completions
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    if summary:
+        messages.append({"role": "system", "content": f"Краткое содержание предыдущего диалога:\n{summary}"})
+    user_message = {"role": "user", "content": message_text}
+
+    # История получает то, что осталось от общего бюджета, но не больше HISTORY_TOKEN_BUDGET
+    fixed_tokens = count_message_tokens(messages + [user_message], model)
+    available = CONTEXT_TOKEN_BUDGET - COMPLETION_RESERVE_TOKENS - fixed_tokens
+    history_budget = max(0, min(HISTORY_TOKEN_BUDGET, available))
+
+    messages.extend(pack_history(history, history_budget, model))
+    messages.append(user_message)
+    return messages
+
+def _extractive_summary(summary: Optional[str], turns: List[Dict[str, str]]) -> str:
+    """
+    Локальное резюме без обращения к API: первые фразы вытесненных сообщений.
+    """
+    parts = []
+    for entry in turns:
+        content = (entry.get("content") or "").strip().replace("\n", " ")
+        if not content:
+            continue
+        speaker = "Пользователь" if entry.get("role") == "user" else "Ассистент"
+        parts.append(f"{speaker}: {content[:120]}")
+    combined = "\n".join(filter(None, [summary] + parts))
+    return truncate_to_tokens(combined, SUMMARY_MAX_TOKENS, keep_end=True)
+
+async def summarize_turns(summary: Optional[str], turns: List[Dict[str, str]]) -> str:
+    """
+    Дополняет резюме диалога вытесненными сообщениями.
+
+    Args:
+        summary: Текущее резюме (может быть пустым)
+        turns: Сообщения, вытесненные из истории
+
+    Returns:
+        str: Обновленное резюме
+    """
+    if not turns:
+        return summary or ""
+
+    client = get_openai_client("context")
+    if not client:
+        return _extractive_summary(summary, turns)
+
+    dialog = "\n".join(
+        f"{'Пользователь' if t.get('role') == 'user' else 'Ассистент'}: {t.get('content', '')}" for t in turns
+    )
+    try:
+        response = await call_openai(
+            client.chat.completions.create,
+            caller="context",
+            model=DEFAULT_MODEL,
+            temperature=0.2,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Обнови краткое резюме диалога психолога с пользователем. "
+                               "Сохрани важные факты о пользователе, его запросы и договоренности. "
+                               "Пиши на русском языке, не более 5 предложений."
+                },
+                {
+                    "role": "user",
+                    "content": f"Текущее резюме:\n{summary or '(пусто)'}\n\nНовые сообщения:\n{dialog}"
+                }
+            ]
+        )
+        new_summary = (response.choices[0].message.content or "").strip()
+        if new_summary:
+            return truncate_to_tokens(new_summary, SUMMARY_MAX_TOKENS)
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении резюме диалога: {e}")
+    return _extractive_summary(summary, turns)
+
+async def compact_history(
+    history: List[Dict[str, str]],
+    summary: Optional[str] = None,
+    max_entries: int = HISTORY_MAX_ENTRIES,
+    max_tokens: int = HISTORY_STORE_TOKENS,
+    model: str = DEFAULT_MODEL
+) -> Tuple[List[Dict[str, str]], str]:
+    """
+    Ограничивает хранимую историю и сворачивает вытесненные сообщения в резюме.
+
+    Args:
+        history: История переписки (от старых к новым)
+        summary: Текущее резюме
+        max_entries: Максимум хранимых записей
+        max_tokens: Максимум токенов хранимой истории
+        model: Модель OpenAI
+
+    Returns:
+        Tuple[List[Dict[str, str]], str]: Сокращенная история и обновленное резюме
+    """
+    history = list(history or [])
+    if len(history) <= max_entries and count_message_tokens(history, model) <= max_tokens:
+        return history, summary or ""
+
+    # При переполнении освобождаем половину лимита, чтобы резюме обновлялось
+    # раз в несколько реплик, а не на каждом сообщении
+    evicted = []
+    while history and (len(history) > max_entries // 2 or count_message_tokens(history, model) > max_tokens // 2):
+        # Вытесняем парами (вопрос и ответ), чтобы не разрывать реплики
+        evicted.extend(history[:2])
+        history = history[2:]
+
+    if not evicted:
+        return history, summary or ""
+
+    logger.info(f"Сворачиваем {len(evicted)} сообщений истории в резюме")
+    return history, await summarize_turns(summary, evicted)
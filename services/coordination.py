@@ -0,0 +1,314 @@
+"""
+Согласование нескольких экземпляров бота.
+
+В режиме INSTANCE_MODE=multi можно запустить несколько процессов бота
+(за балансировщиком webhook или с общим хранилищем). Тогда:
+- обязанности, которые должен выполнять один процесс (ежеминутный диспетчер
+  напоминаний), выполняет только лидер - владелец аренды (lease) с TTL;
+  если лидер пропал, аренду через TTL забирает другой экземпляр;
+- состояние FSM хранится в Redis (REDIS_URL), чтобы шаги диалога
+  пользователя могли обрабатывать разные экземпляры.
+
+Аренда хранится в Redis или, как локальная замена для тестов и запуска на
+одной машине, в SQLite-файле COORDINATION_DB_PATH.
+
+В режиме single (по умолчанию) экземпляр один и всегда считается лидером.
+Рабочие процессы WORKER_PROCESSES супервизор запускает в режиме multi
+(services.sharding.configure_worker_environment).
+"""
+
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+# Проверка наличия клиента Redis
+try:
+    from redis.asyncio import Redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Режим запуска: "single" (один экземпляр) или "multi" (несколько экземпляров)
+INSTANCE_MODE = os.getenv("INSTANCE_MODE", "single").lower()
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+# Параметры согласования (можно переопределить через переменные окружения)
+REDIS_URL = os.getenv("REDIS_URL", "")
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "redis" if REDIS_URL else "sqlite").lower()
+COORDINATION_DB_PATH = os.getenv("COORDINATION_DB_PATH", "coordination.db")
+LEASE_TTL = float(os.getenv("LEASE_TTL", "30"))
+# Запас до истечения аренды, после которого лидер перестает выполнять обязанности
+LEASE_SAFETY_MARGIN = 0.2
+
+class SQLiteLeaseBackend:
+    """
+    Аренды в SQLite-файле: работает для процессов на одной машине (или с общим диском).
+    """
+
+    def __init__(self, path: str = COORDINATION_DB_PATH):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        """
+        Получает или продлевает аренду: успешно, если она свободна,
+        истекла или уже принадлежит holder.
+        """
+        now = time.time()
+        connection = self._connect()
+        cursor = connection.execute(
+            "INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE leases.holder = excluded.holder OR leases.expires_at < ?",
+            (name, holder, now + ttl, now)
+        )
+        connection.commit()
+        return cursor.rowcount == 1
+
+    async def release(self, name: str, holder: str):
+        connection = self._connect()
+        connection.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+        connection.commit()
+
+    async def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+class RedisLeaseBackend:
+    """
+    Аренды в Redis: SET NX PX для захвата, Lua-скрипты для продления и
+    освобождения только своей аренды.
+    """
+
+    _RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "ona:lease:"):
+        self.redis = Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        key = self.prefix + name
+        ttl_ms = int(ttl * 1000)
+        if await self.redis.set(key, holder, nx=True, px=ttl_ms):
+            return True
+        return bool(await self.redis.eval(self._RENEW, 1, key, holder, ttl_ms))
+
+    async def release(self, name: str, holder: str):
+        await self.redis.eval(self._RELEASE, 1, self.prefix + name, holder)
+
+    async def close(self):
+        # aclose появился в redis 5, в более ранних версиях - close
+        close = getattr(self.redis, "aclose", None) or self.redis.close
+        await close()
+
+def create_lease_backend(kind: str = COORDINATION_BACKEND):
+    """
+    Создает хранилище аренд; если Redis недоступен, используется SQLite.
+
+    Args:
+        kind: "redis" или "sqlite"
+
+    Returns:
+        Хранилище с методами acquire, release и close
+    """
+    if kind == "redis":
+        if REDIS_AVAILABLE and REDIS_URL:
+            logger.info("Аренды лидера хранятся в Redis")
+            return RedisLeaseBackend(REDIS_URL)
+        logger.warning(f"Redis недоступен для аренд, используем {COORDINATION_DB_PATH}")
+    logger.info(f"Аренды лидера хранятся в локальном файле {COORDINATION_DB_PATH}")
+    return SQLiteLeaseBackend(COORDINATION_DB_PATH)
+
+class LeaderElector:
+    """
+    Выбор лидера для одной обязанности через аренду с TTL.
+
+    Экземпляр пытается получить аренду каждые ttl/3 секунд; лидер ее продлевает.
+    Лидером экземпляр считает себя только пока аренда гарантированно не истекла
+    (по локальным монотонным часам), поэтому при потере связи с хранилищем
+    два лидера одновременно не появятся.
+    """
+
+    def __init__(self, backend, name: str, instance_id: str = INSTANCE_ID, ttl: float = LEASE_TTL):
+        self.backend = backend
+        self.name = name
+        self.instance_id = instance_id
+        self.ttl = ttl
+        self.renew_interval = ttl / 3
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"elections": 0, "renewals": 0, "losses": 0, "errors": 0}
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def step(self) -> bool:
+        """
+        Одна попытка получить или продлить аренду.
+
+        Returns:
+            bool: True, если экземпляр - лидер
+        """
+        was_leader = self.is_leader
+        started_at = time.monotonic()
+        try:
+            acquired = await self.backend.acquire(self.name, self.instance_id, self.ttl)
+        except Exception as e:
+            # Лидерство сохраняется, пока не истек срок уже полученной аренды
+            self.stats["errors"] += 1
+            logger.error(f"Ошибка при продлении аренды {self.name}: {e}")
+            return self.is_leader
+        if acquired:
+            # Отсчет от начала запроса: аренда в хранилище могла начаться раньше ответа
+            self._valid_until = started_at + self.ttl * (1 - LEASE_SAFETY_MARGIN)
+            if was_leader:
+                self.stats["renewals"] += 1
+            else:
+                self.stats["elections"] += 1
+                logger.info(f"Экземпляр {self.instance_id} стал лидером для {self.name}")
+        else:
+            # Аренду держит другой экземпляр
+            self._valid_until = 0.0
+            if was_leader:
+                self.stats["losses"] += 1
+                logger.warning(f"Экземпляр {self.instance_id} потерял лидерство для {self.name}")
+        return self.is_leader
+
+    async def _run(self):
+        while True:
+            await self.step()
+            await asyncio.sleep(self.renew_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает выборы и освобождает аренду, чтобы другой экземпляр
+        стал лидером сразу, не дожидаясь TTL.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            try:
+                await self.backend.release(self.name, self.instance_id)
+            except Exception as e:
+                logger.error(f"Ошибка при освобождении аренды {self.name}: {e}")
+        self._valid_until = 0.0
+
+# Выборы по обязанностям и общее хранилище аренд (создаются при первом обращении)
+_electors: Dict[str, LeaderElector] = {}
+_backend = None
+
+def register_duty(name: str) -> Optional[LeaderElector]:
+    """
+    Регистрирует обязанность, которую выполняет только лидер, и запускает выборы.
+    Вызывается из работающего event loop; в режиме single ничего не делает.
+
+    Args:
+        name: Имя обязанности (имя аренды)
+
+    Returns:
+        Optional[LeaderElector]: Выборы для обязанности (None в режиме single)
+    """
+    global _backend
+    if INSTANCE_MODE != "multi":
+        return None
+    if name not in _electors:
+        if _backend is None:
+            _backend = create_lease_backend()
+        _electors[name] = LeaderElector(_backend, name)
+        _electors[name].start()
+    return _electors[name]
+
+def is_leader(name: str) -> bool:
+    """
+    Проверяет, должен ли этот экземпляр выполнять обязанность.
+
+    Args:
+        name: Имя обязанности
+
+    Returns:
+        bool: True в режиме single или если экземпляр - лидер
+    """
+    if INSTANCE_MODE != "multi":
+        return True
+    elector = _electors.get(name)
+    return elector is not None and elector.is_leader
+
+def get_coordination_metrics() -> Dict[str, Any]:
+    """
+    Возвращает состояние выборов по обязанностям.
+
+    Returns:
+        Dict[str, Any]: Режим, ID экземпляра и статистика выборов
+    """
+    return {
+        "mode": INSTANCE_MODE,
+        "instance_id": INSTANCE_ID,
+        "duties": {name: {"leader": e.is_leader, **e.stats} for name, e in _electors.items()}
+    }
+
+async def stop_coordination():
+    """
+    Останавливает выборы и освобождает аренды (вызывается при завершении работы).
+    """
+    global _backend
+    for elector in list(_electors.values()):
+        await elector.stop()
+    _electors.clear()
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Создает хранилище состояний FSM.
+
+    При заданном REDIS_URL используется RedisStorage: шаги диалога доступны
+    всем экземплярам бота. Иначе - MemoryStorage (только для одного экземпляра).
+
+    Returns:
+        BaseStorage: Хранилище FSM
+    """
+    if REDIS_URL and REDIS_AVAILABLE:
+        from aiogram.fsm.storage.redis import RedisStorage
+        logger.info("Состояния FSM хранятся в Redis")
+        return RedisStorage.from_url(REDIS_URL)
+    if INSTANCE_MODE == "multi":
+        logger.warning(
+            "Режим нескольких экземпляров без Redis: состояния FSM хранятся в памяти процесса, "
+            "шаги диалога одного пользователя должны попадать на один экземпляр"
+        )
+    return MemoryStorage()
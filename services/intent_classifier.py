@@ -0,0 +1,323 @@
+"""
+Локальный классификатор намерений пользователя.
+
+Линейная модель (мультиклассовая логистическая регрессия) на TF-IDF признаках
+хэшированных символьных n-грамм. Модель хранится небольшим JSON-файлом и отвечает за
+микросекунды; к OpenAI (detect_intent_with_ai) обращаемся только тогда, когда
+уверенность модели ниже порога.
+
+Обучение:
+    python -m services.intent_classifier train [журнал.jsonl ...]
+
+Обучающая выборка - services/intent_seed.jsonl плюс журналы размеченных
+сообщений (ответы OpenAI пишутся в INTENT_TRAINING_LOG, если он задан).
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import random
+import logging
+import zlib
+from typing import Dict, Any, Optional, List, Tuple, Iterable
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+_SERVICES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Пути к модели, исходной выборке и журналу размеченных сообщений
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", os.path.join(_SERVICES_DIR, "intent_model.json"))
+INTENT_SEED_PATH = os.path.join(_SERVICES_DIR, "intent_seed.jsonl")
+INTENT_TRAINING_LOG = os.getenv("INTENT_TRAINING_LOG", "")
+
+# Минимальная уверенность локальной модели, при которой OpenAI не вызывается
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.6"))
+
+# Диапазон длин символьных n-грамм
+NGRAM_RANGE = (2, 4)
+
+# Размерность хэшированного пространства признаков (размер модели не зависит от словаря)
+FEATURE_DIMENSIONS = 1024
+
+# Версия формата модели
+MODEL_VERSION = 1
+
+_NON_WORD_RE = re.compile(r"[^\w\s?!]+")
+
+def _tokenize(text: str) -> List[str]:
+    """
+    Нормализует текст и разбивает его на слова (знаки ? и ! сохраняются как слова).
+    """
+    text = text.lower().replace("ё", "е")
+    text = _NON_WORD_RE.sub(" ", text)
+    text = text.replace("?", " ? ").replace("!", " ! ")
+    return text.split()
+
+def extract_features(text: str) -> Dict[int, int]:
+    """
+    Считает хэшированные символьные n-граммы слов текста.
+
+    Args:
+        text: Текст сообщения
+
+    Returns:
+        Dict[int, int]: Индекс признака -> количество вхождений
+    """
+    counts: Dict[int, int] = {}
+    for word in _tokenize(text):
+        padded = f" {word} "
+        for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+            for i in range(len(padded) - n + 1):
+                index = zlib.crc32(padded[i:i + n].encode("utf-8")) % FEATURE_DIMENSIONS
+                counts[index] = counts.get(index, 0) + 1
+    return counts
+
+class IntentClassifier:
+    """
+    Линейный классификатор намерений на TF-IDF признаках.
+    """
+
+    def __init__(self, labels: List[str], idf: List[float], weights: List[List[float]], bias: List[float]):
+        self.labels = labels
+        self.idf = idf
+        # weights[k][i] - вес признака i для намерения labels[k]
+        self.weights = weights
+        self.bias = bias
+
+    def vectorize(self, text: str) -> Dict[int, float]:
+        """
+        Строит нормированный разреженный TF-IDF вектор.
+        """
+        vector = {
+            index: (1.0 + math.log(count)) * self.idf[index]
+            for index, count in extract_features(text).items()
+        }
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        if norm:
+            for index in vector:
+                vector[index] /= norm
+        return vector
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        """
+        Возвращает вероятности всех намерений.
+
+        Args:
+            text: Текст сообщения
+
+        Returns:
+            Dict[str, float]: Намерение -> вероятность
+        """
+        probabilities = _softmax(self._scores(self.vectorize(text)))
+        return dict(zip(self.labels, probabilities))
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """
+        Определяет наиболее вероятное намерение.
+
+        Args:
+            text: Текст сообщения
+
+        Returns:
+            Tuple[str, float]: Намерение и уверенность (вероятность)
+        """
+        probabilities = self.predict_proba(text)
+        intent = max(probabilities, key=probabilities.get)
+        return intent, probabilities[intent]
+
+    def _scores(self, vector: Dict[int, float]) -> List[float]:
+        return [
+            bias + sum(value * label_weights[index] for index, value in vector.items())
+            for label_weights, bias in zip(self.weights, self.bias)
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": MODEL_VERSION,
+            "dimensions": FEATURE_DIMENSIONS,
+            "labels": self.labels,
+            "idf": self.idf,
+            "weights": self.weights,
+            "bias": self.bias
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IntentClassifier":
+        if data.get("version") != MODEL_VERSION or data.get("dimensions") != FEATURE_DIMENSIONS:
+            raise ValueError(
+                f"Неподдерживаемый формат модели намерений: версия {data.get('version')}, "
+                f"размерность {data.get('dimensions')}"
+            )
+        return cls(data["labels"], data["idf"], data["weights"], data["bias"])
+
+    def save(self, path: str = INTENT_MODEL_PATH):
+        """
+        Сохраняет модель в JSON-файл.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str = INTENT_MODEL_PATH) -> "IntentClassifier":
+        """
+        Загружает модель из JSON-файла.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+def _softmax(scores: List[float]) -> List[float]:
+    top = max(scores)
+    exps = [math.exp(score - top) for score in scores]
+    total = sum(exps)
+    return [value / total for value in exps]
+
+def train_classifier(
+    samples: List[Tuple[str, str]],
+    epochs: int = 30,
+    learning_rate: float = 0.5,
+    l2: float = 1e-4
+) -> IntentClassifier:
+    """
+    Обучает классификатор стохастическим градиентным спуском (softmax-регрессия).
+
+    Args:
+        samples: Пары (текст, намерение)
+        epochs: Количество эпох
+        learning_rate: Шаг градиентного спуска
+        l2: Коэффициент L2-регуляризации
+
+    Returns:
+        IntentClassifier: Обученная модель
+    """
+    labels = sorted({intent for _, intent in samples})
+    label_index = {label: k for k, label in enumerate(labels)}
+
+    # IDF по обучающей выборке
+    document_frequency = [0] * FEATURE_DIMENSIONS
+    for text, _ in samples:
+        for index in extract_features(text):
+            document_frequency[index] += 1
+    total = len(samples)
+    idf = [math.log((1 + total) / (1 + df)) + 1.0 for df in document_frequency]
+
+    model = IntentClassifier(
+        labels,
+        idf,
+        [[0.0] * FEATURE_DIMENSIONS for _ in labels],
+        [0.0] * len(labels)
+    )
+    vectors = [(model.vectorize(text), label_index[intent]) for text, intent in samples]
+    # Фиксированное зерно: повторное обучение на тех же данных дает ту же модель
+    rng = random.Random(0)
+
+    for _ in range(epochs):
+        rng.shuffle(vectors)
+        for vector, target in vectors:
+            probabilities = _softmax(model._scores(vector))
+            for k, label_weights in enumerate(model.weights):
+                gradient = probabilities[k] - (1.0 if k == target else 0.0)
+                model.bias[k] -= learning_rate * gradient
+                for index, value in vector.items():
+                    weight = label_weights[index]
+                    label_weights[index] = weight - learning_rate * (gradient * value + l2 * weight)
+
+    # Компактный артефакт: веса с тремя знаками после запятой
+    model.idf = [round(value, 3) for value in model.idf]
+    model.weights = [[round(weight, 3) for weight in label_weights] for label_weights in model.weights]
+    model.bias = [round(value, 3) for value in model.bias]
+    return model
+
+def load_samples(paths: Iterable[str]) -> List[Tuple[str, str]]:
+    """
+    Читает размеченные сообщения из JSONL-файлов (поля text и intent).
+
+    Args:
+        paths: Пути к файлам
+
+    Returns:
+        List[Tuple[str, str]]: Пары (текст, намерение)
+    """
+    samples = []
+    for path in paths:
+        if not os.path.exists(path):
+            logger.warning(f"Файл с размеченными сообщениями не найден: {path}")
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    samples.append((record["text"], record["intent"]))
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Пропущена некорректная строка в {path}: {e}")
+    return samples
+
+def log_labeled_message(text: str, intent: str):
+    """
+    Добавляет сообщение с намерением, определенным OpenAI, в журнал для дообучения.
+    Журнал ведется только если задана переменная окружения INTENT_TRAINING_LOG.
+
+    Args:
+        text: Текст сообщения
+        intent: Намерение
+    """
+    if not INTENT_TRAINING_LOG:
+        return
+    try:
+        with open(INTENT_TRAINING_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"text": text, "intent": intent}, ensure_ascii=False) + "\n")
+    except Exception as e:
+        logger.error(f"Ошибка при записи журнала намерений: {e}")
+
+# Загруженная модель (None - еще не загружалась, False - недоступна)
+_classifier: Any = None
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """
+    Возвращает локальную модель намерений (загружается при первом обращении).
+
+    Returns:
+        Optional[IntentClassifier]: Модель или None, если файл модели недоступен
+    """
+    global _classifier
+    if _classifier is None:
+        try:
+            _classifier = IntentClassifier.load(INTENT_MODEL_PATH)
+            logger.info(f"Локальная модель намерений загружена из {INTENT_MODEL_PATH}")
+        except Exception as e:
+            logger.warning(f"Локальная модель намерений недоступна ({e}), намерения определяются через OpenAI")
+            _classifier = False
+    return _classifier or None
+
+def classify_intent(text: str) -> Optional[Tuple[str, float]]:
+    """
+    Определяет намерение локальной моделью.
+
+    Args:
+        text: Текст сообщения
+
+    Returns:
+        Optional[Tuple[str, float]]: Намерение и уверенность или None, если модель недоступна
+    """
+    classifier = get_intent_classifier()
+    if classifier is None:
+        return None
+    return classifier.predict(text)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] != "train":
+        print("Использование: python -m services.intent_classifier train [журнал.jsonl ...]")
+        sys.exit(1)
+    training_samples = load_samples([INTENT_SEED_PATH] + sys.argv[2:])
+    trained = train_classifier(training_samples)
+    trained.save(INTENT_MODEL_PATH)
+    correct = sum(1 for text, intent in training_samples if trained.predict(text)[0] == intent)
+    print(f"Модель сохранена в {INTENT_MODEL_PATH}: {len(training_samples)} примеров, "
+          f"точность на обучающей выборке {correct / len(training_samples):.2%}, "
+          f"{FEATURE_DIMENSIONS} признаков")
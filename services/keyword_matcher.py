@@ -0,0 +1,162 @@
+"""
+Поиск ключевых слов в тексте автоматом Ахо-Корасик.
+
+Автомат строится один раз из словаря {метка: [маркеры]} и за один проход по
+тексту находит все вхождения всех маркеров. Результат - взвешенные баллы по
+меткам, поэтому классификация не зависит от порядка проверки маркеров.
+"""
+
+import logging
+from collections import deque
+from typing import Dict, List, Optional, Iterable, Tuple
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+class KeywordAutomaton:
+    """
+    Автомат Ахо-Корасик для поиска маркеров с метками и весами.
+    """
+
+    def __init__(self):
+        # Переходы, ссылки неудачи и выходы для каждого состояния (0 - корень)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Выход состояния: список (метка, маркер, вес, только целое слово)
+        self._output: List[List[Tuple[str, str, float, bool]]] = [[]]
+        # Порядок меток: при равенстве баллов побеждает метка, добавленная раньше
+        self.labels: List[str] = []
+        self._built = False
+
+    def add(self, label: str, pattern: str, weight: float = 1.0, whole_word: bool = False):
+        """
+        Добавляет маркер в автомат.
+
+        Args:
+            label: Метка (намерение, фокус, тип личности)
+            pattern: Маркер (подстрока или фраза), регистр не учитывается
+            weight: Вес одного вхождения маркера
+            whole_word: Засчитывать маркер только как отдельное слово
+        """
+        if self._built:
+            raise RuntimeError("Нельзя добавлять маркеры после построения автомата")
+        pattern = pattern.lower()
+        if not pattern:
+            return
+        if label not in self.labels:
+            self.labels.append(label)
+
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((label, pattern, weight, whole_word))
+
+    def add_many(self, markers: Dict[str, Iterable[str]], weights: Optional[Dict[str, float]] = None,
+                 whole_words: Iterable[str] = ()):
+        """
+        Добавляет маркеры из словаря {метка: [маркеры]}.
+
+        Args:
+            markers: Маркеры по меткам
+            weights: Веса отдельных маркеров (по умолчанию 1.0)
+            whole_words: Маркеры, которые засчитываются только как отдельные слова
+        """
+        weights = weights or {}
+        whole_words = set(whole_words)
+        for label, patterns in markers.items():
+            for pattern in patterns:
+                self.add(label, pattern, weights.get(pattern, 1.0), pattern in whole_words)
+
+    def build(self) -> "KeywordAutomaton":
+        """
+        Вычисляет ссылки неудачи обходом в ширину.
+
+        Returns:
+            KeywordAutomaton: Этот же автомат (для цепочек вызовов)
+        """
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                # Выход состояния включает выходы по ссылке неудачи
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._built = True
+        return self
+
+    def find_all(self, text: str) -> List[Tuple[str, str, float, int]]:
+        """
+        Находит все вхождения маркеров за один проход по тексту.
+
+        Args:
+            text: Текст для поиска
+
+        Returns:
+            List[Tuple[str, str, float, int]]: (метка, маркер, вес, позиция начала)
+        """
+        if not self._built:
+            self.build()
+        text = text.lower()
+        goto, fail, output = self._goto, self._fail, self._output
+        hits = []
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for label, pattern, weight, whole_word in output[state]:
+                start = position - len(pattern) + 1
+                if whole_word and not _is_whole_word(text, start, position + 1):
+                    continue
+                hits.append((label, pattern, weight, start))
+        return hits
+
+    def score(self, text: str) -> Dict[str, float]:
+        """
+        Суммирует веса найденных маркеров по меткам.
+
+        Args:
+            text: Текст для анализа
+
+        Returns:
+            Dict[str, float]: Балл для каждой найденной метки
+        """
+        scores: Dict[str, float] = {}
+        for label, _, weight, _ in self.find_all(text):
+            scores[label] = scores.get(label, 0.0) + weight
+        return scores
+
+    def best(self, text: str, default: str) -> str:
+        """
+        Возвращает метку с наибольшим баллом.
+
+        Args:
+            text: Текст для анализа
+            default: Метка, если ничего не найдено
+
+        Returns:
+            str: Лучшая метка (при равенстве - добавленная раньше)
+        """
+        scores = self.score(text)
+        if not scores:
+            return default
+        return max(scores, key=lambda label: (scores[label], -self.labels.index(label)))
+
+def _is_whole_word(text: str, start: int, end: int) -> bool:
+    """
+    Проверяет, что фрагмент text[start:end] не является частью другого слова.
+    """
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
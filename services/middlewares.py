@@ -0,0 +1,268 @@
+"""
+Middleware диспетчера.
+
+ChatLockMiddleware обрабатывает обновления одного чата строго по очереди:
+быстрые нажатия пользователя не перемешивают чтение и запись состояния FSM
+(state.get_data -> state.update_data), а обновления разных чатов по-прежнему
+обрабатываются параллельно.
+
+ThrottlingMiddleware ограничивает, как часто пользователь может вызывать
+дорогие обработчики (синтез медитаций, ответы LLM, распознавание голоса):
+лишний запрос получает короткий ответ "слишком часто" до обращения к API.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Callable, Awaitable, Optional, Tuple, List
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, CallbackQuery
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Параметры очереди обработки по чатам (можно переопределить через переменные окружения)
+CHAT_LOCK_MAX_KEYS = int(os.getenv("CHAT_LOCK_MAX_KEYS", "10000"))
+CHAT_LOCK_TIMEOUT = float(os.getenv("CHAT_LOCK_TIMEOUT", "60"))
+
+Handler = Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]]
+
+class _ChatLock:
+    __slots__ = ("lock", "holders")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Обновления чата в обработке и в ожидании
+        self.holders = 0
+
+class ChatLockMiddleware(BaseMiddleware):
+    """
+    Последовательная обработка обновлений одного чата.
+
+    Блокировка создается, пока у чата есть обновления в обработке, и удаляется
+    после последнего, поэтому таблица блокировок содержит только активные чаты
+    и ограничена max_keys. Если таблица заполнена, обновление нового чата
+    обрабатывается без блокировки. Если предыдущее обновление чата выполняется
+    дольше timeout, следующее перестает его ждать.
+    """
+
+    def __init__(self, max_keys: int = CHAT_LOCK_MAX_KEYS, timeout: float = CHAT_LOCK_TIMEOUT):
+        self.max_keys = max_keys
+        self.timeout = timeout
+        self._locks: Dict[Tuple[int, int], _ChatLock] = {}
+        self.stats = {"updates": 0, "waited": 0, "timeouts": 0, "overflow": 0, "max_keys_used": 0}
+
+    @staticmethod
+    def _key(data: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        if chat is None and user is None:
+            return None
+        # Ключ совпадает с ключом FSM по умолчанию: чат и пользователь
+        return (chat.id if chat else user.id, user.id if user else chat.id)
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        key = self._key(data)
+        if key is None:
+            return await handler(event, data)
+
+        self.stats["updates"] += 1
+        async with self.hold(key):
+            return await handler(event, data)
+
+    @asynccontextmanager
+    async def hold(self, key: Tuple[int, int]):
+        """
+        Занимает очередь чата вне обработчика обновления.
+
+        Нужна фоновым задачам (например, ответу на голосовое сообщение из
+        voice_pool), которые читают и записывают состояние FSM уже после того,
+        как обработчик обновления вернул управление.
+
+        Args:
+            key: (chat_id, user_id), как у обновлений чата
+        """
+        entry = self._locks.get(key)
+        if entry is None:
+            if len(self._locks) >= self.max_keys:
+                self.stats["overflow"] += 1
+                yield
+                return
+            entry = self._locks[key] = _ChatLock()
+            self.stats["max_keys_used"] = max(self.stats["max_keys_used"], len(self._locks))
+
+        if entry.holders:
+            # Предыдущее обновление чата еще обрабатывается
+            self.stats["waited"] += 1
+        entry.holders += 1
+        acquired = False
+        try:
+            try:
+                await asyncio.wait_for(entry.lock.acquire(), self.timeout)
+                acquired = True
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                logger.warning(f"Обновление чата {key[0]} ждало предыдущее дольше {self.timeout} с, обрабатываем без очереди")
+            yield
+        finally:
+            if acquired:
+                entry.lock.release()
+            entry.holders -= 1
+            if entry.holders == 0 and self._locks.get(key) is entry:
+                del self._locks[key]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику очереди обработки по чатам.
+
+        Returns:
+            Dict[str, Any]: Обновления, ожидания, таймауты и размер таблицы блокировок
+        """
+        return {**self.stats, "active_chats": len(self._locks)}
+
+def parse_limit(value: str) -> Optional[Tuple[float, float]]:
+    """
+    Разбирает лимит вида "запросов/секунд" (например, "3/300").
+
+    Args:
+        value: Строка лимита; пустая строка или "0" отключают ограничение
+
+    Returns:
+        Optional[Tuple[float, float]]: (запросов, секунд) или None
+    """
+    value = value.strip()
+    if not value or value == "0":
+        return None
+    count, _, period = value.partition("/")
+    return float(count), float(period or 60)
+
+# Лимиты по классам обработчиков (можно переопределить через переменные окружения)
+THROTTLE_LIMITS = {
+    "tts": parse_limit(os.getenv("THROTTLE_TTS", "3/300")),
+    "llm": parse_limit(os.getenv("THROTTLE_LLM", "10/60")),
+    "stt": parse_limit(os.getenv("THROTTLE_STT", "5/60"))
+}
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "50000"))
+
+class TokenBucketLimiter:
+    """
+    Ограничение частоты запросов: корзина токенов на пользователя и класс обработчика.
+
+    Корзина вмещает count запросов и пополняется на count за period секунд,
+    то есть ограничивает частоту в скользящем окне period, допуская короткие
+    всплески. Проверка - O(1): токены досчитываются по прошедшему времени при
+    обращении, фоновых задач нет. Корзины хранятся в порядке последнего
+    обращения; сверх max_entries вытесняются самые давние (они, как правило,
+    уже полные, и их потеря ничего не меняет).
+    """
+
+    def __init__(self, limits: Dict[str, Optional[Tuple[float, float]]] = None, max_entries: int = THROTTLE_MAX_USERS):
+        self.limits = THROTTLE_LIMITS if limits is None else limits
+        self.max_entries = max_entries
+        # (класс, user_id) -> [токены, время обновления, до какого времени не предупреждать]
+        self._buckets: "OrderedDict[Tuple[str, int], List[float]]" = OrderedDict()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def hit(self, name: str, user_id: int, now: Optional[float] = None) -> float:
+        """
+        Учитывает запрос пользователя.
+
+        Args:
+            name: Класс обработчика ("tts", "llm", "stt")
+            user_id: ID пользователя
+            now: Текущее время (для тестов)
+
+        Returns:
+            float: 0, если запрос разрешен, иначе сколько секунд ждать следующего
+        """
+        limit = self.limits.get(name)
+        if limit is None:
+            return 0.0
+        count, period = limit
+        now = time.monotonic() if now is None else now
+        stats = self.stats.setdefault(name, {"allowed": 0, "throttled": 0})
+
+        key = (name, user_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [count, now, 0.0]
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(count, bucket[0] + (now - bucket[1]) * count / period)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            stats["allowed"] += 1
+            return 0.0
+        stats["throttled"] += 1
+        return (1 - bucket[0]) * period / count
+
+    def should_warn(self, name: str, user_id: int, retry_after: float, now: Optional[float] = None) -> bool:
+        """
+        Нужно ли отвечать на отклоненный запрос: одно предупреждение
+        на каждый период ожидания, чтобы не тратить на флуд свои сообщения.
+        """
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get((name, user_id))
+        if bucket is None or now < bucket[2]:
+            return False
+        bucket[2] = now + retry_after
+        return True
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику ограничения частоты.
+
+        Returns:
+            Dict[str, Any]: Разрешенные и отклоненные запросы по классам, число корзин
+        """
+        return {"classes": {name: dict(stats) for name, stats in self.stats.items()}, "buckets": len(self._buckets)}
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Ограничивает частоту вызова обработчиков одного класса.
+
+    Подключается как внутренняя middleware роутера, поэтому срабатывает,
+    только когда обработчик роутера уже выбран фильтрами. Функция applies
+    может сузить проверку (например, только сообщения, идущие в LLM).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        applies: Optional[Callable[[TelegramObject, Dict[str, Any]], bool]] = None,
+        limiter: Optional[TokenBucketLimiter] = None
+    ):
+        self.name = name
+        self.applies = applies
+        self.limiter = limiter or throttle_limiter
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None or (self.applies is not None and not self.applies(event, data)):
+            return await handler(event, data)
+
+        retry_after = self.limiter.hit(self.name, user.id)
+        if not retry_after:
+            return await handler(event, data)
+
+        logger.info(f"Запрос {self.name} пользователя {user.id} отклонен: слишком часто (ждать {retry_after:.0f} с)")
+        text = f"⏳ Слишком часто. Попробуйте снова через {max(1, round(retry_after))} с."
+        if isinstance(event, CallbackQuery):
+            # На нажатие кнопки нужно ответить в любом случае, это всплывающая подсказка
+            await event.answer(text)
+        elif self.limiter.should_warn(self.name, user.id, retry_after):
+            await event.answer(text)
+        return None
+
+# Общие экземпляры (очередь по чатам подключается в main.build_dispatcher,
+# ограничение частоты - в модулях с роутерами дорогих обработчиков)
+chat_lock_middleware = ChatLockMiddleware()
+throttle_limiter = TokenBucketLimiter()
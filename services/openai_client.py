@@ -0,0 +1,215 @@
+"""
+Общий пул клиентов OpenAI для всех сервисов бота.
+
+Все модули (stt, recs, profile_analysis, profile_generator, communication_handler)
+получают клиента через get_openai_client(caller) и разделяют один httpx-пул
+соединений: меньше сокетов и TLS-рукопожатий, стабильнее задержки.
+Для каждого вызывающего модуля собирается своя статистика запросов.
+"""
+
+import os
+import time
+import logging
+from typing import Dict, Any, Optional, TYPE_CHECKING
+
+# httpx и openai импортируются при создании пула, а не при импорте модуля:
+# его подключают почти все обработчики, и запуск бота не ждет тяжелых пакетов
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Проверка наличия API-ключа OpenAI
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Параметры пула соединений (можно переопределить через переменные окружения)
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "1") == "1"
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "10"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))
+
+# Служебный заголовок, по которому хуки определяют вызывающий модуль.
+# Удаляется из запроса до отправки в OpenAI.
+CALLER_HEADER = "X-Ona-Caller"
+
+# Общий HTTP-клиент и базовый клиент OpenAI
+_http_client: Optional["httpx.AsyncClient"] = None
+_base_client: Optional["AsyncOpenAI"] = None
+
+# Клиенты для отдельных модулей (используют общий _http_client)
+_caller_clients: Dict[str, "AsyncOpenAI"] = {}
+
+# Статистика запросов по вызывающим модулям
+# {caller: {"requests": int, "responses": int, "errors": int, "total_latency": float, "max_latency": float}}
+caller_metrics: Dict[str, Dict[str, float]] = {}
+
+def _http2_available() -> bool:
+    """
+    Проверяет, можно ли включить HTTP/2 (нужен пакет h2).
+
+    Returns:
+        bool: True, если HTTP/2 включен и поддерживается
+    """
+    if not OPENAI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("Пакет h2 не установлен, пул OpenAI будет использовать HTTP/1.1")
+        return False
+
+def _get_metrics(caller: str) -> Dict[str, float]:
+    """
+    Возвращает (и при необходимости создает) счетчики для вызывающего модуля.
+    """
+    if caller not in caller_metrics:
+        caller_metrics[caller] = {
+            "requests": 0,
+            "responses": 0,
+            "errors": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0
+        }
+    return caller_metrics[caller]
+
+async def _on_request(request: "httpx.Request"):
+    """
+    Хук httpx: запоминает вызывающий модуль и время начала запроса.
+    """
+    caller = request.headers.pop(CALLER_HEADER, "default")
+    request.extensions["ona_caller"] = caller
+    request.extensions["ona_started_at"] = time.monotonic()
+    _get_metrics(caller)["requests"] += 1
+
+async def _on_response(response: "httpx.Response"):
+    """
+    Хук httpx: учитывает задержку и ошибки ответа для вызывающего модуля.
+    """
+    request = response.request
+    caller = request.extensions.get("ona_caller", "default")
+    started_at = request.extensions.get("ona_started_at")
+    metrics = _get_metrics(caller)
+    metrics["responses"] += 1
+    if response.status_code >= 400:
+        metrics["errors"] += 1
+    if started_at is not None:
+        latency = time.monotonic() - started_at
+        metrics["total_latency"] += latency
+        metrics["max_latency"] = max(metrics["max_latency"], latency)
+
+def _create_http_client() -> "httpx.AsyncClient":
+    """
+    Создает общий httpx-клиент с настроенным пулом соединений.
+
+    Returns:
+        httpx.AsyncClient: HTTP-клиент для всех запросов к OpenAI
+    """
+    import httpx
+
+    http2 = _http2_available()
+    client = httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(OPENAI_READ_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+        event_hooks={"request": [_on_request], "response": [_on_response]}
+    )
+    logger.info(
+        f"Создан общий пул соединений OpenAI (http2={http2}, "
+        f"max_connections={OPENAI_MAX_CONNECTIONS}, keepalive={OPENAI_MAX_KEEPALIVE})"
+    )
+    return client
+
+def get_openai_client(caller: str = "default") -> Optional["AsyncOpenAI"]:
+    """
+    Возвращает клиента OpenAI, использующего общий пул соединений.
+
+    Args:
+        caller: Имя вызывающего модуля (для статистики)
+
+    Returns:
+        Optional[AsyncOpenAI]: Клиент OpenAI или None, если API-ключ не настроен
+    """
+    global _http_client, _base_client
+
+    if not OPENAI_API_KEY:
+        return None
+
+    if caller in _caller_clients:
+        return _caller_clients[caller]
+
+    try:
+        if _base_client is None:
+            from openai import AsyncOpenAI
+            _http_client = _create_http_client()
+            # Повторы выполняет services.openai_limiter.call_openai, встроенные отключаем
+            _base_client = AsyncOpenAI(
+                api_key=OPENAI_API_KEY,
+                http_client=_http_client,
+                max_retries=0
+            )
+
+        # Копия клиента с заголовком вызывающего модуля; http_client остается общим
+        client = _base_client.with_options(default_headers={CALLER_HEADER: caller})
+        _caller_clients[caller] = client
+        _get_metrics(caller)
+        return client
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации OpenAI API для {caller}: {e}")
+        return None
+
+def get_pool_metrics() -> Dict[str, Dict[str, Any]]:
+    """
+    Возвращает статистику запросов к OpenAI по вызывающим модулям.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Счетчики и средняя задержка для каждого модуля
+    """
+    result = {}
+    for caller, metrics in caller_metrics.items():
+        stats = dict(metrics)
+        responses = metrics["responses"]
+        stats["avg_latency"] = metrics["total_latency"] / responses if responses else 0.0
+        result[caller] = stats
+    return result
+
+async def startup_openai_pool():
+    """
+    Инициализирует общий пул соединений при запуске бота.
+    """
+    if not OPENAI_API_KEY:
+        logger.warning("OPENAI_API_KEY не найден, пул соединений OpenAI не создан")
+        return
+    get_openai_client("default")
+    logger.info("Пул соединений OpenAI готов к работе")
+
+async def shutdown_openai_pool():
+    """
+    Закрывает общий пул соединений при завершении работы бота.
+    """
+    global _http_client, _base_client
+
+    for caller, stats in get_pool_metrics().items():
+        logger.info(
+            f"OpenAI [{caller}]: запросов {int(stats['requests'])}, ошибок {int(stats['errors'])}, "
+            f"средняя задержка {stats['avg_latency']:.2f} с, максимальная {stats['max_latency']:.2f} с"
+        )
+
+    if _http_client is not None:
+        try:
+            await _http_client.aclose()
+            logger.info("Пул соединений OpenAI закрыт")
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии пула соединений OpenAI: {e}")
+
+    _http_client = None
+    _base_client = None
+    _caller_clients.clear()
@@ -0,0 +1,239 @@
+"""
+Адаптивное ограничение параллельных запросов к OpenAI и повторы с backoff.
+
+Лимит параллельности меняется по схеме AIMD: каждый успешный ответ немного
+увеличивает лимит, а 429/таймаут уменьшает его вдвое. Повторные попытки
+выполняются с джиттером и учитывают заголовок Retry-After.
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Параметры лимитера (можно переопределить через переменные окружения)
+OPENAI_INITIAL_CONCURRENCY = int(os.getenv("OPENAI_INITIAL_CONCURRENCY", "8"))
+OPENAI_MIN_CONCURRENCY = int(os.getenv("OPENAI_MIN_CONCURRENCY", "1"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "20"))
+
+# Исходы запроса для лимитера
+OUTCOME_SUCCESS = "success"
+OUTCOME_OVERLOAD = "overload"
+OUTCOME_ERROR = "error"
+OUTCOME_CANCELLED = "cancelled"
+
+class AdaptiveLimiter:
+    """
+    Асинхронный лимитер параллельных запросов с адаптацией по схеме AIMD.
+    """
+
+    def __init__(
+        self,
+        initial: int = OPENAI_INITIAL_CONCURRENCY,
+        min_limit: int = OPENAI_MIN_CONCURRENCY,
+        max_limit: int = OPENAI_MAX_CONCURRENCY,
+        decrease_factor: float = 0.5,
+        decrease_cooldown: float = 1.0
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+        self.stats = {"acquired": 0, "overloads": 0, "retries": 0, "failures": 0}
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Условие создается лениво, внутри работающего event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        """
+        Ожидает свободный слот в пределах текущего лимита.
+        """
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            self.stats["acquired"] += 1
+
+    async def release(self, outcome: str = OUTCOME_SUCCESS):
+        """
+        Освобождает слот и корректирует лимит по исходу запроса.
+
+        Args:
+            outcome: success, overload (429/таймаут), error или cancelled
+        """
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight = max(0, self.in_flight - 1)
+            if outcome == OUTCOME_SUCCESS:
+                # Аддитивный рост: примерно +1 к лимиту за полное "окно" успешных запросов
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            elif outcome == OUTCOME_OVERLOAD:
+                self.stats["overloads"] += 1
+                now = time.monotonic()
+                # Мультипликативное снижение не чаще одного раза за decrease_cooldown
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                    logger.warning(f"Перегрузка OpenAI: лимит параллельных запросов снижен до {int(self.limit)}")
+            condition.notify_all()
+
+# Общий лимитер для всех вызовов OpenAI
+openai_limiter = AdaptiveLimiter()
+
+def classify_error(error: Exception) -> str:
+    """
+    Определяет, как лимитер должен реагировать на ошибку.
+
+    Args:
+        error: Исключение, возникшее при вызове API
+
+    Returns:
+        str: overload для 429/таймаутов, error для прочих ошибок
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return OUTCOME_OVERLOAD
+    if isinstance(error, asyncio.TimeoutError) or "Timeout" in type(error).__name__:
+        return OUTCOME_OVERLOAD
+    return OUTCOME_ERROR
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Проверяет, имеет ли смысл повторить запрос после ошибки.
+
+    Args:
+        error: Исключение, возникшее при вызове API
+
+    Returns:
+        bool: True для 408/409/429/5xx, таймаутов и ошибок соединения
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in (408, 409, 429) or status_code >= 500
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Извлекает задержку из заголовка Retry-After ответа, если он есть.
+
+    Args:
+        error: Исключение с атрибутом response
+
+    Returns:
+        Optional[float]: Задержка в секундах или None
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    for header in ("retry-after-ms", "retry-after"):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            delay = float(value)
+        except (TypeError, ValueError):
+            continue
+        return delay / 1000 if header == "retry-after-ms" else delay
+    return None
+
+def compute_backoff(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Вычисляет задержку перед повторной попыткой (full jitter).
+
+    Args:
+        attempt: Номер повторной попытки, начиная с 0
+        retry_after: Задержка, запрошенная сервером
+
+    Returns:
+        float: Задержка в секундах
+    """
+    if retry_after is not None:
+        # Небольшой джиттер, чтобы повторы не приходили одновременно
+        return min(OPENAI_RETRY_MAX_DELAY, retry_after + random.uniform(0, OPENAI_RETRY_BASE_DELAY))
+    cap = min(OPENAI_RETRY_MAX_DELAY, OPENAI_RETRY_BASE_DELAY * (2 ** attempt))
+    return random.uniform(0, cap)
+
+async def call_openai(
+    func: Callable[..., Awaitable[Any]],
+    *args,
+    caller: str = "default",
+    limiter: Optional[AdaptiveLimiter] = None,
+    max_retries: int = OPENAI_MAX_RETRIES,
+    **kwargs
+) -> Any:
+    """
+    Выполняет вызов OpenAI через адаптивный лимитер с повторами.
+
+    Args:
+        func: Асинхронная функция API (например, client.chat.completions.create)
+        caller: Имя вызывающего модуля (для логов)
+        limiter: Лимитер (по умолчанию общий openai_limiter)
+        max_retries: Максимальное количество повторных попыток
+        *args, **kwargs: Аргументы для func
+
+    Returns:
+        Any: Результат func
+
+    Raises:
+        Exception: Последняя ошибка, если все попытки исчерпаны
+    """
+    limiter = limiter or openai_limiter
+    attempt = 0
+
+    while True:
+        await limiter.acquire()
+        # Если вызов отменен (остановка бота, wait_for), слот возвращается без изменения лимита
+        outcome = OUTCOME_CANCELLED
+        try:
+            result = await func(*args, **kwargs)
+            outcome = OUTCOME_SUCCESS
+            return result
+        except Exception as e:
+            outcome = classify_error(e)
+            if attempt >= max_retries or not is_retryable(e):
+                limiter.stats["failures"] += 1
+                raise
+            error = e
+        finally:
+            # shield: повторная отмена не должна прервать возврат слота
+            await asyncio.shield(limiter.release(outcome))
+        delay = compute_backoff(attempt, get_retry_after(error))
+        attempt += 1
+        limiter.stats["retries"] += 1
+        logger.warning(
+            f"Ошибка OpenAI [{caller}]: {type(error).__name__}. "
+            f"Повтор {attempt}/{max_retries} через {delay:.1f} с"
+        )
+        await asyncio.sleep(delay)
+
+def get_limiter_metrics() -> Dict[str, Any]:
+    """
+    Возвращает текущее состояние общего лимитера.
+
+    Returns:
+        Dict[str, Any]: Лимит, число активных запросов и счетчики
+    """
+    return {
+        "limit": int(openai_limiter.limit),
+        "in_flight": openai_limiter.in_flight,
+        **openai_limiter.stats
+    }
@@ -2,8 +2,9 @@ import logging
 import os
 from typing import Dict, Any, Optional, List
 import json
-from openai import AsyncOpenAI
-import httpx
+
+from services.openai_client import get_openai_client
+from services.openai_limiter import call_openai
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -13,18 +14,6 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY не найден в переменных окружения. Функция анализа профиля будет работать в демо-режиме.")
 
-# Инициализация клиента OpenAI с API-ключом из переменных окружения (если доступен)
-http_client = httpx.AsyncClient()
-client = None
-if OPENAI_API_KEY:
-    try:
-        client = AsyncOpenAI(
-            api_key=OPENAI_API_KEY,
-            http_client=http_client
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при инициализации OpenAI API: {e}")
-
 async def analyze_profile(user_profile: Dict[str, Any], query: str) -> str:
     """
     Анализирует профиль пользователя на основе его запроса, используя структуру профайлинга 2.0.
@@ -36,6 +25,7 @@ async def analyze_profile(user_profile: Dict[str, Any], query: str) -> str:
     Returns:
         str: Результат анализа профиля
     """
+    client = get_openai_client("profile_analysis")
     # Если нет клиента OpenAI или профиля, возвращаем сообщение об ошибке
     if not client or not user_profile:
         return "Извините, я не могу выполнить анализ профиля в данный момент. Убедитесь, что вы прошли опрос и у вас есть полный профиль."
@@ -71,7 +61,9 @@ async def analyze_profile(user_profile: Dict[str, Any], query: str) -> str:
 Будь конкретным, опирайся на детали профиля."""
 
         # Отправляем запрос в OpenAI
-        response = await client.chat.completions.create(
+        response = await call_openai(
+            client.chat.completions.create,
+            caller="profile_analysis",
             model="gpt-4o",
             temperature=0.7,
             messages=[
@@ -100,6 +92,7 @@ async def get_profile_insights(user_profile: Dict[str, Any]) -> Dict[str, List[s
     Returns:
         Dict[str, List[str]]: Словарь с инсайтами по категориям
     """
+    client = get_openai_client("profile_analysis")
     # Если нет клиента OpenAI или профиля, возвращаем базовые инсайты
     if not client or not user_profile:
         return {
@@ -149,7 +142,9 @@ async def get_profile_insights(user_profile: Dict[str, Any]) -> Dict[str, List[s
         ]
         
         # Генерируем ответ
-        response = await client.chat.completions.create(
+        response = await call_openai(
+            client.chat.completions.create,
+            caller="profile_analysis",
             model="gpt-4",
             temperature=0.7,
             messages=messages,
@@ -1,11 +1,14 @@
 import os
 import logging
 import asyncio
-import httpx
 from typing import Dict, Any, Optional, Tuple, List
-from openai import AsyncOpenAI
 import random
 
+from services.openai_client import get_openai_client
+from services.openai_limiter import call_openai
+from services.keyword_matcher import KeywordAutomaton
+from services.intent_classifier import classify_intent, log_labeled_message, INTENT_CONFIDENCE_THRESHOLD
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
@@ -14,18 +17,6 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
     logger.warning("OPENAI_API_KEY не найден в переменных окружения. Будет использован режим заглушки.")
 
-# Инициализация клиента OpenAI с API-ключом из переменных окружения (если доступен)
-http_client = httpx.AsyncClient()
-client = None
-if OPENAI_API_KEY:
-    try:
-        client = AsyncOpenAI(
-            api_key=OPENAI_API_KEY,
-            http_client=http_client
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при инициализации OpenAI API: {e}")
-
 # Типы намерений пользователя
 USER_INTENTS = {
     "question": "вопрос пользователя на конкретную тему",
@@ -96,75 +87,78 @@ DEFAULT_RECOMMENDATIONS = {
 # Словарь для хранения последнего времени запроса пользователя
 last_request_time: Dict[int, float] = {}
 
+# Маркеры намерений пользователя
+INTENT_MARKERS = {
+    "question": ["как", "что", "где", "когда", "почему", "зачем", "какой", "сколько", "?"],
+    "meditation": ["медитация", "медитировать", "релакс", "расслабиться", "успокоиться", "медитируй"],
+    "joke": ["шутка", "анекдот", "смешно", "весело", "рассмеши", "шути", "юмор"],
+    "help": ["помоги", "помощь", "поддержка", "совет", "подскажи", "посоветуй"],
+    "analysis": ["анализ", "разбор", "объясни", "расскажи", "проанализируй", "пойми"],
+    "greeting": ["привет", "здравствуй", "добрый день", "здорова", "хай", "приветствую", "как дела", "что нового", "как жизнь", "как поживаешь", "доброе утро", "добрый вечер"],
+    "feedback": ["спасибо", "благодарю", "хорошо", "отлично", "понравилось", "не понравилось"],
+}
+
+# Ключевые слова фокусов сообщения
+FOCUS_KEYWORDS = {
+    "burnout": ["выгорание", "выгорел", "устал", "истощение", "нет сил", "перегрузк"],
+    "anxiety": ["тревога", "тревожность", "паник", "волнение", "беспокойств", "страх"],
+    "depression": ["депресси", "подавлен", "грусть", "тоска", "печаль", "апатия", "нет настроения"],
+    "stress": ["стресс", "напряжение", "нервы", "нервничаю", "давление"],
+    "postpartum": ["после родов", "послеродов", "ребенок", "малыш", "грудное", "кормление"],
+    "self-esteem": ["самооценка", "неуверенность", "комплекс", "не справляюсь", "недостаточно"],
+    "grief": ["горе", "потеря", "утрата", "умер", "смерть", "скорбь"],
+    "relationship": ["отношения", "партнер", "муж", "жена", "расстался", "любовь", "измена"],
+    "family": ["семья", "родители", "дети", "мама", "папа", "ребенок", "конфликт"],
+    "career": ["работа", "карьера", "должность", "профессия", "увольнение", "коллеги"],
+    "motivation": ["мотивация", "лень", "прокрастинация", "откладываю", "не могу начать"],
+    "sleep": ["сон", "бессонница", "не спится", "просыпаюсь", "недосып"]
+}
+
+# Веса маркеров: вопросительные слова встречаются почти везде и весят меньше,
+# устойчивые фразы приветствия - больше любых одиночных маркеров
+MARKER_WEIGHTS = {
+    **{marker: 0.4 for marker in INTENT_MARKERS["question"]},
+    "как дела": 3.0,
+    "как жизнь": 3.0,
+    "как поживаешь": 3.0,
+    "что нового": 3.0,
+    "не понравилось": 2.0,
+}
+
+# Короткие маркеры, которые засчитываются только как отдельные слова ("как" не в "никак")
+WHOLE_WORD_MARKERS = {"как", "что", "где", "когда", "какой", "хай", "горе", "сон", "лень"}
+
+# Автоматы строятся один раз при импорте
+_intent_matcher = KeywordAutomaton()
+_intent_matcher.add_many(INTENT_MARKERS, MARKER_WEIGHTS, WHOLE_WORD_MARKERS)
+_intent_matcher.build()
+
+_focus_matcher = KeywordAutomaton()
+_focus_matcher.add_many(FOCUS_KEYWORDS, whole_words=WHOLE_WORD_MARKERS)
+_focus_matcher.build()
+
 async def detect_intent_and_focus(text: str) -> Tuple[str, str]:
     """
     Определяет намерение пользователя и фокус сообщения.
     
+    Все маркеры ищутся за один проход автоматом Ахо-Корасик, побеждает метка
+    с наибольшим суммарным весом (при равенстве - описанная выше в словаре).
+    
     Args:
         text: Текст сообщения пользователя.
         
     Returns:
         Tuple[str, str]: Намерение пользователя и фокус сообщения.
     """
-    text_lower = text.lower()
-    
-    # Определение намерения по ключевым словам
-    intent_markers = {
-        "question": ["как", "что", "где", "когда", "почему", "зачем", "какой", "сколько", "?"],
-        "meditation": ["медитация", "медитировать", "релакс", "расслабиться", "успокоиться", "медитируй"],
-        "joke": ["шутка", "анекдот", "смешно", "весело", "рассмеши", "шути", "юмор"],
-        "help": ["помоги", "помощь", "поддержка", "совет", "подскажи", "посоветуй"],
-        "analysis": ["анализ", "разбор", "объясни", "расскажи", "проанализируй", "пойми"],
-        "greeting": ["привет", "здравствуй", "добрый день", "здорова", "хай", "приветствую", "как дела", "что нового", "как жизнь", "как поживаешь", "доброе утро", "добрый вечер"],
-        "feedback": ["спасибо", "благодарю", "хорошо", "отлично", "понравилось", "не понравилось"],
-    }
-    
-    # Проверяем наличие полных фраз для приветствий
-    greeting_phrases = ["как дела", "как жизнь", "как поживаешь", "что нового"]
-    for phrase in greeting_phrases:
-        if phrase in text_lower:
-            return "greeting", "default"
-    
-    # Проверяем наличие маркеров интента
-    detected_intent = "support"  # По умолчанию считаем, что это запрос поддержки
-    for intent, markers in intent_markers.items():
-        for marker in markers:
-            if marker in text_lower:
-                detected_intent = intent
-                break
-        if detected_intent != "support":
-            break
-    
-    # Определение фокуса сообщения
-    focus_keywords = {
-        "burnout": ["выгорание", "выгорел", "устал", "истощение", "нет сил", "перегрузк"],
-        "anxiety": ["тревога", "тревожность", "паник", "волнение", "беспокойств", "страх"],
-        "depression": ["депресси", "подавлен", "грусть", "тоска", "печаль", "апатия", "нет настроения"],
-        "stress": ["стресс", "напряжение", "нервы", "нервничаю", "давление"],
-        "postpartum": ["после родов", "послеродов", "ребенок", "малыш", "грудное", "кормление"],
-        "self-esteem": ["самооценка", "неуверенность", "комплекс", "не справляюсь", "недостаточно"],
-        "grief": ["горе", "потеря", "утрата", "умер", "смерть", "скорбь"],
-        "relationship": ["отношения", "партнер", "муж", "жена", "расстался", "любовь", "измена"],
-        "family": ["семья", "родители", "дети", "мама", "папа", "ребенок", "конфликт"],
-        "career": ["работа", "карьера", "должность", "профессия", "увольнение", "коллеги"],
-        "motivation": ["мотивация", "лень", "прокрастинация", "откладываю", "не могу начать"],
-        "sleep": ["сон", "бессонница", "не спится", "просыпаюсь", "недосып"]
-    }
-    
-    detected_focus = "default"
-    for focus, keywords in focus_keywords.items():
-        for keyword in keywords:
-            if keyword in text_lower:
-                detected_focus = focus
-                break
-        if detected_focus != "default":
-            break
-    
+    # По умолчанию считаем, что это запрос поддержки
+    detected_intent = _intent_matcher.best(text, default="support")
+    detected_focus = _focus_matcher.best(text, default="default")
     return detected_intent, detected_focus
 
 async def detect_intent_with_ai(text: str) -> Tuple[str, float]:
     """
-    Определяет намерение пользователя с помощью OpenAI.
+    Определяет намерение пользователя: сначала локальной моделью, а при
+    недостаточной уверенности - с помощью OpenAI.
     
     Args:
         text: Текст сообщения пользователя.
@@ -172,13 +166,21 @@ async def detect_intent_with_ai(text: str) -> Tuple[str, float]:
     Returns:
         Tuple[str, float]: Намерение пользователя и уверенность в определении.
     """
+    # Локальная модель отвечает без сетевого запроса
+    local_result = classify_intent(text)
+    if local_result and local_result[1] >= INTENT_CONFIDENCE_THRESHOLD:
+        return local_result
+    
+    client = get_openai_client("recs")
     if not client:
         # Если API недоступен, используем правила
         intent, _ = await detect_intent_and_focus(text)
         return intent, 0.7
     
     try:
-        response = await client.chat.completions.create(
+        response = await call_openai(
+            client.chat.completions.create,
+            caller="recs",
             model="gpt-3.5-turbo",
             temperature=0.3,
             messages=[
@@ -209,6 +211,8 @@ async def detect_intent_with_ai(text: str) -> Tuple[str, float]:
         
         # Проверяем, что ответ соответствует одному из возможных намерений
         if intent in USER_INTENTS:
+            # Сохраняем разметку для дообучения локальной модели
+            log_labeled_message(text, intent)
             return intent, 0.9
         else:
             # Если ответ не соответствует, используем правила
@@ -250,6 +254,7 @@ async def generate_response(text: str, user_id: int) -> str:
     
     logger.info(f"Определено намерение: {intent} с уверенностью {confidence}. Фокус: {focus}")
     
+    client = get_openai_client("recs")
     # Если API-ключ OpenAI не настроен или клиент не инициализирован
     if not client:
         if intent == "support":
@@ -280,7 +285,9 @@ async def generate_response(text: str, user_id: int) -> str:
             focus_description = AVAILABLE_FOCUSES[focus]
             system_prompt = f"Ты — профессиональный психолог. Дай 1–2 коротких, практических совета для клиента с фокусом: {focus_description}. Ответ должен быть на русском языке, не более 3-4 предложений, без введения и заключения."
         
-        response = await client.chat.completions.create(
+        response = await call_openai(
+            client.chat.completions.create,
+            caller="recs",
             model="gpt-3.5-turbo",
             temperature=0.7,
             messages=[
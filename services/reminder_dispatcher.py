@@ -0,0 +1,314 @@
+"""
+Диспетчер напоминаний.
+
+Вместо отдельной задачи планировщика на каждого пользователя используется одна
+задача, срабатывающая раз в минуту. Индекс (день недели, "HH:MM" по UTC) ->
+множество пользователей позволяет за один шаг найти всех, кому пора отправить
+напоминание, поэтому работа планировщика зависит от числа получателей в текущую
+минуту, а не от общего числа настроенных напоминаний. Время напоминаний задается
+в часовом поясе пользователя и переводится в UTC.
+
+Режим задается переменной REMINDER_MODE:
+- memory: все расписания загружаются при старте в индекс в памяти процесса;
+- pull: индекс не используется, каждую минуту диспетчер забирает из хранилища
+  напоминания текущей минуты (claim). Память бота не зависит от числа
+  напоминаний, а несколько реплик бота могут работать с одной базой.
+"""
+
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Callable, Awaitable, Iterable, List, Set, Tuple
+from zoneinfo import ZoneInfoNotFoundError
+
+from services.timezones import DEFAULT_TIMEZONE, get_zone, utc_offset, next_offset_change
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Коды дней недели в порядке datetime.weekday()
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+# Сколько пропущенных минут досылать, если срабатывание задержалось
+CATCH_UP_MINUTES = 5
+
+# Источник расписаний: "memory" (индекс в памяти) или "pull" (запрос к хранилищу).
+# При нескольких экземплярах бота по умолчанию pull: настройки, измененные
+# на любом экземпляре, сразу видны лидеру, который рассылает напоминания.
+REMINDER_MODE = os.getenv(
+    "REMINDER_MODE", "pull" if os.getenv("INSTANCE_MODE", "single").lower() == "multi" else "memory"
+).lower()
+
+# Слот расписания: (день недели 0-6, "HH:MM")
+Slot = Tuple[int, str]
+
+# Отправка пачки напоминаний: принимает список ID пользователей
+DeliverBatch = Callable[[List[int]], Awaitable[Any]]
+
+# Выборка получателей минуты из хранилища: принимает минуту UTC
+ClaimDue = Callable[[datetime], Awaitable[List[int]]]
+
+def utc_now() -> datetime:
+    """
+    Текущее время UTC без tzinfo (в таком виде время хранится в индексе).
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class ReminderIndex:
+    """
+    Индекс слотов расписания в UTC: (день недели, "HH:MM") -> ID пользователей.
+
+    Пользователь задает время в своем часовом поясе; при добавлении оно
+    переводится в UTC по текущему смещению зоны. Для каждой зоны заранее
+    вычисляется ближайший переход на летнее/зимнее время, и в этот момент
+    (refresh) пересчитываются слоты только пользователей этой зоны.
+    """
+
+    def __init__(self, default_zone: str = "UTC"):
+        self.default_zone = default_zone
+        self._slots: Dict[Slot, Set[int]] = {}
+        # Обратный индекс для удаления пользователя без просмотра всех слотов
+        self._user_slots: Dict[int, List[Slot]] = {}
+        # Локальное расписание: user_id -> (минута суток, дни недели, зона)
+        self._schedules: Dict[int, Tuple[int, Tuple[str, ...], str]] = {}
+        self._zone_users: Dict[str, Set[int]] = {}
+        self._zone_offsets: Dict[str, timedelta] = {}
+        self._zone_transitions: Dict[str, datetime] = {}
+
+    def set_user(self, user_id: int, time: str, days: Iterable[str], zone: Optional[str] = None, now: Optional[datetime] = None):
+        """
+        Добавляет или обновляет расписание пользователя.
+
+        Args:
+            user_id: ID пользователя
+            time: Местное время "HH:MM"
+            days: Коды дней недели ("mon", "tue", ...) по местному времени
+            zone: Часовой пояс IANA (по умолчанию default_zone)
+            now: Текущее время UTC (для тестов)
+        """
+        self.remove_user(user_id)
+        zone = zone or self.default_zone
+        try:
+            get_zone(zone)
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"Неизвестный часовой пояс {zone} у пользователя {user_id}, используем {self.default_zone}")
+            zone = self.default_zone
+        hour, minute = map(int, time.split(":"))
+        self._schedules[user_id] = (hour * 60 + minute, tuple(days), zone)
+        self._zone_users.setdefault(zone, set()).add(user_id)
+        if zone not in self._zone_offsets:
+            self._update_zone(zone, now or utc_now())
+        self._bucket(user_id)
+
+    def _update_zone(self, zone: str, now: datetime):
+        self._zone_offsets[zone] = utc_offset(zone, now)
+        self._zone_transitions[zone] = next_offset_change(zone, now)
+
+    def _bucket(self, user_id: int):
+        minute_of_day, days, zone = self._schedules[user_id]
+        offset = int(self._zone_offsets[zone].total_seconds() // 60)
+        slots = []
+        for day in days:
+            if day not in WEEKDAYS:
+                continue
+            # Минута недели в UTC (с переходом через границу суток и недели)
+            minute_of_week = (WEEKDAYS.index(day) * MINUTES_PER_DAY + minute_of_day - offset) % MINUTES_PER_WEEK
+            day_minute = minute_of_week % MINUTES_PER_DAY
+            slots.append((minute_of_week // MINUTES_PER_DAY, f"{day_minute // 60:02d}:{day_minute % 60:02d}"))
+        for slot in slots:
+            self._slots.setdefault(slot, set()).add(user_id)
+        if slots:
+            self._user_slots[user_id] = slots
+
+    def _unbucket(self, user_id: int):
+        for slot in self._user_slots.pop(user_id, []):
+            users = self._slots.get(slot)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del self._slots[slot]
+
+    def remove_user(self, user_id: int):
+        """
+        Удаляет пользователя из всех слотов.
+        """
+        self._unbucket(user_id)
+        schedule = self._schedules.pop(user_id, None)
+        if schedule is None:
+            return
+        zone = schedule[2]
+        users = self._zone_users.get(zone)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del self._zone_users[zone]
+                self._zone_offsets.pop(zone, None)
+                self._zone_transitions.pop(zone, None)
+
+    def refresh(self, now: datetime) -> int:
+        """
+        Пересчитывает слоты зон, в которых наступил переход на летнее/зимнее время.
+
+        Args:
+            now: Текущее время UTC
+
+        Returns:
+            int: Количество пользователей, слоты которых пересчитаны
+        """
+        moved = 0
+        for zone, transition in list(self._zone_transitions.items()):
+            if now < transition:
+                continue
+            self._update_zone(zone, now)
+            users = self._zone_users.get(zone, ())
+            for user_id in users:
+                self._unbucket(user_id)
+                self._bucket(user_id)
+            moved += len(users)
+            logger.info(f"Переход времени в зоне {zone}: смещение {self._zone_offsets[zone]}, пересчитано {len(users)} расписаний")
+        return moved
+
+    def due(self, moment: datetime) -> Set[int]:
+        """
+        Возвращает пользователей, которым нужно отправить напоминание в эту минуту.
+
+        Args:
+            moment: Момент времени UTC (секунды не учитываются)
+
+        Returns:
+            Set[int]: ID пользователей
+        """
+        return set(self._slots.get((moment.weekday(), moment.strftime("%H:%M")), ()))
+
+    def rebuild(self, settings: Dict[int, Dict[str, Any]]):
+        """
+        Строит индекс заново по настройкам напоминаний всех пользователей.
+
+        Args:
+            settings: {user_id: {"time": "HH:MM", "days": [...], "active": bool, "timezone": str}}
+        """
+        self._slots.clear()
+        self._user_slots.clear()
+        self._schedules.clear()
+        self._zone_users.clear()
+        self._zone_offsets.clear()
+        self._zone_transitions.clear()
+        now = utc_now()
+        for user_id, reminder in settings.items():
+            if reminder.get("active", False):
+                self.set_user(user_id, reminder["time"], reminder.get("days", WEEKDAYS), reminder.get("timezone"), now)
+
+    def zone_count(self) -> int:
+        return len(self._zone_users)
+
+    def __len__(self) -> int:
+        return len(self._user_slots)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._user_slots
+
+class ReminderDispatcher:
+    """
+    Ежеминутный диспетчер: находит получателей текущей минуты и отправляет их пачкой.
+
+    Получатели берутся из индекса, а если задана функция claim (режим pull) -
+    из хранилища.
+    """
+
+    def __init__(self, index: ReminderIndex, catch_up_minutes: int = CATCH_UP_MINUTES, claim: Optional[ClaimDue] = None):
+        self.index = index
+        self.catch_up_minutes = catch_up_minutes
+        self.claim = claim
+        self.deliver: Optional[DeliverBatch] = None
+        self._last_slot: Optional[datetime] = None
+        self._deliveries: Set[asyncio.Task] = set()
+        self.stats = {"ticks": 0, "batches": 0, "due": 0, "max_batch": 0, "missed_minutes": 0, "claim_errors": 0}
+
+    async def tick(self, now: Optional[datetime] = None):
+        """
+        Обрабатывает все минуты с прошлого срабатывания до текущей включительно.
+
+        Отправка выполняется в отдельных задачах, чтобы долгая рассылка не
+        задерживала следующие срабатывания.
+
+        Args:
+            now: Текущее время UTC (по умолчанию utc_now())
+        """
+        current = (now or utc_now()).replace(second=0, microsecond=0)
+        self.stats["ticks"] += 1
+        self.index.refresh(current)
+
+        if self._last_slot is not None and current <= self._last_slot:
+            # Эта минута уже обработана
+            return
+
+        if self._last_slot is None:
+            slots = [current]
+        else:
+            minutes = int((current - self._last_slot).total_seconds() // 60)
+            if minutes > self.catch_up_minutes:
+                self.stats["missed_minutes"] += minutes - self.catch_up_minutes
+                logger.warning(f"Диспетчер напоминаний пропустил {minutes} минут, досылаем последние {self.catch_up_minutes}")
+                minutes = self.catch_up_minutes
+            slots = [current - timedelta(minutes=offset) for offset in range(minutes - 1, -1, -1)]
+
+        for slot in slots:
+            if self.claim is None:
+                user_ids = self.index.due(slot)
+            else:
+                try:
+                    user_ids = set(await self.claim(slot))
+                except Exception as e:
+                    # Минута останется необработанной и будет повторена следующим срабатыванием
+                    self.stats["claim_errors"] += 1
+                    logger.error(f"Ошибка при получении напоминаний на {slot:%a %H:%M}: {e}")
+                    return
+            self._last_slot = slot
+            if not user_ids:
+                continue
+            self.stats["batches"] += 1
+            self.stats["due"] += len(user_ids)
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(user_ids))
+            logger.info(f"Напоминания на {slot:%a %H:%M}: {len(user_ids)} получателей")
+            if self.deliver is None:
+                logger.error("Диспетчер напоминаний не настроен: нет функции отправки")
+                continue
+            task = asyncio.create_task(self._deliver(sorted(user_ids)))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, user_ids: List[int]):
+        try:
+            await self.deliver(user_ids)
+        except Exception as e:
+            logger.error(f"Ошибка при отправке пачки напоминаний: {e}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику диспетчера.
+
+        Returns:
+            Dict[str, Any]: Срабатывания, пачки, получатели и размер индекса
+        """
+        return {
+            **self.stats,
+            "mode": "memory" if self.claim is None else "pull",
+            "users": len(self.index),
+            "zones": self.index.zone_count(),
+            "deliveries_in_progress": len(self._deliveries)
+        }
+
+    async def shutdown(self, timeout: float = 10.0):
+        """
+        Дожидается начатых рассылок.
+        """
+        if self._deliveries:
+            await asyncio.wait(set(self._deliveries), timeout=timeout)
+
+# Общие индекс и диспетчер напоминаний
+reminder_index = ReminderIndex(default_zone=DEFAULT_TIMEZONE)
+reminder_dispatcher = ReminderDispatcher(reminder_index)
@@ -0,0 +1,358 @@
+"""
+Постоянное хранилище настроек напоминаний.
+
+Настройки сохраняются при каждом изменении и целиком загружаются при старте
+бота постраничным запросом, после чего индекс диспетчера строится за O(n).
+
+Хранилища:
+- supabase: таблица reminders (SupabaseDB.save_reminder / list_reminders_page);
+- sqlite: локальный файл REMINDER_DB_PATH (используется, если Supabase не настроен).
+
+Выбор задается переменной REMINDER_STORE ("supabase" или "sqlite"); по умолчанию
+Supabase используется, если заданы SUPABASE_URL и SUPABASE_KEY.
+
+В режиме REMINDER_MODE=pull расписания не загружаются в память: каждую минуту
+бот забирает (claim_due) напоминания, которые пора отправить. Забранная строка
+помечается last_sent_at, поэтому несколько реплик бота не отправят одно
+напоминание дважды. Местная дата отправки (last_sent_local_date) не дает
+отправить напоминание второй раз, когда при переходе на зимнее время
+местная минута повторяется.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List
+from zoneinfo import ZoneInfoNotFoundError
+
+from services.reminder_dispatcher import WEEKDAYS
+from services.timezones import DEFAULT_TIMEZONE, get_zone
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Тип напоминания в таблице reminders (у пользователя одно напоминание о практике)
+REMINDER_TYPE = "practice"
+
+# Параметры хранилища
+REMINDER_STORE = os.getenv(
+    "REMINDER_STORE",
+    "supabase" if os.getenv("SUPABASE_URL") and os.getenv("SUPABASE_KEY") else "sqlite"
+)
+REMINDER_DB_PATH = os.getenv("REMINDER_DB_PATH", "reminders.db")
+REMINDER_LOAD_PAGE_SIZE = int(os.getenv("REMINDER_LOAD_PAGE_SIZE", "1000"))
+# Сколько напоминаний забирать одним запросом в режиме pull
+REMINDER_CLAIM_BATCH = int(os.getenv("REMINDER_CLAIM_BATCH", "500"))
+
+# Столбцы, добавленные после создания таблицы (для существующих файлов)
+_SQLITE_ADDED_COLUMNS = {"timezone": "TEXT", "last_sent_at": "TEXT", "last_sent_local_date": "TEXT"}
+
+def _row_to_reminder(reminder_time: str, reminder_days: Any, is_active: Any, timezone: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Приводит строку хранилища к формату reminder_users.
+    """
+    if isinstance(reminder_days, str):
+        reminder_days = json.loads(reminder_days)
+    # В Postgres тип TIME возвращается как "HH:MM:SS"
+    reminder = {
+        "time": str(reminder_time)[:5],
+        "days": list(reminder_days or []),
+        "active": bool(is_active)
+    }
+    if timezone:
+        reminder["timezone"] = timezone
+    return reminder
+
+class SQLiteReminderStore:
+    """
+    Хранилище напоминаний в локальном SQLite-файле.
+    """
+
+    def __init__(self, path: str = REMINDER_DB_PATH):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS reminders (
+                    user_id INTEGER NOT NULL,
+                    reminder_type TEXT NOT NULL,
+                    reminder_time TEXT NOT NULL,
+                    reminder_days TEXT NOT NULL,
+                    is_active INTEGER NOT NULL DEFAULT 1,
+                    timezone TEXT,
+                    last_sent_at TEXT,
+                    last_sent_local_date TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, reminder_type)
+                )
+                """
+            )
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(reminders)")}
+            for column, column_type in _SQLITE_ADDED_COLUMNS.items():
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE reminders ADD COLUMN {column} {column_type}")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS reminders_active_time "
+                "ON reminders (reminder_time) WHERE is_active = 1"
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    async def save(self, user_id: int, reminder: Dict[str, Any]) -> bool:
+        connection = self._connect()
+        # last_sent_at сохраняется, чтобы смена настроек не вызвала повторную отправку
+        connection.execute(
+            "INSERT INTO reminders "
+            "(user_id, reminder_type, reminder_time, reminder_days, is_active, timezone, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (user_id, reminder_type) DO UPDATE SET "
+            "reminder_time = excluded.reminder_time, reminder_days = excluded.reminder_days, "
+            "is_active = excluded.is_active, timezone = excluded.timezone, updated_at = excluded.updated_at",
+            (user_id, REMINDER_TYPE, reminder["time"], json.dumps(reminder["days"]),
+             int(reminder.get("active", False)), reminder.get("timezone"), time.time())
+        )
+        connection.commit()
+        return True
+
+    async def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT reminder_time, reminder_days, is_active, timezone FROM reminders "
+            "WHERE user_id = ? AND reminder_type = ?",
+            (user_id, REMINDER_TYPE)
+        ).fetchone()
+        return _row_to_reminder(*row) if row else None
+
+    async def load_all(self, page_size: int = REMINDER_LOAD_PAGE_SIZE) -> Dict[int, Dict[str, Any]]:
+        connection = self._connect()
+        reminders: Dict[int, Dict[str, Any]] = {}
+        after_user_id = 0
+        while True:
+            rows = connection.execute(
+                "SELECT user_id, reminder_time, reminder_days, is_active, timezone FROM reminders "
+                "WHERE reminder_type = ? AND user_id > ? ORDER BY user_id LIMIT ?",
+                (REMINDER_TYPE, after_user_id, page_size)
+            ).fetchall()
+            for user_id, reminder_time, reminder_days, is_active, tz_name in rows:
+                reminders[user_id] = _row_to_reminder(reminder_time, reminder_days, is_active, tz_name)
+            if len(rows) < page_size:
+                return reminders
+            after_user_id = rows[-1][0]
+
+    async def claim_due(self, moment: datetime, limit: int = REMINDER_CLAIM_BATCH) -> List[int]:
+        """
+        Забирает напоминания, которые нужно отправить в минуту moment.
+
+        Время напоминаний хранится в часовом поясе пользователя, поэтому для
+        каждой зоны из таблицы вычисляется местное время и выбираются строки
+        с этим временем, если в эту местную дату напоминание еще не отправлялось.
+        Выборка и пометка last_sent_at и last_sent_local_date выполняются в
+        одной транзакции с блокировкой записи.
+
+        Args:
+            moment: Минута UTC (наивное время)
+            limit: Максимальное число напоминаний
+
+        Returns:
+            List[int]: ID пользователей
+        """
+        connection = self._connect()
+        slot = moment.strftime("%Y-%m-%dT%H:%M")
+        moment_utc = moment.replace(tzinfo=timezone.utc)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            zones = [row[0] for row in connection.execute(
+                "SELECT DISTINCT COALESCE(timezone, ?) FROM reminders WHERE reminder_type = ? AND is_active = 1",
+                (DEFAULT_TIMEZONE, REMINDER_TYPE)
+            )]
+            claimed: List[int] = []
+            marks = []
+            for zone in zones:
+                if len(claimed) >= limit:
+                    break
+                try:
+                    local = moment_utc.astimezone(get_zone(zone))
+                except (ZoneInfoNotFoundError, ValueError):
+                    logger.warning(f"Неизвестный часовой пояс {zone} в хранилище напоминаний")
+                    continue
+                local_date = local.date().isoformat()
+                rows = connection.execute(
+                    "SELECT user_id FROM reminders "
+                    "WHERE reminder_type = ? AND is_active = 1 AND reminder_time = ? "
+                    "AND COALESCE(timezone, ?) = ? AND reminder_days LIKE ? "
+                    "AND (last_sent_at IS NULL OR last_sent_at < ?) "
+                    "AND (last_sent_local_date IS NULL OR last_sent_local_date < ?) "
+                    "ORDER BY user_id LIMIT ?",
+                    (REMINDER_TYPE, local.strftime("%H:%M"), DEFAULT_TIMEZONE, zone,
+                     f'%"{WEEKDAYS[local.weekday()]}"%', slot, local_date, limit - len(claimed))
+                ).fetchall()
+                claimed.extend(row[0] for row in rows)
+                marks.extend((slot, local_date, row[0], REMINDER_TYPE) for row in rows)
+            connection.executemany(
+                "UPDATE reminders SET last_sent_at = ?, last_sent_local_date = ? "
+                "WHERE user_id = ? AND reminder_type = ?",
+                marks
+            )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        return claimed
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+class SupabaseReminderStore:
+    """
+    Хранилище напоминаний в таблице reminders Supabase.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def save(self, user_id: int, reminder: Dict[str, Any]) -> bool:
+        return await self.db.save_reminder(user_id, {
+            "reminder_type": REMINDER_TYPE,
+            "reminder_time": reminder["time"],
+            "reminder_days": reminder["days"],
+            "is_active": bool(reminder.get("active", False)),
+            "timezone": reminder.get("timezone")
+        })
+
+    async def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        for row in await self.db.get_reminders(user_id):
+            if row.get("reminder_type") == REMINDER_TYPE:
+                return _row_to_reminder(row["reminder_time"], row["reminder_days"], row["is_active"], row.get("timezone"))
+        return None
+
+    async def load_all(self, page_size: int = REMINDER_LOAD_PAGE_SIZE) -> Dict[int, Dict[str, Any]]:
+        reminders: Dict[int, Dict[str, Any]] = {}
+        after_user_id = 0
+        while True:
+            rows = await self.db.list_reminders_page(REMINDER_TYPE, after_user_id, page_size)
+            for row in rows:
+                reminders[row["user_id"]] = _row_to_reminder(
+                    row["reminder_time"], row["reminder_days"], row["is_active"], row.get("timezone")
+                )
+            if len(rows) < page_size:
+                return reminders
+            after_user_id = rows[-1]["user_id"]
+
+    async def claim_due(self, moment: datetime, limit: int = REMINDER_CLAIM_BATCH) -> List[int]:
+        # Выборка и пометка выполняются в функции due_reminders на стороне базы
+        return await self.db.claim_due_reminders(
+            moment.replace(tzinfo=timezone.utc).isoformat(), REMINDER_TYPE, DEFAULT_TIMEZONE, limit
+        )
+
+    def close(self):
+        pass
+
+def create_reminder_store(kind: str = REMINDER_STORE):
+    """
+    Создает хранилище напоминаний; если Supabase недоступен, используется SQLite.
+
+    Args:
+        kind: "supabase" или "sqlite"
+
+    Returns:
+        Хранилище с методами save, load, load_all и claim_due
+    """
+    if kind == "supabase":
+        try:
+            from db_supabase import SupabaseDB
+            logger.info("Напоминания хранятся в Supabase")
+            return SupabaseReminderStore(SupabaseDB)
+        except Exception as e:
+            logger.warning(f"Supabase недоступен для напоминаний ({e}), используем {REMINDER_DB_PATH}")
+    logger.info(f"Напоминания хранятся в локальном файле {REMINDER_DB_PATH}")
+    return SQLiteReminderStore(REMINDER_DB_PATH)
+
+# Хранилище создается при первом обращении
+_store = None
+
+def get_reminder_store():
+    global _store
+    if _store is None:
+        _store = create_reminder_store()
+    return _store
+
+async def save_reminder(user_id: int, reminder: Dict[str, Any]) -> bool:
+    """
+    Сохраняет настройки напоминания пользователя.
+
+    Args:
+        user_id: ID пользователя
+        reminder: {"time": "HH:MM", "days": [...], "active": bool, "timezone": str}
+
+    Returns:
+        bool: True, если настройки сохранены
+    """
+    try:
+        return await get_reminder_store().save(user_id, reminder)
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении напоминания пользователя {user_id}: {e}")
+        return False
+
+async def load_reminders() -> Dict[int, Dict[str, Any]]:
+    """
+    Загружает настройки напоминаний всех пользователей.
+
+    Returns:
+        Dict[int, Dict[str, Any]]: {user_id: {"time", "days", "active", "timezone"}}
+    """
+    started_at = time.perf_counter()
+    reminders = await get_reminder_store().load_all()
+    logger.info(f"Загружено {len(reminders)} напоминаний за {time.perf_counter() - started_at:.2f} с")
+    return reminders
+
+async def load_reminder(user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Загружает настройки напоминания одного пользователя.
+
+    Args:
+        user_id: ID пользователя
+
+    Returns:
+        Optional[Dict[str, Any]]: Настройки или None, если их нет
+    """
+    try:
+        return await get_reminder_store().load(user_id)
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке напоминания пользователя {user_id}: {e}")
+        return None
+
+async def claim_due_reminders(moment: datetime) -> List[int]:
+    """
+    Забирает все напоминания минуты moment (постранично по REMINDER_CLAIM_BATCH).
+
+    Напоминание помечается отправленным до отправки: если бот упадет между
+    пометкой и отправкой, это напоминание будет пропущено, но не продублировано.
+
+    Args:
+        moment: Минута UTC (наивное время)
+
+    Returns:
+        List[int]: ID пользователей
+    """
+    store = get_reminder_store()
+    user_ids: List[int] = []
+    while True:
+        page = await store.claim_due(moment, REMINDER_CLAIM_BATCH)
+        user_ids.extend(page)
+        if len(page) < REMINDER_CLAIM_BATCH:
+            return user_ids
+
+def close_reminder_store():
+    if _store is not None:
+        _store.close()
@@ -0,0 +1,216 @@
+"""
+Семантический кэш ответов на частые вопросы.
+
+Сообщение превращается в вектор хэшированных символьных n-грамм, и для того же
+типа личности ищется ближайший сохраненный вопрос. Если сходство выше порога,
+пользователь получает сохраненный ответ без запроса к OpenAI. Вопросы с разными
+отрицаниями ("мне нравится" и "мне не нравится") близки по n-граммам, поэтому
+совпадать должны и слова отрицания.
+Кэш включается переменной окружения SEMANTIC_CACHE_ENABLED=1.
+"""
+
+import os
+import re
+import math
+import time
+import zlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Параметры кэша (можно переопределить через переменные окружения)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.86"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "500"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Размерность хэшированного пространства признаков и длина n-грамм
+VECTOR_DIMENSIONS = 2048
+NGRAM_SIZE = 3
+
+# Слишком короткие и слишком длинные сообщения не кэшируем
+MIN_MESSAGE_LENGTH = 8
+MAX_MESSAGE_LENGTH = 300
+
+# Слова отрицания, меняющие смысл вопроса при почти тех же n-граммах
+NEGATION_WORDS = frozenset({"не", "нет", "ни"})
+
+_NON_WORD_RE = re.compile(r"[^\w\s]+")
+_SPACES_RE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """
+    Приводит текст к нижнему регистру и убирает пунктуацию и лишние пробелы.
+    """
+    text = text.lower().replace("ё", "е")
+    text = _NON_WORD_RE.sub(" ", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+def negation_signature(text: str) -> Tuple[str, ...]:
+    """
+    Слова отрицания сообщения (с повторами) в отсортированном виде.
+    """
+    return tuple(sorted(word for word in normalize_text(text).split() if word in NEGATION_WORDS))
+
+def embed_text(text: str) -> Dict[int, float]:
+    """
+    Строит нормированный разреженный вектор хэшированных символьных n-грамм.
+
+    Args:
+        text: Текст сообщения
+
+    Returns:
+        Dict[int, float]: Индекс признака -> вес (L2-норма равна 1)
+    """
+    vector: Dict[int, float] = {}
+    for word in normalize_text(text).split():
+        padded = f" {word} "
+        for i in range(max(1, len(padded) - NGRAM_SIZE + 1)):
+            ngram = padded[i:i + NGRAM_SIZE]
+            index = zlib.crc32(ngram.encode("utf-8")) % VECTOR_DIMENSIONS
+            vector[index] = vector.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    if norm:
+        for index in vector:
+            vector[index] /= norm
+    return vector
+
+def cosine_similarity(a: Dict[int, float], b: Dict[int, float]) -> float:
+    """
+    Косинусное сходство двух нормированных разреженных векторов.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(index, 0.0) for index, weight in a.items())
+
+class SemanticResponseCache:
+    """
+    Кэш ответов с поиском ближайшего вопроса для каждого ключа (тип личности, режим).
+
+    max_entries ограничивает общее число записей всех ключей: при переполнении
+    вытесняется запись, к которой дольше всего не обращались.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl: int = SEMANTIC_CACHE_TTL
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # {ключ: {нормализованный вопрос -> запись}} - для поиска внутри ключа
+        self._entries: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
+        # Общий порядок LRU: (ключ, нормализованный вопрос)
+        self._lru: "OrderedDict[Tuple[Tuple[str, str], str], None]" = OrderedDict()
+        self.stats = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "saved_tokens": 0}
+
+    @staticmethod
+    def is_cacheable(text: str) -> bool:
+        """
+        Проверяет, подходит ли сообщение для кэширования.
+        """
+        return MIN_MESSAGE_LENGTH <= len(text.strip()) <= MAX_MESSAGE_LENGTH
+
+    def lookup(self, personality_type: str, mode: str, text: str) -> Optional[str]:
+        """
+        Ищет сохраненный ответ на похожий вопрос.
+
+        Args:
+            personality_type: Тип личности пользователя
+            mode: Режим общения
+            text: Сообщение пользователя
+
+        Returns:
+            Optional[str]: Сохраненный ответ или None
+        """
+        if not self.is_cacheable(text):
+            return None
+        self.stats["lookups"] += 1
+        bucket_key = (personality_type, mode)
+        bucket = self._entries.get(bucket_key)
+        if not bucket:
+            self.stats["misses"] += 1
+            return None
+
+        now = time.time()
+        vector = embed_text(text)
+        negations = negation_signature(text)
+        best_key, best_score = None, 0.0
+        for key, entry in list(bucket.items()):
+            if now - entry["created_at"] > self.ttl:
+                self._remove(bucket_key, key)
+                continue
+            if entry["negations"] != negations:
+                continue
+            score = cosine_similarity(vector, entry["vector"])
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if best_key is None or best_score < self.threshold:
+            self.stats["misses"] += 1
+            return None
+
+        entry = bucket[best_key]
+        self._lru.move_to_end((bucket_key, best_key))
+        entry["hits"] += 1
+        self.stats["hits"] += 1
+        self.stats["saved_tokens"] += entry["tokens"]
+        logger.info(f"Семантический кэш: попадание (сходство {best_score:.2f}, тип {personality_type})")
+        return entry["answer"]
+
+    def store(self, personality_type: str, mode: str, text: str, answer: str, tokens: int = 0):
+        """
+        Сохраняет ответ на вопрос.
+
+        Args:
+            personality_type: Тип личности пользователя
+            mode: Режим общения
+            text: Сообщение пользователя
+            answer: Ответ модели
+            tokens: Количество токенов, потраченных на ответ
+        """
+        if not self.is_cacheable(text) or not answer:
+            return
+        bucket_key = (personality_type, mode)
+        bucket = self._entries.setdefault(bucket_key, {})
+        key = normalize_text(text)
+        bucket[key] = {
+            "vector": embed_text(text),
+            "negations": negation_signature(text),
+            "answer": answer,
+            "tokens": tokens,
+            "created_at": time.time(),
+            "hits": 0
+        }
+        self._lru[(bucket_key, key)] = None
+        self._lru.move_to_end((bucket_key, key))
+        while len(self._lru) > self.max_entries:
+            self._remove(*next(iter(self._lru)))
+        self.stats["stores"] += 1
+
+    def _remove(self, bucket_key: Tuple[str, str], key: str):
+        self._lru.pop((bucket_key, key), None)
+        bucket = self._entries.get(bucket_key)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._entries[bucket_key]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику кэша: попадания, промахи, сэкономленные токены.
+        """
+        lookups = self.stats["lookups"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "entries": len(self._lru)
+        }
+
+# Общий кэш ответов
+response_cache = SemanticResponseCache()
@@ -0,0 +1,350 @@
+"""
+Режим нескольких процессов на одной машине.
+
+Один asyncio-цикл упирается в одно ядро процессора (сериализация JSON,
+сборка промптов, логирование). В режиме WORKER_PROCESSES=N главный процесс
+(супервизор) только получает обновления Telegram (polling или webhook) и
+раскладывает их по N рабочим процессам через очереди multiprocessing:
+- процесс выбирается по user_id, поэтому все обновления пользователя
+  обрабатывает один процесс (его FSM в памяти и порядок сообщений сохраняются);
+- внутри процесса обновления одного пользователя обрабатываются по очереди,
+  разных пользователей - параллельно;
+- процессы раз в WORKER_HEALTH_INTERVAL секунд присылают статистику,
+  супервизор собирает ее и перезапускает упавшие процессы.
+"""
+
+import os
+import time
+import queue
+import signal
+import asyncio
+import logging
+import multiprocessing
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+from aiohttp import web
+from aiogram import Bot
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Параметры режима (можно переопределить через переменные окружения)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+WORKER_HEALTH_INTERVAL = float(os.getenv("WORKER_HEALTH_INTERVAL", "5"))
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "30"))
+
+# Поля обновления, в которых есть пользователь
+_UPDATE_EVENTS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "poll_answer", "my_chat_member", "chat_member",
+    "chat_join_request", "channel_post", "edited_channel_post"
+)
+
+# Обработка одного обновления в рабочем процессе
+HandleUpdate = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+def configure_worker_environment(environ=os.environ):
+    """
+    Настраивает окружение, которое наследуют рабочие процессы.
+
+    Напоминания рассылает процесс 0, а настройки пользователей меняют все
+    процессы. Индекс в памяти процесса 0 (REMINDER_MODE=memory) не увидел бы
+    этих изменений, поэтому рабочие процессы всегда забирают напоминания из базы.
+    Процессы работают в режиме INSTANCE_MODE=multi: рассылку выполняет только
+    лидер по общей аренде (Redis или COORDINATION_DB_PATH), а перезапущенный
+    процесс не начнет рассылку, пока аренда прежнего не истекла.
+
+    Args:
+        environ: Переменные окружения
+    """
+    if environ.get("REMINDER_MODE", "").lower() == "memory":
+        logger.warning("REMINDER_MODE=memory не поддерживается при WORKER_PROCESSES > 1, используем pull")
+    environ["REMINDER_MODE"] = "pull"
+    environ["INSTANCE_MODE"] = "multi"
+
+def update_user_id(update: Dict[str, Any]) -> Optional[int]:
+    """
+    Находит пользователя (или чат) обновления Telegram.
+
+    Args:
+        update: Обновление в виде JSON-словаря
+
+    Returns:
+        Optional[int]: ID пользователя, чата или None
+    """
+    for key in _UPDATE_EVENTS:
+        event = update.get(key)
+        if not event:
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat")
+        if chat:
+            return chat["id"]
+    return None
+
+def shard_for(user_id: Optional[int], count: int) -> int:
+    """
+    Номер рабочего процесса для пользователя (одинаковый во всех процессах).
+    """
+    if user_id is None or count <= 1:
+        return 0
+    return user_id % count
+
+class Supervisor:
+    """
+    Запускает рабочие процессы, раздает им обновления и собирает их состояние.
+    """
+
+    def __init__(
+        self,
+        target: Callable,
+        workers: int = WORKER_PROCESSES,
+        queue_size: int = WORKER_QUEUE_SIZE,
+        health_interval: float = WORKER_HEALTH_INTERVAL
+    ):
+        self.target = target
+        self.workers = max(1, workers)
+        self.health_interval = health_interval
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue(queue_size) for _ in range(self.workers)]
+        self.health_queue = self._context.Queue()
+        self.processes: list = [None] * self.workers
+        self.health: Dict[int, Dict[str, Any]] = {}
+        self._monitor_task: Optional[asyncio.Task] = None
+        self.stats = {"dispatched": 0, "backpressure": 0, "restarts": 0}
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=self.target,
+            args=(index, self.workers, self.queues[index], self.health_queue),
+            name=f"bot-worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info(f"Запущен рабочий процесс {index} (pid {process.pid})")
+
+    def start(self):
+        configure_worker_environment()
+        for index in range(self.workers):
+            self._spawn(index)
+        self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def dispatch(self, update: Dict[str, Any]):
+        """
+        Передает обновление процессу, который обслуживает его пользователя.
+        Если очередь процесса заполнена, ждет (не блокируя цикл событий).
+        """
+        index = shard_for(update_user_id(update), self.workers)
+        try:
+            self.queues[index].put_nowait(update)
+        except queue.Full:
+            self.stats["backpressure"] += 1
+            await asyncio.get_running_loop().run_in_executor(None, self.queues[index].put, update)
+        self.stats["dispatched"] += 1
+
+    def _collect_health(self):
+        while True:
+            try:
+                report = self.health_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.health[report["worker"]] = report
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            self._collect_health()
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive():
+                    self.stats["restarts"] += 1
+                    logger.error(f"Рабочий процесс {index} завершился с кодом {process.exitcode}, перезапускаем")
+                    self._spawn(index)
+
+    def get_health(self) -> Dict[str, Any]:
+        """
+        Сводное состояние рабочих процессов.
+
+        Returns:
+            Dict[str, Any]: Живые процессы, обработанные обновления, ошибки и очереди
+        """
+        self._collect_health()
+        now = time.time()
+        workers = {}
+        for index, process in enumerate(self.processes):
+            report = self.health.get(index, {})
+            workers[index] = {
+                "alive": process is not None and process.is_alive(),
+                "pid": process.pid if process is not None else None,
+                "processed": report.get("processed", 0),
+                "errors": report.get("errors", 0),
+                "in_flight": report.get("in_flight", 0),
+                "heartbeat_age": round(now - report["time"], 1) if report else None
+            }
+        return {
+            **self.stats,
+            "workers_alive": sum(1 for worker in workers.values() if worker["alive"]),
+            "processed": sum(worker["processed"] for worker in workers.values()),
+            "errors": sum(worker["errors"] for worker in workers.values()),
+            "workers": workers
+        }
+
+    async def stop(self, timeout: float = 30.0):
+        """
+        Останавливает процессы: каждый дообрабатывает свою очередь и завершается.
+        """
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+        loop = asyncio.get_running_loop()
+        for worker_queue in self.queues:
+            await loop.run_in_executor(None, worker_queue.put, None)
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logger.warning(f"Рабочий процесс {index} не завершился за {timeout} с, останавливаем принудительно")
+                process.terminate()
+
+async def consume_updates(
+    update_queue,
+    handle: HandleUpdate,
+    worker: int,
+    health_queue=None,
+    health_interval: float = WORKER_HEALTH_INTERVAL
+):
+    """
+    Цикл рабочего процесса: читает обновления из очереди до сигнала остановки (None).
+
+    Обновления одного пользователя выполняются строго по очереди, разных
+    пользователей - параллельно.
+
+    Args:
+        update_queue: Очередь обновлений процесса
+        handle: Обработка одного обновления
+        worker: Номер процесса
+        health_queue: Очередь отчетов о состоянии
+        health_interval: Период отчетов в секундах
+    """
+    loop = asyncio.get_running_loop()
+    # Последняя задача каждого пользователя: следующая ждет ее завершения
+    chains: Dict[Optional[int], asyncio.Task] = {}
+    stats = {"processed": 0, "errors": 0}
+
+    def report():
+        if health_queue is not None:
+            health_queue.put({"worker": worker, "pid": os.getpid(), "time": time.time(), "in_flight": len(chains), **stats})
+
+    async def run(update: Dict[str, Any], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await handle(update)
+            stats["processed"] += 1
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error(f"Ошибка при обработке обновления {update.get('update_id')}: {e}")
+
+    def forget(key: Optional[int], task: asyncio.Task):
+        if chains.get(key) is task:
+            del chains[key]
+
+    async def heartbeat():
+        while True:
+            report()
+            await asyncio.sleep(health_interval)
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            update = await loop.run_in_executor(None, update_queue.get)
+            if update is None:
+                break
+            key = update_user_id(update)
+            task = asyncio.create_task(run(update, chains.get(key)))
+            chains[key] = task
+            task.add_done_callback(lambda done, key=key: forget(key, done))
+        if chains:
+            await asyncio.wait(list(chains.values()))
+    finally:
+        heartbeat_task.cancel()
+        report()
+
+async def _poll_updates(bot: Bot, supervisor: Supervisor, stop_event: asyncio.Event):
+    offset = None
+    failures = 0
+    while not stop_event.is_set():
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT)
+            failures = 0
+        except Exception as e:
+            failures += 1
+            logger.error(f"Ошибка при получении обновлений: {e}")
+            await asyncio.sleep(min(2 ** failures, 30))
+            continue
+        for update in updates:
+            offset = update.update_id + 1
+            await supervisor.dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+
+def create_supervisor_app(supervisor: Supervisor, secret: str, path: str) -> web.Application:
+    """
+    HTTP-сервер супервизора: принимает webhook Telegram и отдает состояние процессов.
+    """
+    async def handle_update(request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401)
+        await supervisor.dispatch(await request.json())
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        report = supervisor.get_health()
+        status = 200 if report["workers_alive"] == supervisor.workers else 503
+        return web.json_response(report, status=status)
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get("/health", health)
+    return app
+
+async def run_supervisor(bot: Bot, stop_event: asyncio.Event, worker_target: Callable, mode: str = "polling"):
+    """
+    Запускает рабочие процессы и раздает им обновления до сигнала остановки.
+
+    Args:
+        bot: Bot (используется только для получения обновлений)
+        stop_event: Событие остановки
+        worker_target: Функция рабочего процесса (index, count, queue, health_queue)
+        mode: "polling" или "webhook"
+    """
+    supervisor = Supervisor(worker_target)
+    supervisor.start()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    runner = None
+    try:
+        if mode == "webhook":
+            from services.webhook import (
+                WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_MAX_CONNECTIONS, webhook_url, webhook_secret
+            )
+            secret = webhook_secret(bot.token)
+            runner = web.AppRunner(create_supervisor_app(supervisor, secret, WEBHOOK_PATH))
+            await runner.setup()
+            await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+            await bot.set_webhook(webhook_url(), secret_token=secret, max_connections=WEBHOOK_MAX_CONNECTIONS)
+            logger.info(f"Супервизор принимает webhook на {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+            await stop_event.wait()
+        else:
+            polling = asyncio.create_task(_poll_updates(bot, supervisor, stop_event))
+            await stop_event.wait()
+            polling.cancel()
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+        await supervisor.stop()
+        logger.info(f"Рабочие процессы остановлены: {supervisor.get_health()}")
@@ -1,139 +1,163 @@
+import io
 import os
+import asyncio
 import logging
-import tempfile
-from typing import Optional
+from typing import Optional, Tuple, Union, BinaryIO
 
-import httpx
-from openai import AsyncOpenAI
 from aiogram.types import Voice
 
+from services.audio_preprocess import preprocess_voice
+from services.stt_backends import get_backends, transcribe_with_fallback
+from services.transcript_cache import MODEL_VERSION_SEPARATOR, TRANSCRIPT_CACHE_ENABLED, transcript_cache
+
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Проверка наличия API-ключа OpenAI
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    logger.warning("OPENAI_API_KEY не найден в переменных окружения. Функция распознавания голоса будет недоступна.")
+# Максимальный размер голосового сообщения (Bot API отдает файлы до 20 МБ)
+VOICE_MAX_BYTES = int(os.getenv("VOICE_MAX_BYTES", str(20 * 1024 * 1024)))
 
-# Инициализация клиента OpenAI с API-ключом из переменных окружения (если доступен)
-http_client = httpx.AsyncClient()
-client = None
-if OPENAI_API_KEY:
-    try:
-        client = AsyncOpenAI(
-            api_key=OPENAI_API_KEY,
-            http_client=http_client
-        )
-    except Exception as e:
-        logger.error(f"Ошибка при инициализации OpenAI API: {e}")
-
-async def download_voice_message(bot, voice: Voice) -> Optional[str]:
+async def download_voice_message(bot, voice: Voice) -> Optional[bytes]:
     """
-    Скачивает голосовое сообщение.
+    Скачивает голосовое сообщение в память (без временных файлов).
     
     Args:
         bot: Экземпляр бота для получения файла.
         voice: Голосовое сообщение.
         
     Returns:
-        Optional[str]: Путь к временному файлу с голосовым сообщением или None в случае ошибки.
+        Optional[bytes]: Содержимое OGG-файла или None в случае ошибки.
     """
+    # Размер известен заранее - слишком большие файлы не скачиваем
+    if voice.file_size and voice.file_size > VOICE_MAX_BYTES:
+        logger.warning(f"Голосовое сообщение слишком большое: {voice.file_size} байт (лимит {VOICE_MAX_BYTES})")
+        return None
+    
     try:
-        # Получение информации о файле
-        file_info = await bot.get_file(voice.file_id)
-        file_path = file_info.file_path
-        
-        # Создание временного файла
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".ogg")
-        file_name = temp_file.name
-        temp_file.close()
+        buffer = io.BytesIO()
+        await bot.download(voice, destination=buffer)
+        data = buffer.getvalue()
         
-        # Скачивание файла
-        await bot.download_file(file_path, file_name)
+        if len(data) > VOICE_MAX_BYTES:
+            logger.warning(f"Голосовое сообщение превышает лимит после скачивания: {len(data)} байт")
+            return None
         
-        logger.info(f"Голосовое сообщение скачано: {file_name}")
-        return file_name
+        logger.info(f"Голосовое сообщение скачано в память: {len(data)} байт")
+        return data
     except Exception as e:
         logger.error(f"Ошибка при скачивании голосового сообщения: {e}")
         return None
 
-async def transcribe_voice(file_path: str) -> Optional[str]:
+def _read_audio(audio: Union[bytes, BinaryIO, str]) -> bytes:
     """
-    Транскрибирует голосовое сообщение в текст с помощью OpenAI Whisper API.
+    Приводит аудио к байтам: принимает байты, файловый объект или путь к файлу.
+    """
+    if isinstance(audio, (bytes, bytearray)):
+        return bytes(audio)
+    if isinstance(audio, str):
+        with open(audio, "rb") as audio_file:
+            return audio_file.read()
+    audio.seek(0)
+    return audio.read()
+
+async def transcribe_audio(
+    audio: Union[bytes, BinaryIO, str],
+    language: str = "ru",
+    duration: Optional[int] = None
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Транскрибирует аудио и сообщает, какими моделями оно распознано.
+    
+    Перед распознаванием из записи вырезается тишина, а длинные записи делятся
+    на части, которые распознаются параллельно. Движки распознавания (OpenAI
+    Whisper API, локальный faster-whisper) перебираются в порядке из STT_BACKENDS.
     
     Args:
-        file_path: Путь к аудиофайлу
+        audio: Содержимое аудиофайла (байты или файловый объект в памяти);
+               путь к файлу поддерживается для обратной совместимости
+        language: Код языка распознавания
+        duration: Длительность записи в секундах (Voice.duration), если известна
         
     Returns:
-        str или None: Распознанный текст или None в случае ошибки
+        Tuple[Optional[str], Optional[str]]: Текст (пустая строка, если в записи
+        нет речи, None в случае ошибки) и версии моделей через "+"
     """
-    if not client:
-        logger.error("OpenAI API недоступен для транскрибирования голосового сообщения")
-        return None
-    
     try:
-        # Открываем файл и отправляем его в OpenAI API
-        with open(file_path, "rb") as audio_file:
-            response = await client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="ru",  # Ставим русский язык
-                response_format="text"
-            )
-        
-        logger.info(f"Получен ответ от OpenAI API: {type(response)}")
-        
-        # В версии OpenAI API v1.79.0+ response - это строка для response_format="text"
-        if isinstance(response, str):
-            logger.info("Успешно получен текстовый ответ")
-            return response
-        
-        # Обработка для других случаев (обратная совместимость)
-        if hasattr(response, 'text'):
-            logger.info("Получен ответ в формате объекта с атрибутом text")
-            return response.text
-            
-        # Для OpenAI API v1.x, возможно, ответ находится в поле 'text'
-        if isinstance(response, dict) and 'text' in response:
-            logger.info("Получен ответ в формате словаря с ключом 'text'")
-            return response['text']
-        
-        # Для случая, когда ответ - это объект с данными
-        if hasattr(response, 'data') and hasattr(response.data, 'text'):
-            logger.info("Получен ответ в формате объекта с data.text")
-            return response.data.text
-        
-        # Для случая с другими форматами ответа
-        logger.warning(f"Необычный формат ответа от OpenAI API: {type(response)}")
-        # Логируем детали ответа для отладки
-        logger.debug(f"Детали ответа: {response}")
-        
-        # Пытаемся преобразовать ответ в строку
-        return str(response)
-    
+        audio_bytes = _read_audio(audio)
     except Exception as e:
-        logger.error(f"Ошибка при транскрибировании голосового сообщения: {e}")
-        # Логируем подробную информацию об исключении для отладки
-        import traceback
-        logger.error(f"Детали ошибки: {traceback.format_exc()}")
-        return None
+        logger.error(f"Ошибка при чтении аудио для транскрибирования: {e}")
+        return None, None
+    
+    chunks = await preprocess_voice(audio_bytes, duration)
+    if not chunks:
+        # Речи нет - распознавание не вызываем
+        return "", ""
+    
+    results = await asyncio.gather(*(transcribe_with_fallback(chunk, language) for chunk in chunks))
+    texts = [text for text, _ in results]
+    if all(text is None for text in texts):
+        logger.error("Не удалось транскрибировать голосовое сообщение ни одним движком")
+        return None, None
+    
+    model_version = MODEL_VERSION_SEPARATOR.join(sorted({version for _, version in results if version}))
+    if any(text is None for text in texts):
+        # Неполная расшифровка отдается пользователю, но без версии модели - ее не кэшируем
+        logger.warning(f"Не распознано частей голосового сообщения: {texts.count(None)} из {len(texts)}")
+        model_version = None
+    
+    logger.info(f"Голосовое сообщение распознано ({model_version}), частей: {len(chunks)}")
+    return " ".join(text.strip() for text in texts if text), model_version
 
-async def process_voice_message(bot, voice: Voice) -> Optional[str]:
+async def transcribe_voice(
+    audio: Union[bytes, BinaryIO, str],
+    language: str = "ru",
+    duration: Optional[int] = None
+) -> Optional[str]:
+    """
+    Транскрибирует голосовое сообщение в текст.
+    
+    Args:
+        audio: Содержимое аудиофайла (байты, файловый объект или путь к файлу)
+        language: Код языка распознавания
+        duration: Длительность записи в секундах (Voice.duration), если известна
+        
+    Returns:
+        str или None: Распознанный текст, пустая строка, если в записи нет речи,
+        или None в случае ошибки
+    """
+    text, _ = await transcribe_audio(audio, language, duration)
+    return text
+
+async def process_voice_message(bot, voice: Voice, language: str = "ru") -> Optional[str]:
     """
     Обрабатывает голосовое сообщение: скачивает и транскрибирует.
     
+    Сначала проверяется кэш расшифровок по voice.file_unique_id: для пересланных
+    и повторно отправленных сообщений файл не скачивается и не распознается.
+    
     Args:
         bot: Экземпляр бота для получения файла.
         voice: Голосовое сообщение.
+        language: Код языка распознавания.
         
     Returns:
-        Optional[str]: Распознанный текст или None в случае ошибки.
+        Optional[str]: Распознанный текст, пустая строка, если в записи нет речи,
+        или None в случае ошибки.
     """
-    # Скачиваем голосовое сообщение
-    file_path = await download_voice_message(bot, voice)
-    if not file_path:
+    file_unique_id = getattr(voice, "file_unique_id", None)
+    if TRANSCRIPT_CACHE_ENABLED and file_unique_id:
+        allowed_versions = [backend.model_version for backend in get_backends()]
+        cached = transcript_cache.lookup(file_unique_id, language, allowed_versions)
+        if cached is not None:
+            logger.info(f"Расшифровка голосового сообщения {file_unique_id} взята из кэша")
+            return cached
+    
+    # Скачиваем голосовое сообщение в память
+    audio = await download_voice_message(bot, voice)
+    if not audio:
         return None
     
     # Транскрибируем голосовое сообщение
-    text = await transcribe_voice(file_path)
-    return text 
\ No newline at end of file
+    text, model_version = await transcribe_audio(audio, language, voice.duration)
+    if TRANSCRIPT_CACHE_ENABLED and file_unique_id and text is not None and model_version is not None:
+        transcript_cache.store(file_unique_id, language, model_version, text)
+    return text
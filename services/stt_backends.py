@@ -0,0 +1,248 @@
+"""
+Движки распознавания речи для services.stt.
+
+Доступны два движка:
+- openai: OpenAI Whisper API (whisper-1);
+- local: локальная модель faster-whisper на CPU с квантизацией int8,
+  работающая в отдельном пуле процессов, чтобы не блокировать event loop.
+
+Порядок движков задается переменной STT_BACKENDS (например, "local,openai"):
+если первый движок недоступен или не справился, используется следующий.
+"""
+
+import io
+import os
+import abc
+import asyncio
+import logging
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from services.openai_client import get_openai_client
+from services.openai_limiter import call_openai
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Порядок движков распознавания (первый доступный используется в первую очередь)
+STT_BACKENDS = [name.strip() for name in os.getenv("STT_BACKENDS", "openai,local").split(",") if name.strip()]
+
+# Параметры локального движка
+LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "small")
+LOCAL_STT_COMPUTE_TYPE = os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8")
+LOCAL_STT_WORKERS = int(os.getenv("LOCAL_STT_WORKERS", "1"))
+LOCAL_STT_CPU_THREADS = int(os.getenv("LOCAL_STT_CPU_THREADS", "2"))
+
+# faster-whisper необязателен; сам модуль импортируется только в процессах пула
+FASTER_WHISPER_AVAILABLE = importlib.util.find_spec("faster_whisper") is not None
+if not FASTER_WHISPER_AVAILABLE:
+    logger.info("Пакет faster-whisper не установлен, локальное распознавание речи недоступно")
+
+class STTBackend(abc.ABC):
+    """
+    Базовый класс движка распознавания речи.
+    """
+
+    name = "base"
+
+    @property
+    def model_version(self) -> str:
+        """
+        Идентификатор модели (используется, например, в кэше расшифровок).
+        """
+        return self.name
+
+    def is_available(self) -> bool:
+        return False
+
+    @abc.abstractmethod
+    async def transcribe(self, audio: bytes, language: str) -> Optional[str]:
+        """
+        Распознает речь в аудио.
+
+        Args:
+            audio: Содержимое аудиофайла (OGG/Opus)
+            language: Код языка (например, "ru")
+
+        Returns:
+            Optional[str]: Распознанный текст или None
+        """
+
+    async def shutdown(self):
+        pass
+
+def _response_to_text(response) -> str:
+    """
+    Извлекает текст из ответа Whisper API в разных версиях SDK.
+    """
+    # В версии OpenAI API v1.79.0+ response - это строка для response_format="text"
+    if isinstance(response, str):
+        return response
+    if hasattr(response, "text"):
+        return response.text
+    if isinstance(response, dict) and "text" in response:
+        return response["text"]
+    if hasattr(response, "data") and hasattr(response.data, "text"):
+        return response.data.text
+    logger.warning(f"Необычный формат ответа от OpenAI API: {type(response)}")
+    return str(response)
+
+class OpenAIWhisperBackend(STTBackend):
+    """
+    Распознавание через OpenAI Whisper API.
+    """
+
+    name = "openai"
+    model = "whisper-1"
+
+    @property
+    def model_version(self) -> str:
+        return f"openai:{self.model}"
+
+    def is_available(self) -> bool:
+        return get_openai_client("stt") is not None
+
+    async def transcribe(self, audio: bytes, language: str) -> Optional[str]:
+        client = get_openai_client("stt")
+        if not client:
+            return None
+        # Аудио передается из памяти как (имя файла, байты, тип): имя нужно API
+        # для определения формата, а неизменяемые байты безопасно отправлять повторно
+        response = await call_openai(
+            client.audio.transcriptions.create,
+            caller="stt",
+            model=self.model,
+            file=("voice.ogg", audio, "audio/ogg"),
+            language=language,
+            response_format="text"
+        )
+        return _response_to_text(response)
+
+# Модель faster-whisper в процессе пула (загружается один раз на процесс)
+_local_model = None
+
+def _local_worker_init(model_size: str, compute_type: str, cpu_threads: int):
+    """
+    Загружает модель faster-whisper при старте процесса пула.
+    """
+    global _local_model
+    from faster_whisper import WhisperModel
+    _local_model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+def _local_worker_transcribe(audio: bytes, language: str) -> str:
+    """
+    Распознает речь в процессе пула (faster-whisper декодирует OGG сам).
+    """
+    segments, _ = _local_model.transcribe(io.BytesIO(audio), language=language, beam_size=1)
+    return "".join(segment.text for segment in segments).strip()
+
+class LocalWhisperBackend(STTBackend):
+    """
+    Локальное распознавание faster-whisper (CPU, int8) в пуле процессов.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_size: str = LOCAL_STT_MODEL,
+        compute_type: str = LOCAL_STT_COMPUTE_TYPE,
+        workers: int = LOCAL_STT_WORKERS,
+        cpu_threads: int = LOCAL_STT_CPU_THREADS
+    ):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.workers = max(1, workers)
+        self.cpu_threads = cpu_threads
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def model_version(self) -> str:
+        return f"local:faster-whisper-{self.model_size}-{self.compute_type}"
+
+    def is_available(self) -> bool:
+        return FASTER_WHISPER_AVAILABLE
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Пул создается при первом обращении, модель загружается в каждом процессе один раз
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_local_worker_init,
+                initargs=(self.model_size, self.compute_type, self.cpu_threads)
+            )
+            logger.info(
+                f"Запущен пул локального распознавания: {self.workers} процесс(ов), "
+                f"модель {self.model_size} ({self.compute_type})"
+            )
+        return self._executor
+
+    async def transcribe(self, audio: bytes, language: str) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), _local_worker_transcribe, audio, language)
+
+    async def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Пул локального распознавания остановлен")
+
+# Зарегистрированные движки
+BACKENDS: Dict[str, STTBackend] = {
+    "openai": OpenAIWhisperBackend(),
+    "local": LocalWhisperBackend()
+}
+
+def get_backends() -> List[STTBackend]:
+    """
+    Возвращает доступные движки в порядке из STT_BACKENDS.
+
+    Returns:
+        List[STTBackend]: Движки для перебора при распознавании
+    """
+    backends = []
+    for name in STT_BACKENDS:
+        backend = BACKENDS.get(name)
+        if backend is None:
+            logger.warning(f"Неизвестный движок распознавания речи: {name}")
+            continue
+        if backend.is_available():
+            backends.append(backend)
+    return backends
+
+async def transcribe_with_fallback(audio: bytes, language: str = "ru") -> Tuple[Optional[str], Optional[str]]:
+    """
+    Распознает речь первым успешным движком.
+
+    Args:
+        audio: Содержимое аудиофайла
+        language: Код языка
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: Текст и версия модели, которая его распознала
+    """
+    backends = get_backends()
+    if not backends:
+        logger.error("Нет доступных движков распознавания речи")
+        return None, None
+
+    for backend in backends:
+        try:
+            text = await backend.transcribe(audio, language)
+            if text is not None:
+                return text, backend.model_version
+            logger.warning(f"Движок {backend.name} не вернул текст, пробуем следующий")
+        except Exception as e:
+            logger.error(f"Ошибка движка распознавания {backend.name}: {e}")
+    return None, None
+
+async def shutdown_stt_backends():
+    """
+    Останавливает движки распознавания (пул процессов локальной модели).
+    """
+    for backend in BACKENDS.values():
+        try:
+            await backend.shutdown()
+        except Exception as e:
+            logger.error(f"Ошибка при остановке движка распознавания {backend.name}: {e}")
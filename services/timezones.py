@@ -0,0 +1,181 @@
+"""
+Часовые пояса пользователей.
+
+Ответ на вопрос опроса "timezone" - свободный текст ("UTC+3", "GMT+5:30", "МСК+2",
+"Europe/Berlin", "Новосибирск"). parse_timezone приводит его к имени зоны IANA,
+а next_offset_change находит ближайший переход на летнее/зимнее время, чтобы
+диспетчер напоминаний пересчитывал расписание зоны только в момент перехода.
+"""
+
+import os
+import re
+import logging
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Часовой пояс, если пользователь его не указал или указал непонятно
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+
+# Горизонт поиска перехода на летнее/зимнее время
+TRANSITION_SEARCH_DAYS = 366
+
+# Смещения, не кратные часу (для целых часов используются зоны Etc/GMT)
+_FRACTIONAL_OFFSET_ZONES = {
+    (-3, 30): "America/St_Johns",
+    (3, 30): "Asia/Tehran",
+    (4, 30): "Asia/Kabul",
+    (5, 30): "Asia/Kolkata",
+    (5, 45): "Asia/Kathmandu",
+    (6, 30): "Asia/Yangon",
+    (9, 30): "Australia/Darwin",
+    (10, 30): "Australia/Adelaide"
+}
+
+# Города и сокращения, которые пользователи пишут вместо смещения
+_CITY_ZONES = {
+    "мск": "Europe/Moscow",
+    "москва": "Europe/Moscow",
+    "санкт-петербург": "Europe/Moscow",
+    "петербург": "Europe/Moscow",
+    "спб": "Europe/Moscow",
+    "калининград": "Europe/Kaliningrad",
+    "самара": "Europe/Samara",
+    "екатеринбург": "Asia/Yekaterinburg",
+    "омск": "Asia/Omsk",
+    "новосибирск": "Asia/Novosibirsk",
+    "красноярск": "Asia/Krasnoyarsk",
+    "иркутск": "Asia/Irkutsk",
+    "якутск": "Asia/Yakutsk",
+    "владивосток": "Asia/Vladivostok",
+    "магадан": "Asia/Magadan",
+    "камчатка": "Asia/Kamchatka",
+    "минск": "Europe/Minsk",
+    "киев": "Europe/Kyiv",
+    "алматы": "Asia/Almaty",
+    "астана": "Asia/Almaty",
+    "ташкент": "Asia/Tashkent",
+    "тбилиси": "Asia/Tbilisi",
+    "ереван": "Asia/Yerevan",
+    "баку": "Asia/Baku",
+    "берлин": "Europe/Berlin",
+    "лондон": "Europe/London",
+    "нью-йорк": "America/New_York"
+}
+
+_OFFSET_RE = re.compile(r"^(?:utc|gmt|мск)?\s*([+\-−])\s*(\d{1,2})(?:[:.](\d{2}))?$")
+
+@lru_cache(maxsize=None)
+def get_zone(name: str) -> ZoneInfo:
+    """
+    Возвращает зону по имени IANA (с кэшированием).
+    """
+    return ZoneInfo(name)
+
+def _zone_exists(name: str) -> bool:
+    try:
+        get_zone(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+def _offset_zone(sign: int, hours: int, minutes: int) -> Optional[str]:
+    if minutes:
+        return _FRACTIONAL_OFFSET_ZONES.get((sign * hours, minutes))
+    if hours == 0:
+        return "UTC"
+    if hours > 14:
+        return None
+    # В зонах Etc/GMT знак инвертирован: UTC+3 - это Etc/GMT-3
+    return f"Etc/GMT{'-' if sign > 0 else '+'}{hours}"
+
+def parse_timezone(text: Optional[str]) -> Optional[str]:
+    """
+    Определяет часовой пояс по ответу пользователя.
+
+    Args:
+        text: Ответ на вопрос о часовом поясе
+
+    Returns:
+        Optional[str]: Имя зоны IANA или None, если распознать не удалось
+    """
+    if not text:
+        return None
+    value = text.strip()
+
+    # Имя зоны IANA ("Europe/Berlin")
+    if "/" in value and _zone_exists(value):
+        return value
+
+    normalized = value.lower().replace("ё", "е")
+    if normalized in ("utc", "gmt"):
+        return "UTC"
+    if normalized in _CITY_ZONES:
+        return _CITY_ZONES[normalized]
+
+    match = _OFFSET_RE.match(normalized.replace(" ", ""))
+    if match:
+        sign = -1 if match.group(1) in "-−" else 1
+        hours, minutes = int(match.group(2)), int(match.group(3) or 0)
+        if normalized.startswith("мск"):
+            # "МСК+2" - смещение относительно Москвы (UTC+3)
+            total = 3 * 60 + sign * (hours * 60 + minutes)
+            sign, hours, minutes = (1 if total >= 0 else -1), abs(total) // 60, abs(total) % 60
+        return _offset_zone(sign, hours, minutes)
+
+    # Название города внутри фразы ("живу в Новосибирске" не распознаем, "Новосибирск, Россия" - да)
+    for city, zone in _CITY_ZONES.items():
+        if normalized.startswith(city):
+            return zone
+    return None
+
+def resolve_timezone(text: Optional[str]) -> str:
+    """
+    Возвращает зону пользователя или зону по умолчанию.
+    """
+    zone = parse_timezone(text)
+    if zone is None:
+        if text:
+            logger.info(f"Не удалось распознать часовой пояс '{text}', используем {DEFAULT_TIMEZONE}")
+        return DEFAULT_TIMEZONE
+    return zone
+
+def utc_offset(zone: str, moment: datetime) -> timedelta:
+    """
+    Смещение зоны относительно UTC в момент moment (наивное время UTC).
+    """
+    return moment.replace(tzinfo=timezone.utc).astimezone(get_zone(zone)).utcoffset()
+
+def next_offset_change(zone: str, start: datetime) -> datetime:
+    """
+    Находит ближайший момент изменения смещения зоны после start.
+
+    Поиск идет по суткам, а найденный интервал уточняется бинарным поиском
+    до минуты. Если переходов в ближайший год нет, возвращается момент через год,
+    когда проверка повторится.
+
+    Args:
+        zone: Имя зоны IANA
+        start: Начальный момент (наивное время UTC)
+
+    Returns:
+        datetime: Момент перехода (наивное время UTC, с точностью до минуты)
+    """
+    offset = utc_offset(zone, start)
+    low = start
+    for _ in range(TRANSITION_SEARCH_DAYS):
+        high = low + timedelta(days=1)
+        if utc_offset(zone, high) != offset:
+            while high - low > timedelta(minutes=1):
+                middle = low + (high - low) / 2
+                if utc_offset(zone, middle) == offset:
+                    low = middle
+                else:
+                    high = middle
+            return high.replace(second=0, microsecond=0)
+        low = high
+    return low
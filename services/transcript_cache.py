@@ -0,0 +1,164 @@
+"""
+Кэш распознанных голосовых сообщений.
+
+Пересланные и повторно отправленные голосовые сообщения имеют тот же
+file_unique_id, поэтому их текст берется из кэша - без скачивания файла и
+без обращения к движкам распознавания. Кэш хранится в SQLite-файле, размер
+ограничен TRANSCRIPT_CACHE_MAX_ENTRIES (вытесняются давно не использованные записи).
+
+Запись учитывает язык и версию модели: после смены движка распознавания
+(STT_BACKENDS, LOCAL_STT_MODEL) старые расшифровки не используются.
+"""
+
+import os
+import time
+import sqlite3
+import logging
+from typing import Dict, Any, Optional, Iterable
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Параметры кэша (можно переопределить через переменные окружения)
+TRANSCRIPT_CACHE_ENABLED = os.getenv("TRANSCRIPT_CACHE_ENABLED", "1") == "1"
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", "transcript_cache.db")
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "5000"))
+
+# Разделитель версий моделей, если части записи распознаны разными движками
+MODEL_VERSION_SEPARATOR = "+"
+
+class TranscriptCache:
+    """
+    Ограниченный по размеру постоянный кэш: file_unique_id -> текст.
+    """
+
+    def __init__(self, path: str = TRANSCRIPT_CACHE_PATH, max_entries: int = TRANSCRIPT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection: Optional[sqlite3.Connection] = None
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "errors": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        # Соединение открывается при первом обращении; запросы выполняются за доли миллисекунды
+        if self._connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    file_unique_id TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (file_unique_id, language)
+                )
+                """
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_last_used ON transcripts (last_used)")
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    @staticmethod
+    def _version_allowed(model_version: str, allowed_versions: Optional[Iterable[str]]) -> bool:
+        if allowed_versions is None:
+            return True
+        allowed = set(allowed_versions)
+        return all(version in allowed for version in model_version.split(MODEL_VERSION_SEPARATOR) if version)
+
+    def lookup(self, file_unique_id: str, language: str, allowed_versions: Optional[Iterable[str]] = None) -> Optional[str]:
+        """
+        Ищет расшифровку голосового сообщения.
+
+        Args:
+            file_unique_id: Постоянный идентификатор файла Telegram
+            language: Код языка распознавания
+            allowed_versions: Версии моделей, расшифровкам которых можно доверять
+                              (None - любые)
+
+        Returns:
+            Optional[str]: Текст (пустая строка - в записи нет речи) или None
+        """
+        try:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT model_version, text FROM transcripts WHERE file_unique_id = ? AND language = ?",
+                (file_unique_id, language)
+            ).fetchone()
+            if row is None or not self._version_allowed(row[0], allowed_versions):
+                self.stats["misses"] += 1
+                return None
+            connection.execute(
+                "UPDATE transcripts SET last_used = ? WHERE file_unique_id = ? AND language = ?",
+                (time.time(), file_unique_id, language)
+            )
+            connection.commit()
+            self.stats["hits"] += 1
+            return row[1]
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            logger.error(f"Ошибка чтения кэша расшифровок: {e}")
+            return None
+
+    def store(self, file_unique_id: str, language: str, model_version: str, text: str):
+        """
+        Сохраняет расшифровку и вытесняет самые старые записи при переполнении.
+
+        Args:
+            file_unique_id: Постоянный идентификатор файла Telegram
+            language: Код языка распознавания
+            model_version: Версия модели (несколько версий через "+")
+            text: Распознанный текст
+        """
+        try:
+            connection = self._connect()
+            now = time.time()
+            connection.execute(
+                "INSERT OR REPLACE INTO transcripts "
+                "(file_unique_id, language, model_version, text, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (file_unique_id, language, model_version, text, now, now)
+            )
+            excess = connection.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0] - self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM transcripts WHERE rowid IN "
+                    "(SELECT rowid FROM transcripts ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self.stats["evicted"] += excess
+            connection.commit()
+            self.stats["stored"] += 1
+        except sqlite3.Error as e:
+            self.stats["errors"] += 1
+            logger.error(f"Ошибка записи в кэш расшифровок: {e}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает статистику кэша.
+
+        Returns:
+            Dict[str, Any]: Попадания, промахи, доля попаданий и количество записей
+        """
+        lookups = self.stats["hits"] + self.stats["misses"]
+        entries = 0
+        try:
+            entries = self._connect().execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+        except sqlite3.Error:
+            pass
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "entries": entries
+        }
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+# Общий кэш расшифровок
+transcript_cache = TranscriptCache()
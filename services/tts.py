@@ -3,7 +3,6 @@ import uuid
 import logging
 import aiohttp
 import json
-import requests
 from pathlib import Path
 
 # Настройка логирования
@@ -75,7 +74,8 @@ def synthesize_speech(text: str, output_path: str) -> bool:
     
     try:
         logger.info(f"Отправка запроса к ElevenLabs API для синтеза речи")
-        # Выполняем синхронный запрос к API
+        # Выполняем синхронный запрос к API (requests нужен только здесь)
+        import requests
         response = requests.post(
             f"{ELEVEN_API_URL}/{voice_id}",
             headers=headers,
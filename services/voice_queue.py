@@ -0,0 +1,190 @@
+"""
+Ограниченный пул обработчиков голосовых сообщений.
+
+Каждый пользователь получает свою очередь, а ограниченное число воркеров
+обслуживает пользователей по кругу. Поток сообщений одного пользователя не
+задерживает остальных, его сообщения обрабатываются по порядку, а при
+переполнении новые задачи сразу отклоняются вместо неограниченного ожидания.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, Optional, Callable, Awaitable, Deque, Tuple
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Параметры пула (можно переопределить через переменные окружения)
+VOICE_WORKERS = int(os.getenv("VOICE_WORKERS", "4"))
+VOICE_MAX_PENDING = int(os.getenv("VOICE_MAX_PENDING", "100"))
+VOICE_MAX_PENDING_PER_USER = int(os.getenv("VOICE_MAX_PENDING_PER_USER", "3"))
+VOICE_SHUTDOWN_TIMEOUT = float(os.getenv("VOICE_SHUTDOWN_TIMEOUT", "30"))
+
+# Задача обработки: функция без аргументов, возвращающая корутину
+Job = Callable[[], Awaitable[Any]]
+
+class KeyedWorkerPool:
+    """
+    Пул воркеров с очередью на каждый ключ (пользователя) и обслуживанием по кругу.
+    """
+
+    def __init__(
+        self,
+        workers: int = VOICE_WORKERS,
+        max_pending: int = VOICE_MAX_PENDING,
+        max_pending_per_key: int = VOICE_MAX_PENDING_PER_USER,
+        name: str = "voice"
+    ):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.max_pending_per_key = max_pending_per_key
+        self.name = name
+        # Очереди задач по ключам: (задача, время постановки)
+        self._queues: Dict[Any, Deque[Tuple[Job, float]]] = {}
+        # Ключи, готовые к обработке (есть задачи и нет активной обработки)
+        self._ready: Optional[asyncio.Queue] = None
+        self._active_keys: set = set()
+        self._tasks: list = []
+        self._closing = False
+        self.pending = 0
+        self.stats = {
+            "submitted": 0, "rejected": 0, "completed": 0, "failed": 0,
+            "total_wait": 0.0, "max_wait": 0.0, "total_run": 0.0, "max_depth": 0
+        }
+
+    def _ensure_started(self):
+        # Воркеры создаются лениво, внутри работающего event loop
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+            logger.info(f"Пул [{self.name}]: запущено {self.workers} воркеров")
+
+    def submit(self, key: Any, job: Job) -> bool:
+        """
+        Ставит задачу в очередь пользователя.
+
+        Args:
+            key: Ключ очереди (ID пользователя)
+            job: Функция без аргументов, возвращающая корутину
+
+        Returns:
+            bool: True, если задача принята, False, если пул или очередь пользователя переполнены
+        """
+        if self._closing:
+            self.stats["rejected"] += 1
+            return False
+        queue = self._queues.get(key)
+        depth = len(queue) if queue else 0
+        if self.pending >= self.max_pending or depth >= self.max_pending_per_key:
+            self.stats["rejected"] += 1
+            logger.warning(
+                f"Пул [{self.name}]: задача для {key} отклонена "
+                f"(в очереди пользователя {depth}, всего {self.pending})"
+            )
+            return False
+
+        self._ensure_started()
+        if queue is None:
+            queue = self._queues[key] = deque()
+        queue.append((job, time.monotonic()))
+        self.pending += 1
+        self.stats["submitted"] += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.pending)
+        # Ключ попадает в очередь готовых, только если его сейчас никто не обрабатывает
+        if depth == 0 and key not in self._active_keys:
+            self._ready.put_nowait(key)
+        return True
+
+    def queue_depth(self, key: Any) -> int:
+        """
+        Возвращает количество задач в очереди пользователя.
+        """
+        queue = self._queues.get(key)
+        return len(queue) if queue else 0
+
+    def queue_position(self, key: Any) -> int:
+        """
+        Позиция последней задачи пользователя с учетом выполняемой.
+
+        Returns:
+            int: 1 - задача выполняется или выполнится первой, N - перед ней N-1 задач
+        """
+        return self.queue_depth(key) + (1 if key in self._active_keys else 0)
+
+    async def _worker(self, index: int):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues.get(key)
+            if not queue:
+                self._ready.task_done()
+                continue
+
+            job, enqueued_at = queue.popleft()
+            self._active_keys.add(key)
+            wait = time.monotonic() - enqueued_at
+            self.stats["total_wait"] += wait
+            self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+            started_at = time.monotonic()
+            try:
+                await job()
+                self.stats["completed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Пул [{self.name}]: ошибка при обработке задачи для {key}: {e}")
+            finally:
+                self.stats["total_run"] += time.monotonic() - started_at
+                self.pending -= 1
+                self._active_keys.discard(key)
+                if queue:
+                    # Следующая задача пользователя - в конец круга, после других пользователей
+                    self._ready.put_nowait(key)
+                else:
+                    self._queues.pop(key, None)
+                self._ready.task_done()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Возвращает состояние пула: глубину очередей, задержки и счетчики.
+
+        Returns:
+            Dict[str, Any]: Метрики пула
+        """
+        processed = self.stats["completed"] + self.stats["failed"]
+        return {
+            **self.stats,
+            "pending": self.pending,
+            "active": len(self._active_keys),
+            "users_waiting": len(self._queues),
+            "avg_wait": self.stats["total_wait"] / processed if processed else 0.0,
+            "avg_run": self.stats["total_run"] / processed if processed else 0.0
+        }
+
+    async def shutdown(self, timeout: float = VOICE_SHUTDOWN_TIMEOUT):
+        """
+        Перестает принимать задачи, дожидается уже принятых и останавливает воркеров.
+
+        Args:
+            timeout: Максимальное время ожидания очереди в секундах
+        """
+        self._closing = True
+        if self._ready is not None:
+            try:
+                await asyncio.wait_for(self._ready.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Пул [{self.name}]: не дождались {self.pending} задач при остановке")
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        metrics = self.get_metrics()
+        logger.info(
+            f"Пул [{self.name}] остановлен: выполнено {metrics['completed']}, ошибок {metrics['failed']}, "
+            f"отклонено {metrics['rejected']}, среднее ожидание {metrics['avg_wait']:.2f} с"
+        )
+
+# Общий пул обработки голосовых сообщений
+voice_pool = KeyedWorkerPool()
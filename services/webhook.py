@@ -0,0 +1,138 @@
+"""
+Получение обновлений Telegram через webhook.
+
+Вместо long polling Telegram сам присылает обновления на HTTP-сервер бота
+(aiohttp). Это убирает холостые запросы getUpdates, снижает задержку ответа
+и позволяет поставить несколько экземпляров бота за балансировщик.
+
+Режим включается переменной BOT_MODE=webhook. Запросы без правильного
+заголовка X-Telegram-Bot-Api-Secret-Token отклоняются.
+"""
+
+import os
+import signal
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Способ получения обновлений: "polling" или "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# Параметры webhook (можно переопределить через переменные окружения)
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+# Railway и большинство платформ передают порт в переменной PORT
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+HEALTH_PATH = "/health"
+
+def webhook_url(base_url: str = WEBHOOK_BASE_URL, path: str = WEBHOOK_PATH) -> str:
+    """
+    Публичный адрес webhook, который регистрируется в Telegram.
+
+    Args:
+        base_url: Внешний адрес бота (https://...)
+        path: Путь обработчика
+
+    Returns:
+        str: Полный URL
+    """
+    return base_url.rstrip("/") + "/" + path.lstrip("/")
+
+def webhook_secret(token: str, secret: str = WEBHOOK_SECRET) -> str:
+    """
+    Секрет для заголовка X-Telegram-Bot-Api-Secret-Token.
+
+    Если WEBHOOK_SECRET не задан, секрет выводится из токена бота: он одинаков
+    у всех экземпляров, и повторная регистрация webhook одним из них
+    не ломает проверку у остальных.
+
+    Args:
+        token: Токен бота
+        secret: Заданный секрет
+
+    Returns:
+        str: Секрет (символы A-Z, a-z, 0-9, _ и -)
+    """
+    if secret:
+        return secret
+    return hashlib.sha256(f"webhook:{token}".encode()).hexdigest()
+
+async def _health(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, secret: str, path: str = WEBHOOK_PATH) -> web.Application:
+    """
+    Создает aiohttp-приложение с обработчиком обновлений.
+
+    Args:
+        dp: Dispatcher
+        bot: Bot
+        secret: Секрет для проверки запросов Telegram
+        path: Путь обработчика
+
+    Returns:
+        web.Application: Приложение
+    """
+    app = web.Application()
+    app.router.add_get(HEALTH_PATH, _health)
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret).register(app, path=path)
+    # Вызывает startup/shutdown-хуки диспетчера вместе с приложением
+    setup_application(app, dp, bot=bot)
+    return app
+
+async def run_webhook(dp: Dispatcher, bot: Bot, stop_event: asyncio.Event, port: Optional[int] = None):
+    """
+    Запускает HTTP-сервер, регистрирует webhook и ждет сигнала остановки.
+
+    Webhook при остановке не удаляется: другие экземпляры за балансировщиком
+    продолжают получать обновления.
+
+    Args:
+        dp: Dispatcher
+        bot: Bot
+        stop_event: Событие остановки (устанавливается по SIGINT/SIGTERM)
+        port: Порт сервера (по умолчанию WEBHOOK_PORT)
+    """
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для режима webhook нужно задать WEBHOOK_BASE_URL")
+
+    secret = webhook_secret(bot.token)
+    app = create_webhook_app(dp, bot, secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, port or WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Сервер webhook слушает {WEBHOOK_HOST}:{port or WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: сигналы обрабатываются через KeyboardInterrupt
+            pass
+
+    try:
+        url = webhook_url()
+        await bot.set_webhook(
+            url,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        logger.info(f"Webhook зарегистрирован: {url}")
+        await stop_event.wait()
+        logger.info("Останавливаем сервер webhook")
+    finally:
+        await runner.cleanup()
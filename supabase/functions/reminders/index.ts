@@ -4,7 +4,6 @@
 
 import { serve } from "https://deno.land/std@0.168.0/http/server.ts"
 import { createClient } from 'https://esm.sh/@supabase/supabase-js@2'
-import { format } from "https://deno.land/std@0.168.0/datetime/mod.ts"
 
 // Initialize Supabase client
 const supabaseUrl = Deno.env.get('SUPABASE_URL') ?? ''
@@ -15,6 +14,9 @@ interface ReminderRequest {
   userId?: number
   reminderId?: string
   action: 'get' | 'create' | 'update' | 'delete' | 'check'
+  // For 'check': minute to check (ISO timestamp, defaults to now)
+  now?: string
+  limit?: number
   reminderData?: {
     reminderType: string
     reminderTime: string
@@ -36,7 +38,7 @@ serve(async (req: Request) => {
     }
 
     // Parse request body
-    const { userId, reminderId, action, reminderData } = await req.json() as ReminderRequest
+    const { userId, reminderId, action, reminderData, now, limit } = await req.json() as ReminderRequest
 
     if (!action) {
       return new Response(
@@ -284,18 +286,13 @@ serve(async (req: Request) => {
       )
     }
 
-    // Check for due reminders
+    // Claim due reminders (reminder times are local to each user's timezone).
+    // Claimed reminders are marked as sent and are not returned again.
     if (action === 'check') {
-      const now = new Date()
-      const currentDay = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'][now.getDay()]
-      const currentTime = format(now, 'HH:mm')
-
-      const { data: dueReminders, error } = await supabase
-        .from('reminders')
-        .select('*')
-        .eq('is_active', true)
-        .filter('reminder_days', 'cs', `{"${currentDay}"}`)
-        .filter('reminder_time', 'eq', currentTime)
+      const { data: dueReminders, error } = await supabase.rpc('due_reminders', {
+        p_now: now ?? new Date().toISOString(),
+        p_limit: limit ?? 500
+      })
 
       if (error) {
         return new Response(
@@ -0,0 +1,48 @@
+-- Backfill structured personality type fields for existing profiles.
+-- profile_type is the majority answer (A/B/C/D) of the Vasini survey questions,
+-- the per-letter answer counts are stored in personality_traits->'type_counts'.
+-- New profiles get these fields when they are created, so the bot never has to
+-- scan profile text to find the type.
+
+WITH counts AS (
+    SELECT
+        user_id,
+        COUNT(*) FILTER (WHERE answer = 'A') AS a,
+        COUNT(*) FILTER (WHERE answer = 'B') AS b,
+        COUNT(*) FILTER (WHERE answer = 'C') AS c,
+        COUNT(*) FILTER (WHERE answer = 'D') AS d
+    FROM survey_responses
+    WHERE question_id LIKE 'vasini\_%'
+    GROUP BY user_id
+),
+typed AS (
+    SELECT
+        user_id, a, b, c, d,
+        -- Ties resolve in A, B, C, D order, as in questions.get_personality_type_from_answers
+        CASE GREATEST(a, b, c, d)
+            WHEN a THEN 'Интеллектуальный'
+            WHEN b THEN 'Эмоциональный'
+            WHEN c THEN 'Практический'
+            ELSE 'Творческий'
+        END AS personality_type
+    FROM counts
+    WHERE a + b + c + d > 0
+)
+UPDATE profiles AS p
+SET
+    profile_type = COALESCE(p.profile_type, t.personality_type),
+    personality_traits = COALESCE(p.personality_traits, '{}'::jsonb)
+        || jsonb_build_object('type_counts', jsonb_build_object('A', t.a, 'B', t.b, 'C', t.c, 'D', t.d)),
+    updated_at = NOW()
+FROM typed AS t
+WHERE p.user_id = t.user_id
+  AND (p.profile_type IS NULL OR p.personality_traits->'type_counts' IS NULL);
+
+-- Profiles without survey answers: use the type saved in the profile JSON, if any
+UPDATE profiles
+SET profile_type = profile_data->>'personality_type',
+    updated_at = NOW()
+WHERE profile_type IS NULL
+  AND profile_data ? 'personality_type';
+
+CREATE INDEX IF NOT EXISTS idx_profiles_profile_type ON profiles(profile_type);
@@ -0,0 +1,13 @@
+-- One reminder per user and reminder type.
+-- The bot saves reminder settings with an upsert on (user_id, reminder_type)
+-- and loads them at startup page by page ordered by user_id.
+
+-- Keep only the most recently updated row of duplicates
+DELETE FROM reminders AS r
+USING reminders AS newer
+WHERE r.user_id = newer.user_id
+  AND r.reminder_type = newer.reminder_type
+  AND (r.updated_at, r.id) < (newer.updated_at, newer.id);
+
+ALTER TABLE reminders
+    ADD CONSTRAINT reminders_user_id_reminder_type_key UNIQUE (user_id, reminder_type);
@@ -0,0 +1,5 @@
+-- User timezone of a reminder (IANA name, e.g. Europe/Moscow).
+-- reminder_time and reminder_days are local to this timezone;
+-- NULL means the bot's DEFAULT_TIMEZONE.
+
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS timezone TEXT;
@@ -0,0 +1,57 @@
+-- Pull-mode reminder delivery.
+-- Every minute the bot calls due_reminders(now) and sends the returned batch.
+-- A claimed row is marked with last_sent_at in the same statement, and rows
+-- locked by a concurrent call are skipped, so several bot replicas can poll
+-- at once without sending a reminder twice. last_sent_local_date keeps the
+-- reminder from being claimed again when a DST fall-back repeats its local minute.
+
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS last_sent_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE reminders ADD COLUMN IF NOT EXISTS last_sent_local_date DATE;
+
+CREATE INDEX IF NOT EXISTS idx_reminders_active_time
+    ON reminders (reminder_time) WHERE is_active;
+
+CREATE OR REPLACE FUNCTION due_reminders(
+    p_now TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    p_reminder_type TEXT DEFAULT 'practice',
+    p_default_timezone TEXT DEFAULT 'Europe/Moscow',
+    p_limit INTEGER DEFAULT 500
+)
+RETURNS TABLE (user_id BIGINT, reminder_type TEXT, reminder_time TIME, timezone TEXT)
+LANGUAGE sql
+AS $$
+    WITH minute AS (
+        SELECT date_trunc('minute', p_now) AS at
+    ),
+    zones AS (
+        -- Local time of the minute in every timezone used by active reminders
+        SELECT DISTINCT COALESCE(r.timezone, p_default_timezone) AS tz
+        FROM reminders r
+        WHERE r.is_active AND r.reminder_type = p_reminder_type
+    ),
+    local_now AS (
+        SELECT z.tz, (m.at AT TIME ZONE z.tz) AS local_at
+        FROM zones z CROSS JOIN minute m
+    ),
+    due AS (
+        SELECT r.id, l.local_at::DATE AS local_date
+        FROM reminders r
+        JOIN local_now l ON COALESCE(r.timezone, p_default_timezone) = l.tz
+        CROSS JOIN minute m
+        WHERE r.is_active
+          AND r.reminder_type = p_reminder_type
+          AND r.reminder_time = l.local_at::TIME
+          AND lower(to_char(l.local_at, 'Dy')) = ANY (r.reminder_days)
+          AND (r.last_sent_at IS NULL OR r.last_sent_at < m.at)
+          -- A local minute repeats when clocks fall back: send once per local day
+          AND (r.last_sent_local_date IS NULL OR r.last_sent_local_date < l.local_at::DATE)
+        ORDER BY r.user_id
+        LIMIT p_limit
+        FOR UPDATE OF r SKIP LOCKED
+    )
+    UPDATE reminders r
+    SET last_sent_at = (SELECT at FROM minute), last_sent_local_date = due.local_date
+    FROM due
+    WHERE r.id = due.id
+    RETURNING r.user_id, r.reminder_type, r.reminder_time, r.timezone;
+$$;
@@ -36,10 +36,14 @@ CREATE TABLE IF NOT EXISTS reminders (
     user_id BIGINT NOT NULL,
     reminder_type TEXT NOT NULL,  -- meditation, practice, etc.
     reminder_time TIME NOT NULL,
-    reminder_days TEXT[],  -- Array of days (Monday, Tuesday, etc.)
+    reminder_days TEXT[],  -- Array of day codes (mon, tue, etc.)
     is_active BOOLEAN DEFAULT TRUE,
+    timezone TEXT,  -- IANA timezone of reminder_time (NULL = bot default)
+    last_sent_at TIMESTAMP WITH TIME ZONE,  -- Minute the reminder was last claimed for sending
+    last_sent_local_date DATE,  -- Local date of that claim (a DST fall-back repeats the local minute)
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE(user_id, reminder_type)
 );
 
 -- USER STATS TABLE
@@ -131,6 +135,7 @@ CREATE POLICY conversations_insert_policy ON conversations
 CREATE INDEX IF NOT EXISTS idx_profiles_user_id ON profiles(user_id);
 CREATE INDEX IF NOT EXISTS idx_survey_responses_user_id ON survey_responses(user_id);
 CREATE INDEX IF NOT EXISTS idx_reminders_user_id ON reminders(user_id);
+CREATE INDEX IF NOT EXISTS idx_reminders_active_time ON reminders(reminder_time) WHERE is_active;
 CREATE INDEX IF NOT EXISTS idx_user_stats_user_id ON user_stats(user_id);
 CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id);
 CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON conversations(created_at);
@@ -158,4 +163,50 @@ EXECUTE FUNCTION trigger_set_timestamp();
 CREATE TRIGGER set_timestamp_user_stats
 BEFORE UPDATE ON user_stats
 FOR EACH ROW
-EXECUTE FUNCTION trigger_set_timestamp(); 
\ No newline at end of file
+EXECUTE FUNCTION trigger_set_timestamp(); 
+
+-- Claim reminders due at a minute (pull-mode delivery, see migrations/20261019000300_due_reminders.sql)
+CREATE OR REPLACE FUNCTION due_reminders(
+    p_now TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    p_reminder_type TEXT DEFAULT 'practice',
+    p_default_timezone TEXT DEFAULT 'Europe/Moscow',
+    p_limit INTEGER DEFAULT 500
+)
+RETURNS TABLE (user_id BIGINT, reminder_type TEXT, reminder_time TIME, timezone TEXT)
+LANGUAGE sql
+AS $$
+    WITH minute AS (
+        SELECT date_trunc('minute', p_now) AS at
+    ),
+    zones AS (
+        -- Local time of the minute in every timezone used by active reminders
+        SELECT DISTINCT COALESCE(r.timezone, p_default_timezone) AS tz
+        FROM reminders r
+        WHERE r.is_active AND r.reminder_type = p_reminder_type
+    ),
+    local_now AS (
+        SELECT z.tz, (m.at AT TIME ZONE z.tz) AS local_at
+        FROM zones z CROSS JOIN minute m
+    ),
+    due AS (
+        SELECT r.id, l.local_at::DATE AS local_date
+        FROM reminders r
+        JOIN local_now l ON COALESCE(r.timezone, p_default_timezone) = l.tz
+        CROSS JOIN minute m
+        WHERE r.is_active
+          AND r.reminder_type = p_reminder_type
+          AND r.reminder_time = l.local_at::TIME
+          AND lower(to_char(l.local_at, 'Dy')) = ANY (r.reminder_days)
+          AND (r.last_sent_at IS NULL OR r.last_sent_at < m.at)
+          -- A local minute repeats when clocks fall back: send once per local day
+          AND (r.last_sent_local_date IS NULL OR r.last_sent_local_date < l.local_at::DATE)
+        ORDER BY r.user_id
+        LIMIT p_limit
+        FOR UPDATE OF r SKIP LOCKED
+    )
+    UPDATE reminders r
+    SET last_sent_at = (SELECT at FROM minute), last_sent_local_date = due.local_date
+    FROM due
+    WHERE r.id = due.id
+    RETURNING r.user_id, r.reminder_type, r.reminder_time, r.timezone;
+$$;
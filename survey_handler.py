@@ -18,6 +18,7 @@ from profile_storage import (
     list_all_profiles,
     init_storage
 )
+from questions import derive_personality_fields
 
 # Импорт функции railway_print для логирования
 try:
@@ -508,11 +509,22 @@ async def complete_survey(message: Message, state: FSMContext, answers: Dict[str
             profile = await generate_profile(user_data)
             
             if profile and "error" not in profile:
+                # Запись профиля: тип личности и распределение ответов вычисляются один раз здесь,
+                # чтобы при общении не анализировать текст профиля заново
+                profile_record = {
+                    **profile,
+                    "answers": answers,
+                    "profile_completed": True,
+                    "profile_text": profile.get("profile", ""),
+                    "profile_details": profile.get("details", ""),
+                    **derive_personality_fields(answers)
+                }
+                
                 # Сохраняем профиль в базу данных
-                await save_user_profile(user_id, profile)
+                await save_user_profile(user_id, profile_record)
                 
                 # Сохраняем данные профиля в state
-                await state.update_data(**profile)
+                await state.update_data(**profile_record)
                 
                 # Переходим в состояние просмотра профиля
                 await state.set_state(ProfileStates.viewing_profile)
@@ -1307,54 +1319,6 @@ async def test_interpretations():
     except Exception as e:
         print(f"Ошибка при получении интерпретации: {e}")
 
-# Функция для запуска асинхронных задач
-def setup_async_tasks():
-    """
-    Запускает асинхронные задачи, необходимые для работы модуля.
-    Должна вызываться после создания event loop.
-    """
-    # Проверяем, есть ли запущенный event loop
-    try:
-        loop = asyncio.get_running_loop()
-        # Если loop существует, создаем задачу
-        asyncio.create_task(load_profiles_from_file())
-        logger.info("Запущена асинхронная задача загрузки профилей")
-    except RuntimeError:
-        # Если loop не существует, логируем это
-        logger.warning("Event loop не запущен, загрузка профилей будет выполнена позже")
-        # Не создаем задачу, так как нет запущенного event loop
-
-# Функция для инициализации модуля
-async def init_module():
-    """
-    Инициализирует модуль, загружая необходимые данные.
-    """
-    await load_profiles_from_file()
-    logger.info("Модуль survey_handler инициализирован")
-
-# Проверяем, загружается ли модуль в режиме временного импорта
-import sys
-if 'temp_import_mode' not in sys.modules:
-    # Если мы не в режиме временного импорта, пробуем запустить задачу
-    try:
-        # Пробуем создать задачу, только если есть активный event loop
-        asyncio.get_event_loop()
-        # Если предыдущая строка не вызвала исключение, вызываем setup_async_tasks
-        setup_async_tasks()
-    except RuntimeError:
-        # Если нет активного event loop, не пытаемся создавать задачу
-        logger.warning("Нет активного event loop при импорте модуля, автозагрузка профилей отложена")
-else:
-    # Если модуль загружается в режиме временного импорта, просто логируем это
-    logger.info("Модуль загружен в режиме временного импорта, инициализация отложена")
-
-# Добавляем в конец файла для запуска теста при прямом вызове
-if __name__ == "__main__":
-    import asyncio
-    asyncio.run(test_interpretations())
-    # Инициализируем модуль при прямом запуске
-    asyncio.run(init_module()) 
-
 # Добавим команду для тестирования загрузки профилей
 @survey_router.message(Command("debug_profile"))
 async def debug_profile(message: Message, state: FSMContext):
@@ -1524,4 +1488,10 @@ def setup_async_tasks():
     Returns:
         List: Список корутин для выполнения
     """
-    return [init_module()]
\ No newline at end of file
+    return [init_module()]
+
+# Запуск теста при прямом вызове
+if __name__ == "__main__":
+    asyncio.run(test_interpretations())
+    # Инициализируем модуль при прямом запуске
+    asyncio.run(init_module())
@@ -0,0 +1,70 @@
+"""
+Тесты детектора речи для предобработки голосовых сообщений.
+"""
+
+import math
+import sys
+from array import array
+
+from services import audio_preprocess
+from services.audio_preprocess import FRAME_MS, SAMPLE_RATE, frame_energies, find_speech_bounds, split_frames
+
+def make_pcm(segments):
+    """Собирает PCM из отрезков (секунды, амплитуда): тон 440 Гц или тишина."""
+    samples = array("h")
+    for seconds, amplitude in segments:
+        for i in range(int(seconds * SAMPLE_RATE)):
+            samples.append(int(amplitude * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE)))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+def test_silence_is_rejected():
+    energies = frame_energies(make_pcm([(2.0, 20)]))
+    assert find_speech_bounds(energies) is None
+
+def test_speech_bounds_trim_silence():
+    """Тишина по краям обрезается с отступом VAD_PADDING_MS."""
+    energies = frame_energies(make_pcm([(1.0, 0), (1.5, 8000), (2.0, 0)]))
+    start, end = find_speech_bounds(energies)
+    padding = audio_preprocess.VAD_PADDING_MS // FRAME_MS
+    speech_start, speech_end = 1000 // FRAME_MS, 2500 // FRAME_MS
+    assert abs(start - (speech_start - padding)) <= 1
+    assert abs(end - (speech_end + padding)) <= 2
+
+def test_continuous_speech_is_kept():
+    """Запись сплошной речи не принимается за шум."""
+    energies = frame_energies(make_pcm([(2.0, 8000)]))
+    assert find_speech_bounds(energies) == (0, len(energies))
+
+def test_split_at_quietest_frame():
+    energies = [1000.0] * 300
+    energies[180] = 5.0
+    ranges = split_frames(energies, 0, 300, chunk_frames=200, search_frames=50)
+    assert ranges == [(0, 180), (180, 300)]
+    assert all(end - start <= 200 for start, end in ranges)
+
+def test_encodes_are_bounded(monkeypatch):
+    """Части длинной записи перекодируются не больше чем VOICE_ENCODE_CONCURRENCY процессами сразу."""
+    import asyncio
+
+    active = 0
+    peak = 0
+
+    async def fake_ffmpeg(args, data):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return data
+
+    monkeypatch.setattr(audio_preprocess, "_run_ffmpeg", fake_ffmpeg)
+    monkeypatch.setattr(audio_preprocess, "VOICE_ENCODE_CONCURRENCY", 2)
+    monkeypatch.setattr(audio_preprocess, "_encode_semaphore", None)
+
+    async def scenario():
+        return await asyncio.gather(*(audio_preprocess.encode_opus(bytes([i])) for i in range(6)))
+
+    assert asyncio.run(scenario()) == [bytes([i]) for i in range(6)]
+    assert peak == 2
@@ -0,0 +1,45 @@
+"""
+Тесты рассылки с ограничением скорости.
+"""
+
+import time
+import random
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+
+from services.broadcast import FanOutSender, TokenBucket
+
+def test_token_bucket_limits_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=50, capacity=1)
+        started_at = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - started_at
+
+    # Первый токен есть сразу, остальные пять - по 20 мс
+    assert asyncio.run(scenario()) >= 0.09
+
+def test_retry_after_is_retried_and_blocked_users_counted():
+    attempts = {}
+
+    async def send(chat_id):
+        attempts[chat_id] = attempts.get(chat_id, 0) + 1
+        if chat_id == 1 and attempts[chat_id] == 1:
+            raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=0)
+        if chat_id == 2:
+            raise TelegramForbiddenError(method=None, message="bot was blocked by the user")
+
+    sender = FanOutSender(rate=1000, burst=100, per_chat_interval=0, spread_seconds=0)
+    result = asyncio.run(sender.send_all([1, 2, 3, 4], send, rng=random.Random(0)))
+
+    assert result == {"sent": 3, "failed": 0, "blocked": 1}
+    assert attempts == {1: 2, 2: 1, 3: 1, 4: 1}
+    metrics = sender.get_metrics()
+    assert metrics["retry_after"] == 1 and metrics["retried"] == 1
+
+def test_small_batches_are_not_delayed():
+    sender = FanOutSender(rate=28, spread_seconds=50)
+    assert sender.spread_window(5) < 1
+    assert sender.spread_window(100000) == 50
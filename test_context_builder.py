@@ -0,0 +1,75 @@
+"""
+Тесты сборки контекста диалога с учетом бюджета токенов.
+"""
+
+import asyncio
+
+import pytest
+
+from services import context_builder
+from services.context_builder import build_messages, compact_history, count_tokens, pack_history
+
+@pytest.fixture(autouse=True)
+def offline_token_count(monkeypatch):
+    """Приближенный подсчет токенов: tiktoken не должен скачивать кодировку из сети."""
+    monkeypatch.setattr(context_builder, "TIKTOKEN_AVAILABLE", False)
+    context_builder._get_encoding.cache_clear()
+    context_builder.count_tokens.cache_clear()
+    yield
+    context_builder._get_encoding.cache_clear()
+    context_builder.count_tokens.cache_clear()
+
+def make_history(pairs: int, length: int = 200):
+    history = []
+    for i in range(pairs):
+        history.append({"role": "user", "content": f"Вопрос {i}: " + "т" * length})
+        history.append({"role": "assistant", "content": f"Ответ {i}: " + "о" * length})
+    return history
+
+def test_pack_history_respects_budget():
+    """В запрос попадают последние сообщения, помещающиеся в бюджет."""
+    history = make_history(10)
+    packed = pack_history(history, budget=500)
+    used = sum(count_tokens(m["content"]) + context_builder.MESSAGE_OVERHEAD_TOKENS for m in packed)
+    assert used <= 500
+    assert packed[-1] == history[-1]
+    assert packed[0]["role"] == "user"
+
+def test_build_messages_order():
+    """Системный промпт, резюме, история и текущее сообщение идут по порядку."""
+    messages = build_messages("Системный промпт", "Как дела?", make_history(2, 20), summary="Раньше говорили о сне")
+    assert messages[0]["content"] == "Системный промпт"
+    assert "Раньше говорили о сне" in messages[1]["content"]
+    assert messages[-1] == {"role": "user", "content": "Как дела?"}
+
+def test_compact_history_folds_old_turns(monkeypatch):
+    """Переполненная история сокращается, вытесненные реплики попадают в резюме."""
+    monkeypatch.setattr(context_builder, "get_openai_client", lambda caller="default": None)
+    history = make_history(11, 20)
+    compacted, summary = asyncio.run(compact_history(history, "", max_entries=20))
+    assert len(compacted) <= 10
+    assert compacted[-1] == history[-1]
+    assert "Вопрос 0" in summary
+
+def test_compact_history_keeps_short_history():
+    """Короткая история не меняется и не вызывает суммаризацию."""
+    history = make_history(3, 20)
+    compacted, summary = asyncio.run(compact_history(history, "резюме"))
+    assert compacted == history
+    assert summary == "резюме"
+
+def test_encoding_download_failure_falls_back_once(monkeypatch):
+    """Если кодировку не удалось скачать, подсчет приближенный и загрузка не повторяется."""
+    attempts = []
+
+    class OfflineTiktoken:
+        @staticmethod
+        def encoding_for_model(model):
+            attempts.append(model)
+            raise ConnectionError("no network")
+
+    monkeypatch.setattr(context_builder, "TIKTOKEN_AVAILABLE", True)
+    monkeypatch.setattr(context_builder, "tiktoken", OfflineTiktoken)
+    assert count_tokens("привет") == 3
+    assert count_tokens("как дела") == 4
+    assert len(attempts) == 1
@@ -0,0 +1,47 @@
+"""
+Тесты выборов лидера для нескольких экземпляров бота.
+"""
+
+import time
+import asyncio
+
+from services.coordination import SQLiteLeaseBackend, LeaderElector
+
+def test_sqlite_lease_is_exclusive_until_expiry(tmp_path):
+    path = str(tmp_path / "coordination.db")
+
+    async def scenario():
+        first, second = SQLiteLeaseBackend(path), SQLiteLeaseBackend(path)
+        results = [
+            await first.acquire("reminders", "a", ttl=0.2),
+            await second.acquire("reminders", "b", ttl=0.2),
+            # Владелец продлевает свою аренду
+            await first.acquire("reminders", "a", ttl=0.2)
+        ]
+        time.sleep(0.25)
+        # Истекшую аренду забирает другой экземпляр, а прежний владелец не может ее удалить
+        results.append(await second.acquire("reminders", "b", ttl=0.2))
+        await first.release("reminders", "a")
+        results.append(await first.acquire("reminders", "a", ttl=0.2))
+        await first.close()
+        await second.close()
+        return results
+
+    assert asyncio.run(scenario()) == [True, False, True, True, False]
+
+def test_leader_failover_on_stop(tmp_path):
+    """Остановленный лидер освобождает аренду, и другой экземпляр сразу становится лидером."""
+    backend = SQLiteLeaseBackend(str(tmp_path / "coordination.db"))
+
+    async def scenario():
+        first = LeaderElector(backend, "reminders", instance_id="a", ttl=30)
+        second = LeaderElector(backend, "reminders", instance_id="b", ttl=30)
+        before = (await first.step(), await second.step())
+        await first.stop()
+        after = (first.is_leader, await second.step())
+        return before, after, second.stats
+
+    before, after, stats = asyncio.run(scenario())
+    assert before == (True, False)
+    assert after == (False, True)
+    assert stats["elections"] == 1
@@ -0,0 +1,54 @@
+"""
+Тест времени импорта обработчиков (python -X importtime).
+
+Обработчики не должны подгружать клиентов OpenAI, httpx, Supabase и requests
+при импорте: они импортируются при первом запросе или в хуках запуска.
+Самые долгие импорты выводятся в отчет (pytest -s).
+"""
+
+import os
+import sys
+import subprocess
+
+HANDLER_MODULES = [
+    "survey_handler", "meditation_handler", "conversation_handler", "reminder_handler",
+    "voice_handler", "communication_handler", "message_router"
+]
+LAZY_PACKAGES = {"openai", "httpx", "supabase", "requests", "faster_whisper", "db_supabase"}
+# Бюджет на импорт всех обработчиков, секунд (с запасом для медленных машин CI)
+IMPORT_TIME_BUDGET = float(os.getenv("IMPORT_TIME_BUDGET", "5"))
+
+def import_times(modules):
+    """
+    Импортирует модули в отдельном процессе с -X importtime.
+
+    Returns:
+        list: (модуль, собственное время, накопленное время в мкс, вложенность)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = len(name) - len(name.lstrip())
+        entries.append((name.strip(), int(own), int(cumulative), depth))
+    return entries
+
+def test_handlers_import_without_heavy_clients():
+    entries = import_times(HANDLER_MODULES)
+    loaded = {name.split(".")[0] for name, _, _, _ in entries}
+    assert not loaded & LAZY_PACKAGES
+
+    top_depth = min(depth for _, _, _, depth in entries)
+    total = sum(cumulative for _, _, cumulative, depth in entries if depth == top_depth) / 1e6
+    print(f"\nИмпорт обработчиков: {total:.2f} с")
+    for name, own, _, _ in sorted(entries, key=lambda entry: entry[1], reverse=True)[:10]:
+        print(f"{own / 1000:8.1f} мс  {name}")
+    assert total < IMPORT_TIME_BUDGET
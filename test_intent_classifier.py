@@ -0,0 +1,31 @@
+"""
+Тесты локального классификатора намерений.
+"""
+
+from services.intent_classifier import IntentClassifier, train_classifier, load_samples, INTENT_MODEL_PATH, INTENT_SEED_PATH
+
+def test_train_predict_and_roundtrip(tmp_path):
+    """Модель обучается на примерах, сохраняется и загружается без потери точности."""
+    samples = [
+        ("Привет", "greeting"), ("Здравствуй", "greeting"), ("Добрый день", "greeting"),
+        ("Расскажи анекдот", "joke"), ("Пошути", "joke"), ("Рассмеши меня", "joke"),
+        ("Спасибо", "feedback"), ("Благодарю", "feedback"), ("Отлично, спасибо", "feedback"),
+    ]
+    model = train_classifier(samples)
+    for text, intent in samples:
+        assert model.predict(text)[0] == intent
+
+    path = tmp_path / "model.json"
+    model.save(str(path))
+    loaded = IntentClassifier.load(str(path))
+    assert loaded.predict("Привет!") == model.predict("Привет!")
+    assert abs(sum(loaded.predict_proba("что-то странное").values()) - 1.0) < 1e-9
+
+def test_shipped_model_is_confident_on_seed_examples():
+    """Поставляемая модель уверенно распознает примеры из исходной выборки."""
+    model = IntentClassifier.load(INTENT_MODEL_PATH)
+    samples = load_samples([INTENT_SEED_PATH])
+    correct = sum(1 for text, intent in samples if model.predict(text)[0] == intent)
+    assert correct / len(samples) > 0.95
+    intent, confidence = model.predict("Расскажи смешной анекдот")
+    assert intent == "joke" and confidence > 0.6
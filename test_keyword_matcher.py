@@ -0,0 +1,34 @@
+"""
+Тесты автомата Ахо-Корасик для поиска ключевых слов.
+"""
+
+from services.keyword_matcher import KeywordAutomaton
+
+def test_finds_overlapping_markers_in_one_pass():
+    """Находятся все вхождения, включая вложенные и перекрывающиеся маркеры."""
+    matcher = KeywordAutomaton()
+    matcher.add_many({"a": ["he", "she", "hers"], "b": ["his"]})
+    hits = sorted((pattern, start) for _, pattern, _, start in matcher.find_all("ushers his"))
+    assert hits == [("he", 2), ("hers", 2), ("his", 7), ("she", 1)]
+
+def test_weighted_scoring_and_tie_order():
+    """Побеждает больший суммарный вес, при равенстве - метка, добавленная раньше."""
+    matcher = KeywordAutomaton()
+    matcher.add_many(
+        {"question": ["как", "?"], "greeting": ["как дела"], "meditation": ["расслабиться"]},
+        weights={"как": 0.4, "?": 0.4, "как дела": 3.0}
+    )
+    assert matcher.best("Привет, как дела?", default="support") == "greeting"
+    assert matcher.best("Как мне расслабиться?", default="support") == "meditation"
+    assert matcher.best("Ничего особенного", default="support") == "support"
+
+    tie = KeywordAutomaton()
+    tie.add_many({"postpartum": ["ребенок"], "family": ["ребенок"]})
+    assert tie.best("ребенок не спит", default="default") == "postpartum"
+
+def test_whole_word_markers():
+    """Короткие маркеры с whole_word не срабатывают внутри других слов."""
+    matcher = KeywordAutomaton()
+    matcher.add_many({"question": ["как"], "grief": ["горе"]}, whole_words={"как", "горе"})
+    assert matcher.score("Никак не выгорел") == {}
+    assert matcher.score("Как пережить горе") == {"question": 1.0, "grief": 1.0}
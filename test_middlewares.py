@@ -0,0 +1,135 @@
+"""
+Тесты middleware диспетчера.
+"""
+
+import asyncio
+
+import pytest
+from types import SimpleNamespace
+
+from services.middlewares import ChatLockMiddleware, ThrottlingMiddleware, TokenBucketLimiter, parse_limit
+
+def context(chat_id, user_id=None):
+    return {"event_chat": SimpleNamespace(id=chat_id), "event_from_user": SimpleNamespace(id=user_id or chat_id)}
+
+def test_updates_of_one_chat_do_not_interleave():
+    """Чтение и запись состояния одного чата не перемешиваются, разные чаты идут параллельно."""
+    middleware = ChatLockMiddleware()
+    states = {1: 0, 2: 0}
+    log = []
+
+    async def increment(event, data):
+        chat_id = data["event_chat"].id
+        value = states[chat_id]
+        log.append(("start", chat_id))
+        await asyncio.sleep(0.01)
+        states[chat_id] = value + 1
+        log.append(("end", chat_id))
+
+    async def scenario():
+        updates = [context(1), context(1), context(2), context(1)]
+        await asyncio.gather(*(middleware(increment, None, data) for data in updates))
+
+    asyncio.run(scenario())
+    assert states == {1: 3, 2: 1}
+    # Чат 2 начал обработку, не дожидаясь очереди чата 1
+    assert log.index(("start", 2)) < log.index(("end", 1))
+    metrics = middleware.get_metrics()
+    assert metrics["waited"] == 2
+    assert metrics["active_chats"] == 0
+
+def test_lock_table_is_bounded():
+    middleware = ChatLockMiddleware(max_keys=1)
+    started = []
+
+    async def handler(event, data):
+        started.append(data["event_chat"].id)
+        await asyncio.sleep(0.01)
+        return data["event_chat"].id
+
+    async def scenario():
+        return await asyncio.gather(middleware(handler, None, context(1)), middleware(handler, None, context(2)))
+
+    assert asyncio.run(scenario()) == [1, 2]
+    assert middleware.get_metrics()["overflow"] == 1
+    assert middleware.get_metrics()["active_chats"] == 0
+
+def test_stuck_update_does_not_block_chat_forever():
+    middleware = ChatLockMiddleware(timeout=0.01)
+
+    async def handler(event, data):
+        await asyncio.sleep(event)
+        return event
+
+    async def scenario():
+        return await asyncio.gather(middleware(handler, 0.1, context(1)), middleware(handler, 0, context(1)))
+
+    assert asyncio.run(scenario()) == [0.1, 0]
+    assert middleware.get_metrics()["timeouts"] == 1
+
+def test_background_job_shares_chat_queue_with_updates():
+    """Ответ на голосовое (задача voice_pool) и текстовое обновление одного чата не теряют запись истории."""
+    middleware = ChatLockMiddleware()
+    state = {"history": []}
+
+    async def reply(text):
+        history = list(state["history"])
+        await asyncio.sleep(0.01)
+        state["history"] = history + [text]
+
+    async def voice_job():
+        async with middleware.hold((1, 1)):
+            await reply("voice")
+
+    async def text_handler(event, data):
+        await reply(event)
+
+    async def scenario():
+        await asyncio.gather(voice_job(), middleware(text_handler, "text", context(1)))
+
+    asyncio.run(scenario())
+    assert sorted(state["history"]) == ["text", "voice"]
+    assert middleware.get_metrics()["waited"] == 1
+    assert middleware.get_metrics()["active_chats"] == 0
+
+def test_token_bucket_refills_over_window():
+    limiter = TokenBucketLimiter({"tts": parse_limit("3/300"), "llm": None})
+    assert [limiter.hit("tts", 1, now=0) for _ in range(3)] == [0, 0, 0]
+    assert limiter.hit("tts", 1, now=1) == pytest.approx(99)
+    # Другой пользователь и класс без лимита не затронуты
+    assert limiter.hit("tts", 2, now=1) == 0
+    assert limiter.hit("llm", 1, now=1) == 0
+    assert limiter.hit("tts", 1, now=100) == 0
+    assert limiter.get_metrics()["classes"]["tts"] == {"allowed": 5, "throttled": 1}
+
+def test_token_bucket_evicts_least_recent_users():
+    limiter = TokenBucketLimiter({"llm": (1, 60)}, max_entries=2)
+    for user_id in (1, 2, 3):
+        limiter.hit("llm", user_id, now=0)
+    assert limiter.get_metrics()["buckets"] == 2
+    # Пользователь 1 вытеснен и получает новую корзину, 3 остается ограничен
+    assert limiter.hit("llm", 1, now=1) == 0
+    assert limiter.hit("llm", 3, now=1) > 0
+
+def test_throttled_request_skips_handler_with_single_warning():
+    class FakeMessage:
+        def __init__(self):
+            self.replies = []
+
+        async def answer(self, text):
+            self.replies.append(text)
+
+    middleware = ThrottlingMiddleware("stt", limiter=TokenBucketLimiter({"stt": (1, 60)}))
+    calls = []
+
+    async def handler(event, data):
+        calls.append(event)
+
+    async def scenario():
+        for message in messages:
+            await middleware(handler, message, context(1))
+
+    messages = [FakeMessage() for _ in range(3)]
+    asyncio.run(scenario())
+    assert calls == messages[:1]
+    assert [len(message.replies) for message in messages] == [0, 1, 0]
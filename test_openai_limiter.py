@@ -0,0 +1,131 @@
+"""
+Тесты адаптивного лимитера и повторов для вызовов OpenAI.
+"""
+
+import asyncio
+
+from services import openai_limiter
+from services.openai_limiter import AdaptiveLimiter, call_openai, compute_backoff, get_retry_after
+
+class FakeResponse:
+    def __init__(self, headers):
+        self.headers = headers
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = FakeResponse(headers)
+
+class FakeBadRequestError(Exception):
+    status_code = 400
+
+def test_limiter_aimd():
+    """Лимит растет на успехах и снижается вдвое при перегрузке."""
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=8, decrease_cooldown=0)
+        for _ in range(8):
+            await limiter.acquire()
+            await limiter.release("success")
+        grown = limiter.limit
+        await limiter.acquire()
+        await limiter.release("overload")
+        return grown, limiter.limit
+
+    grown, shrunk = asyncio.run(scenario())
+    assert grown > 4
+    assert abs(shrunk - grown / 2) < 1e-9
+
+def test_limiter_bounds_concurrency():
+    """Одновременно выполняется не больше запросов, чем разрешает лимит."""
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=2, min_limit=1, max_limit=2)
+        active = 0
+        peak = 0
+
+        async def work():
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return True
+
+        await asyncio.gather(*(call_openai(work, limiter=limiter) for _ in range(6)))
+        return peak
+
+    assert asyncio.run(scenario()) == 2
+
+def test_call_openai_retries_and_honors_retry_after(monkeypatch):
+    """429 повторяется с задержкой из Retry-After, 400 не повторяется."""
+    delays = []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(openai_limiter.asyncio, "sleep", fake_sleep)
+
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=2, decrease_cooldown=0)
+        calls = {"count": 0}
+
+        async def flaky():
+            calls["count"] += 1
+            if calls["count"] < 3:
+                raise FakeRateLimitError(retry_after=2)
+            return "ok"
+
+        result = await call_openai(flaky, limiter=limiter, max_retries=3)
+
+        async def bad_request():
+            raise FakeBadRequestError()
+
+        try:
+            await call_openai(bad_request, limiter=limiter, max_retries=3)
+            raised = False
+        except FakeBadRequestError:
+            raised = True
+        return result, calls["count"], raised, limiter.stats
+
+    result, count, raised, stats = asyncio.run(scenario())
+    assert result == "ok"
+    assert count == 3
+    assert raised
+    assert stats["retries"] == 2
+    assert len(delays) == 2 and all(d >= 2 for d in delays)
+
+def test_backoff_helpers():
+    """Retry-After разбирается из заголовков, джиттер не превышает предел."""
+    assert get_retry_after(FakeRateLimitError(retry_after=5)) == 5.0
+    assert get_retry_after(FakeBadRequestError()) is None
+    for attempt in range(6):
+        assert 0 <= compute_backoff(attempt) <= openai_limiter.OPENAI_RETRY_MAX_DELAY
+
+def test_cancelled_call_returns_slot():
+    """Отмененный вызов освобождает слот и не меняет лимит."""
+    async def scenario():
+        limiter = AdaptiveLimiter(initial=1, min_limit=1, max_limit=4)
+
+        async def slow():
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(call_openai(slow, limiter=limiter))
+        await asyncio.sleep(0.01)
+        in_flight = limiter.in_flight
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        limit = limiter.limit
+        # Слот снова доступен: следующий вызов не зависает
+        result = await asyncio.wait_for(call_openai(asyncio.sleep, 0, result="ok", limiter=limiter), 1)
+        return in_flight, limiter.in_flight, limit, result
+
+    in_flight, after, limit, result = asyncio.run(scenario())
+    assert in_flight == 1
+    assert after == 0
+    assert result == "ok"
+    assert limit == 1
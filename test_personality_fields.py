@@ -0,0 +1,24 @@
+"""
+Тесты вычисления структурированных полей типа личности для профиля.
+"""
+
+from questions import derive_personality_fields
+
+def test_derive_personality_fields_from_vasini_answers():
+    """Основной и дополнительный типы и распределение ответов берутся из опроса."""
+    answers = {"name": "Тест", "timezone": "UTC+3"}
+    answers.update({f"vasini_{i}": "B" for i in range(10)})
+    answers.update({f"vasini_{i}": "D" for i in range(10, 18)})
+    answers.update({f"vasini_{i}": "A" for i in range(18, 20)})
+
+    fields = derive_personality_fields(answers)
+    assert fields["personality_type"] == "Эмоциональный"
+    assert fields["secondary_type"] == "Творческий"
+    assert fields["type_counts"] == {"A": 2, "B": 10, "C": 0, "D": 8}
+
+def test_derive_personality_fields_without_answers():
+    """Без ответов используется тип по умолчанию."""
+    fields = derive_personality_fields({})
+    assert fields["personality_type"] == "Интеллектуальный"
+    assert fields["secondary_type"] is None
+    assert sum(fields["type_counts"].values()) == 0
@@ -0,0 +1,83 @@
+"""
+Тесты индекса и диспетчера напоминаний.
+"""
+
+import asyncio
+from datetime import datetime
+
+from services.reminder_dispatcher import ReminderIndex, ReminderDispatcher
+
+# 2026-10-19 - понедельник
+MONDAY_20 = datetime(2026, 10, 19, 20, 0, 30)
+
+def test_index_slots_and_updates():
+    index = ReminderIndex()
+    index.set_user(1, "20:00", ["mon", "wed"])
+    index.set_user(2, "20:00", ["mon"])
+    index.set_user(3, "8:00", ["mon"])
+
+    assert index.due(MONDAY_20) == {1, 2}
+    assert index.due(MONDAY_20.replace(hour=8)) == {3}
+
+    index.set_user(1, "21:00", ["mon"])
+    index.remove_user(2)
+    assert index.due(MONDAY_20) == set()
+    assert index.due(MONDAY_20.replace(hour=21)) == {1}
+    assert len(index) == 2
+
+    index.rebuild({5: {"time": "20:00", "days": ["mon"], "active": True}, 6: {"time": "20:00", "active": False}})
+    assert index.due(MONDAY_20) == {5} and len(index) == 1
+
+def test_dispatcher_batches_and_catches_up():
+    """Одна пачка на слот, пропущенные минуты досылаются, повторная минута не дублируется."""
+    async def scenario():
+        index = ReminderIndex()
+        index.set_user(1, "20:00", ["mon"])
+        index.set_user(2, "20:00", ["mon"])
+        index.set_user(3, "20:01", ["mon"])
+        index.set_user(4, "20:02", ["mon"])
+        batches = []
+
+        async def deliver(user_ids):
+            batches.append(user_ids)
+
+        dispatcher = ReminderDispatcher(index)
+        dispatcher.deliver = deliver
+        await dispatcher.tick(MONDAY_20)
+        await dispatcher.tick(MONDAY_20)
+        await dispatcher.tick(MONDAY_20.replace(minute=2))
+        await dispatcher.shutdown()
+        return batches, dispatcher.get_metrics()
+
+    batches, metrics = asyncio.run(scenario())
+    assert batches == [[1, 2], [3], [4]]
+    assert metrics["due"] == 4 and metrics["max_batch"] == 2
+
+def test_pull_mode_retries_minute_after_claim_error():
+    """В режиме pull минута, которую не удалось забрать, повторяется при следующем срабатывании."""
+    async def scenario():
+        calls = []
+
+        async def claim(moment):
+            calls.append(moment.minute)
+            if len(calls) == 2:
+                raise ConnectionError("database is unavailable")
+            return [moment.minute + 100]
+
+        batches = []
+
+        async def deliver(user_ids):
+            batches.append(user_ids)
+
+        dispatcher = ReminderDispatcher(ReminderIndex(), claim=claim)
+        dispatcher.deliver = deliver
+        await dispatcher.tick(MONDAY_20)
+        await dispatcher.tick(MONDAY_20.replace(minute=1))
+        await dispatcher.tick(MONDAY_20.replace(minute=2))
+        await dispatcher.shutdown()
+        return calls, batches, dispatcher.get_metrics()
+
+    calls, batches, metrics = asyncio.run(scenario())
+    assert calls == [0, 1, 1, 2]
+    assert batches == [[100], [101], [102]]
+    assert metrics["claim_errors"] == 1 and metrics["mode"] == "pull"
@@ -0,0 +1,84 @@
+"""
+Тесты хранилища настроек напоминаний.
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from services.reminder_store import SQLiteReminderStore, SupabaseReminderStore
+
+def test_sqlite_store_roundtrip_across_pages(tmp_path):
+    """Настройки переживают перезапуск и загружаются постранично без потерь."""
+    path = str(tmp_path / "reminders.db")
+
+    async def scenario():
+        store = SQLiteReminderStore(path)
+        for user_id in range(1, 8):
+            await store.save(user_id, {"time": "20:00", "days": ["mon"], "active": True})
+        await store.save(3, {"time": "08:30", "days": ["tue", "sat"], "active": False})
+        store.close()
+        return await SQLiteReminderStore(path).load_all(page_size=3)
+
+    reminders = asyncio.run(scenario())
+    assert sorted(reminders) == list(range(1, 8))
+    assert reminders[3] == {"time": "08:30", "days": ["tue", "sat"], "active": False}
+    assert reminders[7] == {"time": "20:00", "days": ["mon"], "active": True}
+
+def test_supabase_store_keyset_paging():
+    class FakeDB:
+        rows = [
+            {"user_id": uid, "reminder_time": "20:00:00", "reminder_days": ["mon"], "is_active": True}
+            for uid in (5, 9, 12, 40, 41)
+        ]
+        calls = []
+
+        @classmethod
+        async def list_reminders_page(cls, reminder_type, after_user_id, limit):
+            cls.calls.append(after_user_id)
+            return [row for row in cls.rows if row["user_id"] > after_user_id][:limit]
+
+    reminders = asyncio.run(SupabaseReminderStore(FakeDB).load_all(page_size=2))
+    assert sorted(reminders) == [5, 9, 12, 40, 41]
+    assert reminders[9]["time"] == "20:00"
+    assert FakeDB.calls == [0, 9, 40]
+
+def test_sqlite_claim_due_is_exclusive(tmp_path):
+    """Напоминание забирается один раз даже при двух репликах на одной базе."""
+    path = str(tmp_path / "reminders.db")
+
+    async def scenario():
+        first, second = SQLiteReminderStore(path), SQLiteReminderStore(path)
+        await first.save(1, {"time": "20:00", "days": ["mon"], "active": True, "timezone": "Europe/Moscow"})
+        await first.save(2, {"time": "19:00", "days": ["mon"], "active": True, "timezone": "Europe/Berlin"})
+        await first.save(3, {"time": "20:00", "days": ["tue"], "active": True, "timezone": "Europe/Moscow"})
+        await first.save(4, {"time": "20:00", "days": ["mon"], "active": False, "timezone": "Europe/Moscow"})
+        # Понедельник 17:00 UTC: 20:00 в Москве и 19:00 в Берлине
+        moment = datetime(2026, 10, 19, 17, 0)
+        claimed = await first.claim_due(moment)
+        again = await second.claim_due(moment)
+        # Изменение настроек не сбрасывает отметку об отправке
+        await second.save(1, {"time": "20:00", "days": ["mon", "tue"], "active": True, "timezone": "Europe/Moscow"})
+        after_update = await first.claim_due(moment)
+        next_week = await second.claim_due(moment + timedelta(days=7))
+        return claimed, again, after_update, next_week
+
+    claimed, again, after_update, next_week = asyncio.run(scenario())
+    assert sorted(claimed) == [1, 2]
+    assert again == [] and after_update == []
+    # Через неделю Берлин уже перешел на зимнее время: 17:00 UTC - это 18:00
+    assert next_week == [1]
+
+def test_sqlite_claim_due_once_per_local_day(tmp_path):
+    """При переходе на зимнее время местная минута повторяется, но напоминание уходит один раз."""
+    path = str(tmp_path / "reminders.db")
+
+    async def scenario():
+        store = SQLiteReminderStore(path)
+        await store.save(1, {"time": "02:30", "days": ["sun"], "active": True, "timezone": "Europe/Berlin"})
+        # 25 октября 2026 в Берлине 02:30 наступает дважды: в 00:30 и в 01:30 UTC
+        first = await store.claim_due(datetime(2026, 10, 25, 0, 30))
+        repeated = await store.claim_due(datetime(2026, 10, 25, 1, 30))
+        next_week = await store.claim_due(datetime(2026, 11, 1, 1, 30))
+        return first, repeated, next_week
+
+    assert asyncio.run(scenario()) == ([1], [], [1])
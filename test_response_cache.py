@@ -0,0 +1,59 @@
+"""
+Тесты семантического кэша ответов.
+"""
+
+from services.response_cache import SemanticResponseCache, embed_text, cosine_similarity
+
+def test_similar_questions_hit_cache():
+    """Перефразированный вопрос получает сохраненный ответ, другой вопрос - нет."""
+    cache = SemanticResponseCache(threshold=0.7, max_entries=10, ttl=3600)
+    cache.store("Эмоциональный", "default", "Как справиться с тревогой перед сном?", "Ответ про тревогу", tokens=120)
+
+    assert cache.lookup("Эмоциональный", "default", "как справиться с тревогой перед сном") == "Ответ про тревогу"
+    assert cache.lookup("Эмоциональный", "default", "Посоветуй книгу по программированию") is None
+    # Ответы не пересекаются между типами личности
+    assert cache.lookup("Практический", "default", "Как справиться с тревогой перед сном?") is None
+
+    metrics = cache.get_metrics()
+    assert metrics["hits"] == 1
+    assert metrics["misses"] == 2
+    assert metrics["saved_tokens"] == 120
+
+def test_cache_is_bounded_and_expires():
+    """Старые записи вытесняются по LRU и по TTL."""
+    cache = SemanticResponseCache(threshold=0.9, max_entries=2, ttl=3600)
+    for i, topic in enumerate(["работа и карьера", "отношения в семье", "здоровый сон"]):
+        cache.store("Интеллектуальный", "default", f"Вопрос про {topic}", f"Ответ {i}")
+    assert cache.get_metrics()["entries"] == 2
+    assert cache.lookup("Интеллектуальный", "default", "Вопрос про работа и карьера") is None
+
+    cache.ttl = -1
+    assert cache.lookup("Интеллектуальный", "default", "Вопрос про здоровый сон") is None
+    assert cache.get_metrics()["entries"] == 0
+
+def test_embedding_is_normalized():
+    """Вектор нормирован, сходство текста с самим собой равно 1."""
+    vector = embed_text("Привет, как дела?")
+    assert abs(cosine_similarity(vector, vector) - 1.0) < 1e-9
+
+def test_max_entries_is_global():
+    """Предел записей общий для всех типов личности и режимов."""
+    cache = SemanticResponseCache(threshold=0.9, max_entries=2, ttl=3600)
+    cache.store("Эмоциональный", "default", "Вопрос про работа и карьера", "Ответ 1")
+    cache.store("Практический", "default", "Вопрос про отношения в семье", "Ответ 2")
+    # Обращение продлевает жизнь первой записи, вытесняется вторая
+    assert cache.lookup("Эмоциональный", "default", "Вопрос про работа и карьера") == "Ответ 1"
+    cache.store("Интеллектуальный", "voice", "Вопрос про здоровый сон", "Ответ 3")
+    assert cache.get_metrics()["entries"] == 2
+    assert cache.lookup("Практический", "default", "Вопрос про отношения в семье") is None
+    assert cache.lookup("Эмоциональный", "default", "Вопрос про работа и карьера") == "Ответ 1"
+
+def test_negated_question_misses_cache():
+    """Вопрос с отрицанием не получает ответ на утвердительный вопрос."""
+    cache = SemanticResponseCache(threshold=0.7, max_entries=10, ttl=3600)
+    cache.store("Эмоциональный", "default", "Мне нравится моя работа, что делать?", "Ответ про радость")
+    cache.store("Эмоциональный", "default", "Я не могу уснуть по ночам", "Ответ про бессонницу")
+
+    assert cache.lookup("Эмоциональный", "default", "Мне не нравится моя работа, что делать?") is None
+    assert cache.lookup("Эмоциональный", "default", "Я могу уснуть по ночам") is None
+    assert cache.lookup("Эмоциональный", "default", "мне нравится моя работа что делать") == "Ответ про радость"
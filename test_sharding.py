@@ -0,0 +1,83 @@
+"""
+Тесты режима нескольких рабочих процессов.
+"""
+
+import os
+import json
+import queue
+import asyncio
+
+import profile_storage
+from services.sharding import update_user_id, shard_for, consume_updates, Supervisor
+
+def message_update(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "from": {"id": user_id}, "chat": {"id": user_id}, "text": text}
+    }
+
+def report_environment(index, count, update_queue, health_queue):
+    from services.coordination import INSTANCE_MODE
+    health_queue.put({"worker": index, "reminder_mode": os.environ.get("REMINDER_MODE"), "instance_mode": INSTANCE_MODE})
+
+def test_workers_always_pull_reminders(monkeypatch):
+    """Индекс в памяти процесса 0 не видел бы изменений других процессов."""
+    monkeypatch.setenv("REMINDER_MODE", "memory")
+    monkeypatch.setenv("INSTANCE_MODE", "single")
+
+    async def scenario():
+        supervisor = Supervisor(report_environment, workers=2, health_interval=60)
+        supervisor.start()
+        reports = [supervisor.health_queue.get(timeout=30) for _ in range(2)]
+        await supervisor.stop(timeout=30)
+        return reports
+
+    reports = asyncio.run(scenario())
+    assert sorted(report["worker"] for report in reports) == [0, 1]
+    assert all(report["reminder_mode"] == "pull" for report in reports)
+    # Рассылку в рабочих процессах разрешают выборы лидера, а не режим single
+    assert all(report["instance_mode"] == "multi" for report in reports)
+
+def test_updates_are_sharded_by_user():
+    callback = {"update_id": 5, "callback_query": {"id": "1", "from": {"id": 42}, "data": "reminder_on"}}
+    assert update_user_id(callback) == 42
+    assert update_user_id(message_update(1, 7, "hi")) == 7
+    assert update_user_id({"update_id": 9}) is None
+    assert shard_for(42, 4) == shard_for(42, 4) == 2
+    assert shard_for(None, 4) == 0
+
+def test_worker_keeps_per_user_order():
+    """Обновления одного пользователя выполняются по порядку, разных - параллельно."""
+    updates = queue.Queue()
+    for update_id, (user_id, delay) in enumerate([(1, 0.05), (1, 0.0), (2, 0.0), (1, 0.0)]):
+        update = message_update(update_id, user_id, str(delay))
+        updates.put(update)
+    updates.put(None)
+    log = []
+
+    async def handle(update):
+        await asyncio.sleep(float(update["message"]["text"]))
+        log.append(update["update_id"])
+
+    health = queue.Queue()
+    asyncio.run(consume_updates(updates, handle, worker=0, health_queue=health, health_interval=60))
+
+    assert [u for u in log if u != 2] == [0, 1, 3]
+    # Пользователь 2 не ждет медленное обновление пользователя 1
+    assert log.index(2) < log.index(0)
+    reports = []
+    while not health.empty():
+        reports.append(health.get())
+    assert reports[-1]["processed"] == 4 and reports[-1]["in_flight"] == 0
+
+def test_worker_saves_only_own_profiles(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open(profile_storage.LOCAL_PROFILES_FILE, "w", encoding="utf-8") as f:
+        json.dump({"1": {"name": "из файла"}, "2": {"name": "старый"}}, f)
+    # Процесс владеет четными пользователями, профиль 1 в его памяти устарел
+    monkeypatch.setattr(profile_storage, "owns_profile", lambda user_id: user_id % 2 == 0)
+    monkeypatch.setattr(profile_storage, "user_profiles", {1: {"name": "устаревший"}, 2: {"name": "новый"}})
+
+    assert asyncio.run(profile_storage.save_profiles_to_file())
+    with open(profile_storage.LOCAL_PROFILES_FILE, encoding="utf-8") as f:
+        assert json.load(f) == {"1": {"name": "из файла"}, "2": {"name": "новый"}}
@@ -0,0 +1,52 @@
+"""
+Тесты выбора движка распознавания речи.
+"""
+
+import asyncio
+
+import pytest
+
+from services import stt_backends
+
+class FakeBackend(stt_backends.STTBackend):
+    def __init__(self, name, result=None, error=None, available=True):
+        self.name = name
+        self.result = result
+        self.error = error
+        self.available = available
+        self.calls = 0
+
+    def is_available(self):
+        return self.available
+
+    async def transcribe(self, audio, language):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.result
+
+def test_fallback_to_next_backend(monkeypatch):
+    """При ошибке первого движка текст возвращает следующий, недоступные пропускаются."""
+    failing = FakeBackend("a", error=RuntimeError("quota"))
+    missing = FakeBackend("b", result="never", available=False)
+    working = FakeBackend("c", result="привет")
+    monkeypatch.setattr(stt_backends, "BACKENDS", {"a": failing, "b": missing, "c": working})
+    monkeypatch.setattr(stt_backends, "STT_BACKENDS", ["a", "b", "unknown", "c"])
+
+    text, version = asyncio.run(stt_backends.transcribe_with_fallback(b"ogg", "ru"))
+
+    assert (text, version) == ("привет", "c")
+    assert failing.calls == 1 and missing.calls == 0 and working.calls == 1
+
+def test_no_backend_succeeds(monkeypatch):
+    monkeypatch.setattr(stt_backends, "BACKENDS", {"a": FakeBackend("a", result=None)})
+    monkeypatch.setattr(stt_backends, "STT_BACKENDS", ["a"])
+
+    assert asyncio.run(stt_backends.transcribe_with_fallback(b"ogg")) == (None, None)
+
+def test_backend_without_transcribe_cannot_be_created():
+    class Incomplete(stt_backends.STTBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
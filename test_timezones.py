@@ -0,0 +1,52 @@
+"""
+Тесты часовых поясов напоминаний.
+"""
+
+from datetime import datetime
+
+from services.timezones import parse_timezone, next_offset_change
+from services.reminder_dispatcher import ReminderIndex
+
+def test_parse_timezone_answers():
+    assert parse_timezone("UTC+3") == "Etc/GMT-3"
+    assert parse_timezone("gmt -5") == "Etc/GMT+5"
+    assert parse_timezone("МСК+2") == "Etc/GMT-5"
+    assert parse_timezone("GMT+5:30") == "Asia/Kolkata"
+    assert parse_timezone("Europe/Berlin") == "Europe/Berlin"
+    assert parse_timezone("Новосибирск") == "Asia/Novosibirsk"
+    assert parse_timezone("не знаю") is None
+
+def test_parse_timezone_requires_offset_sign():
+    # Без знака смещение не угадываем: "GMT12" не должно стать UTC+2
+    assert parse_timezone("GMT12") is None
+    assert parse_timezone("UTC10") is None
+    assert parse_timezone("UTC 10") is None
+    assert parse_timezone("a5") is None
+    # Знак минус U+2212
+    assert parse_timezone("UTC\u22123") == "Etc/GMT+3"
+
+def test_next_offset_change_finds_dst_end():
+    # В 2026 году Европа переходит на зимнее время 25 октября в 01:00 UTC
+    assert next_offset_change("Europe/Berlin", datetime(2026, 10, 19)) == datetime(2026, 10, 25, 1, 0)
+
+def test_index_buckets_local_time_in_utc():
+    index = ReminderIndex()
+    # 20:00 по Москве - 17:00 UTC; 01:00 понедельника по Москве - 22:00 воскресенья UTC
+    index.set_user(1, "20:00", ["mon"], "Europe/Moscow", now=datetime(2026, 10, 19))
+    index.set_user(2, "01:00", ["mon"], "Europe/Moscow", now=datetime(2026, 10, 19))
+    assert index.due(datetime(2026, 10, 19, 17, 0)) == {1}
+    assert index.due(datetime(2026, 10, 18, 22, 0)) == {2}
+
+def test_refresh_rebuckets_zone_at_dst_transition():
+    index = ReminderIndex()
+    index.set_user(1, "09:00", ["mon"], "Europe/Berlin", now=datetime(2026, 10, 19))
+    index.set_user(2, "09:00", ["mon"], "Europe/Moscow", now=datetime(2026, 10, 19))
+    # Летнее время: 09:00 в Берлине - 07:00 UTC
+    assert index.due(datetime(2026, 10, 19, 7, 0)) == {1}
+
+    assert index.refresh(datetime(2026, 10, 24, 12, 0)) == 0
+    assert index.refresh(datetime(2026, 10, 25, 1, 0)) == 1
+    # Зимнее время: 09:00 в Берлине - 08:00 UTC, Москва не изменилась
+    assert index.due(datetime(2026, 10, 26, 7, 0)) == set()
+    assert index.due(datetime(2026, 10, 26, 8, 0)) == {1}
+    assert index.due(datetime(2026, 10, 26, 6, 0)) == {2}
@@ -0,0 +1,33 @@
+"""
+Тесты кэша расшифровок голосовых сообщений.
+"""
+
+from services.transcript_cache import TranscriptCache
+
+def test_lookup_respects_language_and_model_version(tmp_path):
+    cache = TranscriptCache(str(tmp_path / "cache.db"), max_entries=10)
+    cache.store("AgADxyz", "ru", "openai:whisper-1", "привет")
+
+    assert cache.lookup("AgADxyz", "ru") == "привет"
+    assert cache.lookup("AgADxyz", "en") is None
+    assert cache.lookup("AgADxyz", "ru", ["local:faster-whisper-small-int8"]) is None
+    assert cache.lookup("AgADxyz", "ru", ["local:faster-whisper-small-int8", "openai:whisper-1"]) == "привет"
+    # Запись без речи не зависит от модели
+    cache.store("AgADsilent", "ru", "", "")
+    assert cache.lookup("AgADsilent", "ru", ["openai:whisper-1"]) == ""
+
+def test_bounded_and_persistent(tmp_path):
+    """Вытесняется давно не использованная запись, данные переживают перезапуск."""
+    path = str(tmp_path / "cache.db")
+    cache = TranscriptCache(path, max_entries=2)
+    cache.store("a", "ru", "v", "первое")
+    cache.store("b", "ru", "v", "второе")
+    assert cache.lookup("a", "ru") == "первое"
+    cache.store("c", "ru", "v", "третье")
+    cache.close()
+
+    reopened = TranscriptCache(path, max_entries=2)
+    assert reopened.lookup("b", "ru") is None
+    assert reopened.lookup("a", "ru") == "первое"
+    assert reopened.lookup("c", "ru") == "третье"
+    assert reopened.get_metrics()["entries"] == 2
@@ -0,0 +1,93 @@
+"""
+Тесты пула обработки голосовых сообщений.
+"""
+
+import asyncio
+
+from services.voice_queue import KeyedWorkerPool
+
+def test_per_user_order_and_fairness():
+    """Сообщения пользователя идут по порядку, другие пользователи не ждут всю его очередь."""
+    async def scenario():
+        pool = KeyedWorkerPool(workers=1, max_pending=10, max_pending_per_key=5)
+        order = []
+
+        def job(key, n):
+            async def run():
+                order.append((key, n))
+                await asyncio.sleep(0)
+            return run
+
+        for n in range(3):
+            assert pool.submit("flood", job("flood", n))
+        assert pool.submit("other", job("other", 0))
+        await pool.shutdown(timeout=1)
+        return order, pool.get_metrics()
+
+    order, metrics = asyncio.run(scenario())
+    flood = [n for key, n in order if key == "flood"]
+    assert flood == [0, 1, 2]
+    assert order.index(("other", 0)) < order.index(("flood", 2))
+    assert metrics["completed"] == 4 and metrics["pending"] == 0
+
+def test_rejects_when_saturated():
+    """При переполнении очереди пользователя или пула задачи отклоняются."""
+    async def scenario():
+        pool = KeyedWorkerPool(workers=1, max_pending=3, max_pending_per_key=2)
+        gate = asyncio.Event()
+
+        async def blocked():
+            await gate.wait()
+
+        results = [pool.submit("u1", blocked) for _ in range(3)]
+        results.append(pool.submit("u2", blocked))
+        results.append(pool.submit("u3", blocked))
+        gate.set()
+        await pool.shutdown(timeout=1)
+        return results, pool.get_metrics()
+
+    results, metrics = asyncio.run(scenario())
+    assert results == [True, True, False, True, False]
+    assert metrics["rejected"] == 2
+    assert metrics["completed"] == 3
+
+def test_failed_job_does_not_stop_worker():
+    """Ошибка в задаче учитывается, а воркер продолжает работу."""
+    async def scenario():
+        pool = KeyedWorkerPool(workers=1)
+        done = []
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        async def ok():
+            done.append(True)
+
+        pool.submit(1, broken)
+        pool.submit(1, ok)
+        await pool.shutdown(timeout=1)
+        return done, pool.get_metrics()
+
+    done, metrics = asyncio.run(scenario())
+    assert done == [True]
+    assert metrics["failed"] == 1 and metrics["completed"] == 1
+
+def test_queue_position_counts_running_job():
+    """Задача за уже выполняемой получает позицию 2, первая задача пользователя - 1."""
+    async def scenario():
+        pool = KeyedWorkerPool(workers=1, max_pending=10, max_pending_per_key=5)
+        gate = asyncio.Event()
+
+        async def blocked():
+            await gate.wait()
+
+        pool.submit("u1", blocked)
+        first = pool.queue_position("u1")
+        await asyncio.sleep(0.01)
+        pool.submit("u1", blocked)
+        second = pool.queue_position("u1")
+        gate.set()
+        await pool.shutdown(timeout=1)
+        return first, second
+
+    assert asyncio.run(scenario()) == (1, 2)
@@ -0,0 +1,19 @@
+"""
+Тесты настроек webhook.
+"""
+
+import re
+
+from services.webhook import webhook_url, webhook_secret
+
+def test_webhook_url_joins_base_and_path():
+    assert webhook_url("https://bot.example.com/", "/telegram/webhook") == "https://bot.example.com/telegram/webhook"
+    assert webhook_url("https://bot.example.com", "hook") == "https://bot.example.com/hook"
+
+def test_webhook_secret_is_stable_and_valid():
+    """Секрет без WEBHOOK_SECRET одинаков у всех экземпляров и подходит для Telegram."""
+    secret = webhook_secret("123:ABC", secret="")
+    assert secret == webhook_secret("123:ABC", secret="")
+    assert secret != webhook_secret("456:DEF", secret="")
+    assert re.fullmatch(r"[A-Za-z0-9_-]{1,256}", secret)
+    assert webhook_secret("123:ABC", secret="configured") == "configured"